@@ -1,16 +1,29 @@
+import os
+import sys
 import streamlit as st
 import pandas as pd
 import folium
-from folium.plugins import HeatMap
 from streamlit_folium import st_folium
 
+# Shared storage helpers live at the repository root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from safebristol.crime_store import read_table_cached
+from safebristol.crime_profile import profiled
+from safebristol.crime_cube import cached_cube
+from safebristol.tile_server import TileCache, TileRenderer, serve_in_background, tile_url
+
+SOURCE_PATH = "Data/Visualisatio/bristol_crime_with_socioeconomic_data.xlsx"
+CUBE_PATH = "Data/Visualisatio/crime_cube.npz"
+CUBE_DIMS = ['year', 'season', 'category', 'street_name', 'rent_range', 'population_level', 'deprivation_level']
+TILE_CACHE_DIR = "Data/Visualisatio/tile_cache"
+
 # -------------------------
 # Load and preprocess data
 # -------------------------
-@st.cache_data
+@profiled('heatmap: load_crime_data')
 def load_crime_data():
-    df = pd.read_excel("Data/Visualisatio/bristol_crime_with_socioeconomic_data.xlsx")
-    df.columns = df.columns.str.strip()
+    # Converted to Parquet on first load, so reruns skip the slow Excel reader
+    df = read_table_cached(SOURCE_PATH)
 
     # Rename if needed
     if "date" in df.columns:
@@ -50,82 +63,75 @@ def load_crime_data():
 
     return df.dropna(subset=['lat', 'lng'])
 
-@st.cache_data
-def get_heat_data(df, max_points=5000):
-    if len(df) > max_points:
-        return df.sample(max_points)[['lat', 'lng']].values.tolist()
-    else:
-        return df[['lat', 'lng']].values.tolist()
+@st.cache_resource
+@profiled('heatmap: load_crime_cube')
+def load_crime_cube():
+    # Aggregated once per source change; every widget change below only slices the cube
+    return cached_cube(CUBE_PATH, SOURCE_PATH, load_crime_data, CUBE_DIMS)
+
+@st.cache_resource
+def start_tile_server(_cube):
+    # One local tile endpoint per app process; tiles are rendered once and kept on disk
+    return serve_in_background(TileRenderer(_cube, TileCache(TILE_CACHE_DIR)))
 
-crime_df = load_crime_data()
+crime_cube = load_crime_cube()
+tile_server = start_tile_server(crime_cube)
+
+def dim_options(dim):
+    return ['All'] + crime_cube.options(dim) if dim in crime_cube.dims else ['All']
 
 # -------------------------
 # Sidebar Filters
 # -------------------------
 st.sidebar.title("🔍 Filter Crime Data")
 
-year_options = ['All'] + sorted(crime_df['year'].unique())
-selected_year = st.sidebar.selectbox("Select Year", year_options)
+selected_year = st.sidebar.selectbox("Select Year", dim_options('year'))
 
 season_options = ['All', 'Winter', 'Spring', 'Summer', 'Autumn']
 selected_season = st.sidebar.selectbox("Select Season", season_options)
 
-crime_types = ['All'] + sorted(crime_df['category'].dropna().unique())
-selected_crime = st.sidebar.selectbox("Select Crime Type", crime_types)
-
-street_names = ['All'] + sorted(crime_df['street_name'].dropna().unique())
-selected_street = st.sidebar.selectbox("Select Street Name", street_names)
-
-rent_ranges = ['All'] + sorted(crime_df['rent_range'].dropna().unique()) if 'rent_range' in crime_df else ['All']
-selected_rent = st.sidebar.selectbox("Select Rent Range", rent_ranges)
-
-population_levels = ['All'] + sorted(crime_df['population_level'].dropna().unique()) if 'population_level' in crime_df else ['All']
-selected_pop = st.sidebar.selectbox("Select Population Level", population_levels)
-
-deprivation_levels = ['All'] + sorted(crime_df['deprivation_level'].dropna().unique()) if 'deprivation_level' in crime_df else ['All']
-selected_dep = st.sidebar.selectbox("Select Deprivation Level", deprivation_levels)
+selected_crime = st.sidebar.selectbox("Select Crime Type", dim_options('category'))
+selected_street = st.sidebar.selectbox("Select Street Name", dim_options('street_name'))
+selected_rent = st.sidebar.selectbox("Select Rent Range", dim_options('rent_range'))
+selected_pop = st.sidebar.selectbox("Select Population Level", dim_options('population_level'))
+selected_dep = st.sidebar.selectbox("Select Deprivation Level", dim_options('deprivation_level'))
 
 # -------------------------
 # Apply Filters
 # -------------------------
-filtered_df = crime_df.copy()
-
-if selected_year != 'All':
-    filtered_df = filtered_df[filtered_df['year'] == selected_year]
-if selected_season != 'All':
-    filtered_df = filtered_df[filtered_df['season'] == selected_season]
-if selected_crime != 'All':
-    filtered_df = filtered_df[filtered_df['category'] == selected_crime]
-if selected_street != 'All':
-    filtered_df = filtered_df[filtered_df['street_name'] == selected_street]
-if selected_rent != 'All' and 'rent_range' in filtered_df:
-    filtered_df = filtered_df[filtered_df['rent_range'] == selected_rent]
-if selected_pop != 'All' and 'population_level' in filtered_df:
-    filtered_df = filtered_df[filtered_df['population_level'] == selected_pop]
-if selected_dep != 'All' and 'deprivation_level' in filtered_df:
-    filtered_df = filtered_df[filtered_df['deprivation_level'] == selected_dep]
+filters = {
+    'year': selected_year,
+    'season': selected_season,
+    'category': selected_crime,
+    'street_name': selected_street,
+    'rent_range': selected_rent,
+    'population_level': selected_pop,
+    'deprivation_level': selected_dep,
+}
+mask = crime_cube.mask(**{dim: value for dim, value in filters.items() if dim in crime_cube.dims})
 
 # -------------------------
 # Main UI
 # -------------------------
 st.title("🔴 Bristol Crime Heatmap")
-st.markdown(f"**Crimes Displayed**: {len(filtered_df)}")
-
-heat_data = get_heat_data(filtered_df)
+st.markdown(f"**Crimes Displayed**: {int(crime_cube.total(mask))}")
 
 # -------------------------
 # Show Heatmap
 # -------------------------
+# Heat tiles for the current filters come from the local tile server; panning and zooming
+# only fetch (cached) tiles and never rerun the app
 m = folium.Map(location=[51.4545, -2.5879], zoom_start=12, tiles="OpenStreetMap")
 
-if heat_data:
-    HeatMap(
-        heat_data,
-        radius=7,
-        blur=10,
-        gradient={0.2: 'orange', 0.5: 'red', 1: 'darkred'}
+if crime_cube.total(mask):
+    folium.TileLayer(
+        tiles=tile_url(tile_server, filters),
+        attr="SafeBristol crime heat",
+        name="Crime heat",
+        overlay=True,
+        opacity=0.8,
     ).add_to(m)
 else:
     st.warning("No crime data available for selected filters.")
 
-st_folium(m, width=800, height=600)
+st_folium(m, width=800, height=600, returned_objects=[])
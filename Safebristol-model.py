@@ -1,202 +1,246 @@
 # SafeBristol: AI-Powered Crime Prediction & Safety Advisory
 # All data is sourced from public APIs (UK Police, Met Office, TfL, user reports placeholder).
 
-import sys
-import time
-import datetime
-try:
-    import requests
-except ImportError:
-    import sys
-    import subprocess
-    print('requests not found. Installing...')
-    subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'requests'])
-    import requests
-try:
-    import pandas as pd
-except ImportError:
-    import sys
-    import subprocess
-    print('pandas not found. Installing...')
-    subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'pandas'])
-    import pandas as pd
-try:
-    import numpy as np
-except ImportError:
-    import sys
-    import subprocess
-    print('numpy not found. Installing...')
-    subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'numpy'])
-    import numpy as np
-try:
-    from sklearn.ensemble import RandomForestClassifier
-    from sklearn.model_selection import train_test_split
-    from sklearn.metrics import classification_report
-except ImportError:
-    import sys
-    import subprocess
-    print('scikit-learn not found. Installing...')
-    subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'scikit-learn'])
-    from sklearn.ensemble import RandomForestClassifier
-    from sklearn.model_selection import train_test_split
-    from sklearn.metrics import classification_report
-try:
-    import matplotlib.pyplot as plt
-except ImportError:
-    import sys
-    import subprocess
-    print('matplotlib not found. Installing...')
-    subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'matplotlib'])
-    import matplotlib.pyplot as plt
-try:
-    import seaborn as sns
-except ImportError:
-    import sys
-    import subprocess
-    print('seaborn not found. Installing...')
-    subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'seaborn'])
-    import seaborn as sns
+# Dependencies are declared in pyproject.toml: pip install -e '.[notebook]' (add xgboost for step 8)
+import pandas as pd
+import numpy as np
+import matplotlib.pyplot as plt
+
+# Every numbered step below is timed (wall, CPU, peak RSS, rows/s); the report is written to
+# pipeline_profile.json and each step is also appended to $SAFEBRISTOL_PROFILE when that is set.
+from safebristol.crime_profile import StageProfiler
+PROFILE_PATH = 'pipeline_profile.json'
+profiler = StageProfiler()
 
 # 1. Fetch Bristol Crime Data from UK Police API (2015-2025, polygon covers city)
-bristol_poly = '51.4645,-2.6200:51.4645,-2.5400:51.4300,-2.5400:51.4300,-2.6200'
-all_crimes = []
-start_year, start_month = 2015, 1
-end_year, end_month = 2025, 7
-api_url = 'https://data.police.uk/api/crimes-street/all-crime'
-for year in range(start_year, end_year + 1):
-    for month in range(1, 13):
-        if (year == start_year and month < start_month) or (year == end_year and month > end_month):
-            continue
-        date_str = f"{year}-{month:02d}"
-        params = {'poly': bristol_poly, 'date': date_str}
-        response = requests.get(api_url, params=params)
-        if response.status_code == 200:
-            crimes = response.json()
-            print(f"{date_str}: {len(crimes)} records fetched.")
-            all_crimes.extend(crimes)
-        elif response.status_code == 404:
-            continue
-        else:
-            print(f"{date_str}: Failed to fetch data. Status code: {response.status_code}")
-            print('Response:', response.text)
-        time.sleep(1)
-all_crimes = [c for c in all_crimes if c is not None]
-if all_crimes:
-    crimes_df = pd.DataFrame(all_crimes)
-    print(f"Total records from Jan 2015 to Jul 2025: {len(crimes_df)}")
+# Months are fetched concurrently and checkpointed under crime_checkpoints/. The manifest
+# there records what has been ingested, so a rerun only requests missing months plus the
+# trailing REFRESH_WINDOW months, which police.uk may still be revising.
+profiler.begin('1. Fetch')
+from safebristol.crime_ingest import BRISTOL_POLY, DEFAULT_REFRESH_WINDOW, fetch_months, fetch_region_months, month_range
+bristol_poly = BRISTOL_POLY
+# Larger areas (e.g. crime_ingest.GREATER_BRISTOL_POLY or AVON_SOMERSET_POLY) need TILED: the area is
+# split into a quadtree of sub-polygons small enough for police.uk, fetched and cached per tile/month
+TILED = False
+REFRESH_WINDOW = DEFAULT_REFRESH_WINDOW
+# Set STREAMING to process the history month by month instead (crime_pipeline): each month is
+# normalised, enriched with wards and weather and written to the crime store as it arrives, the
+# aggregate cube is built incrementally, and crimes_df is a bounded uniform sample for training.
+STREAMING = False
+if STREAMING:
+    import os
+    from safebristol.crime_pipeline import stream_crimes
+    from safebristol.ward_lookup import WARDS_MISSING, WARDS_PATH, WardIndex
+    from safebristol.ward_stats import WardStats
+    from safebristol.weather_store import WeatherStore
+    has_wards = os.path.exists(WARDS_PATH)
+    if not has_wards:
+        print(WARDS_MISSING)
+    crime_cube, crimes_df, stream_report = stream_crimes(
+        month_range('2015-01', '2025-07'), poly=bristol_poly, refresh_window=REFRESH_WINDOW, tiled=TILED,
+        weather_store=WeatherStore.load(), ward_index=WardIndex.from_geojson(WARDS_PATH) if has_wards else None,
+        ward_stats=WardStats.load() if has_wards else None)
+    failed_months = stream_report['failed']
+    if failed_months:
+        print(f"{len(failed_months)} months failed to fetch: {', '.join(sorted(failed_months))}")
+    print(f"Streamed {stream_report['records']} records from Jan 2015 to Jul 2025 "
+          f"({stream_report['months']} months); training sample of {len(crimes_df)} rows.")
 else:
-    crimes_df = pd.DataFrame()
-    print("No data fetched from Jan 2015 to Jul 2025.")
+    fetch = fetch_region_months if TILED else fetch_months
+    crimes_by_month, failed_months = fetch(month_range('2015-01', '2025-07'), poly=bristol_poly,
+                                           refresh_window=REFRESH_WINDOW)
+    all_crimes = [c for date_str in sorted(crimes_by_month) for c in crimes_by_month[date_str]]
+    if failed_months:
+        print(f"{len(failed_months)} months failed to fetch: {', '.join(sorted(failed_months))}")
+    all_crimes = [c for c in all_crimes if c is not None]
+    if all_crimes:
+        # Nested location/outcome dicts are flattened into typed columns in one pass
+        from safebristol.crime_features import normalise_crimes
+        crimes_df = normalise_crimes(all_crimes)
+        del all_crimes
+        print(f"Total records from Jan 2015 to Jul 2025: {len(crimes_df)}")
+    else:
+        crimes_df = pd.DataFrame()
+        print("No data fetched from Jan 2015 to Jul 2025.")
+profiler.end(rows=len(crimes_df))
 
 # 2. Clean and Preprocess API Data
+# Blank strings were already mapped to NaN by normalise_crimes
+profiler.begin('2. Clean')
 if not crimes_df.empty:
-    crimes_df = crimes_df.replace(r'^\s*$', np.nan, regex=True)
     crimes_df = crimes_df.dropna(how='all')
     print('After cleaning, shape:', crimes_df.shape)
     print(crimes_df.isnull().sum())
 else:
     print('crimes_df is empty, nothing to clean.')
+profiler.end(rows=len(crimes_df))
 
 # 3. Feature Engineering (time, location, category)
+# category_code, year, month, lat and lng are produced by normalise_crimes in step 1
+profiler.begin('3. Feature engineering')
 if not crimes_df.empty:
-    crimes_df['category_code'] = crimes_df['category'].astype('category').cat.codes
-    crimes_df['month'] = pd.to_datetime(crimes_df['month'], errors='coerce').dt.month.fillna(0).astype(int)
-    crimes_df['year'] = pd.to_datetime(crimes_df['month'], errors='coerce').dt.year.fillna(0).astype(int)
-    crimes_df['lat'] = crimes_df['location'].apply(lambda x: float(x['latitude']) if isinstance(x, dict) and x.get('latitude') else np.nan)
-    crimes_df['lng'] = crimes_df['location'].apply(lambda x: float(x['longitude']) if isinstance(x, dict) and x.get('longitude') else np.nan)
     crimes_df = crimes_df.dropna(subset=['lat', 'lng'])
+    # The street-level API does not return wards, so when ward boundaries are available locally
+    # every crime is assigned its ward (WARD_CODE/WARD_NAME, matching Crime_in_Bristol_by_Ward.csv)
+    # and gets that ward's official crime rate, rank and year-over-year change as features.
+    import os
+    from safebristol.ward_lookup import WARDS_MISSING, WARDS_PATH, WardIndex
+    from safebristol.ward_stats import WardStats
+    from safebristol.crime_pipeline import add_wards
+    if os.path.exists(WARDS_PATH):
+        # No-op for streamed crimes, which were assigned their wards month by month
+        crimes_df = add_wards(crimes_df, WardIndex.from_geojson(WARDS_PATH), WardStats.load())
+    elif not STREAMING:
+        print(WARDS_MISSING)
     print('After feature engineering, shape:', crimes_df.shape)
     crimes_df.head()
 else:
     print('crimes_df is empty, nothing to feature engineer.')
+profiler.end(rows=len(crimes_df))
 
-# 4. Integrate Weather Data (Met Office API placeholder)
-def fetch_weather_for_date(lat, lng, date, api_key='YOUR_API_KEY'):
-    return {'weather_condition': np.random.choice(['Clear', 'Rain', 'Cloudy', 'Fog']), 'temperature': np.random.normal(12, 4)}
+# 4. Integrate Weather Data (daily Bristol series in Data/bristol_weather_cleaned.xlsx)
+# Crimes are reported per month, so each crime gets its month's aggregates: mean temperature,
+# total precipitation and the dominant weather condition.
+profiler.begin('4. Weather')
+from safebristol.weather_store import WeatherStore, weather_condition
+from safebristol.crime_pipeline import add_weather
 if not crimes_df.empty:
-    crimes_df['weather_condition'] = [fetch_weather_for_date(row['lat'], row['lng'], f"{row['year']}-{row['month']:02d}")['weather_condition'] for idx, row in crimes_df.iterrows()]
-    crimes_df['temperature'] = [fetch_weather_for_date(row['lat'], row['lng'], f"{row['year']}-{row['month']:02d}")['temperature'] for idx, row in crimes_df.iterrows()]
+    weather_store = WeatherStore.load()
+    crimes_df = add_weather(crimes_df, weather_store,
+                            columns=['temperature', 'precipitation_sum', 'rainy_days', 'weather_code'])
     print('Weather data integrated.')
 else:
     print('crimes_df is empty, cannot integrate weather data.')
+profiler.end(rows=len(crimes_df))
+
+# 5-6. Enrichment: transport and user reports
+# The transport placeholder is called once per distinct (grid cell, year-month) key rather than
+# once per crime; results are cached in enrichment_cache.sqlite and joined back vectorised.
+profiler.begin('5-6. Enrichment')
+from safebristol.crime_enrich import TTLCache, enrich
 
 # 5. Integrate Transport Data (TfL API placeholder)
 def fetch_tfl_safety_index(lat, lng, date, app_key='YOUR_TFL_APP_KEY'):
     return np.random.uniform(0, 1)
-if not crimes_df.empty:
-    crimes_df['transport_safety_index'] = [fetch_tfl_safety_index(row['lat'], row['lng'], f"{row['year']}-{row['month']:02d}") for idx, row in crimes_df.iterrows()]
-    print('Transport safety data integrated.')
-else:
-    print('crimes_df is empty, cannot integrate transport data.')
 
-# 6. User-Submitted Safety Reports (Placeholder for API)
-def fetch_user_reports(lat, lng, date):
-    return np.random.poisson(1)
+# 6. User-Submitted Safety Reports
+# Reports are received by `safebristol serve reports` and rolled up per ~190 m cell and month
+# (safebristol.user_reports); each crime gets the number of reports in its cell that month.
+from safebristol.user_reports import ReportRollup
+
 if not crimes_df.empty:
-    crimes_df['user_reports'] = [fetch_user_reports(row['lat'], row['lng'], f"{row['year']}-{row['month']:02d}") for idx, row in crimes_df.iterrows()]
-    print('User report data integrated.')
+    enrichment_cache = TTLCache()
+    crimes_df = enrich(crimes_df, {
+        'transport_safety_index': fetch_tfl_safety_index,
+    }, cache=enrichment_cache)
+    enrichment_cache.close()
+    crimes_df['user_reports'] = ReportRollup.load().counts_for(crimes_df['lat'], crimes_df['lng'],
+                                                               crimes_df['year'], crimes_df['month'])
+    print('Transport safety and user report data integrated.')
 else:
-    print('crimes_df is empty, cannot integrate user report data.')
+    print('crimes_df is empty, cannot integrate transport or user report data.')
+profiler.end(rows=len(crimes_df))
 
 # 7. Machine Learning Model (Random Forest)
+profiler.begin('7. Random forest')
+from safebristol.crime_model import save_model
+from safebristol.crime_training import has_training_history, train_model, update_model
+# Saved models are refreshed with newly ingested months only; set FULL_RETRAIN to rebuild them from all history
+FULL_RETRAIN = False
 if not crimes_df.empty:
-    features = ['lat', 'lng', 'month', 'year', 'temperature', 'transport_safety_index', 'user_reports']
-    crimes_df['weather_code'] = crimes_df['weather_condition'].astype('category').cat.codes
+    features = ['lat', 'lng', 'month', 'year', 'temperature', 'precipitation_sum', 'rainy_days',
+                'transport_safety_index', 'user_reports']
+    if 'ward_rate' in crimes_df.columns:
+        features += ['ward_rate', 'ward_rank', 'ward_rate_change']
+    # weather_code is the month's dominant WMO code, which gets NaN outside the weather series
+    crimes_df['weather_code'] = crimes_df['weather_code'].fillna(-1)
     features.append('weather_code')
     target = 'category_code'
-    X = crimes_df[features]
-    y = crimes_df[target]
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-    rf = RandomForestClassifier(n_estimators=100, random_state=42)
-    rf.fit(X_train, y_train)
-    y_pred = rf.predict(X_test)
-    print(classification_report(y_test, y_pred))
+    # Saved with the model so scoring can report weather codes by their labels
+    observed_codes = np.unique(crimes_df['weather_code'])
+    weather_codes = {int(code): label for code, label in zip(observed_codes, weather_condition(observed_codes))}
+    if not FULL_RETRAIN and has_training_history('random_forest'):
+        # Extra trees for the months ingested since the saved model, promoted only if not worse
+        update_model(crimes_df, name='random_forest')
+    else:
+        # Trained on months before the holdout and scored on the most recent months (see crime_training)
+        rf, rf_report = train_model(crimes_df, features, target, kind='random_forest')
+        # Versioned artifact for crime_model.CrimeModel scoring
+        model_dir = save_model(rf, features, crimes_df['category'].cat.categories, name='random_forest',
+                               weather_codes=weather_codes, training_frame=crimes_df[features],
+                               metrics=rf_report['holdout'], extra={'classes': rf_report['classes'], 'training': rf_report})
+        print(f'Random Forest model saved to {model_dir}')
 else:
     print('Not enough data for model training.')
+profiler.end(rows=len(crimes_df))
 
-# 8. Advanced ML Model (XGBoost, optional)
+# 8. Advanced ML Model (XGBoost with the histogram tree method, optional)
+profiler.begin('8. XGBoost')
 try:
     import xgboost
-    from xgboost import XGBClassifier
-    if not crimes_df.empty:
-        xgb = XGBClassifier(use_label_encoder=False, eval_metric='mlogloss')
-        xgb.fit(X_train, y_train)
-        y_pred_xgb = xgb.predict(X_test)
-        print('XGBoost Model Performance:')
-        print(classification_report(y_test, y_pred_xgb))
 except ImportError:
-    import sys
-    import subprocess
-    print('XGBoost not found. Installing...')
-    subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'xgboost'])
-    import xgboost
-    from xgboost import XGBClassifier
-    if not crimes_df.empty:
-        xgb = XGBClassifier(use_label_encoder=False, eval_metric='mlogloss')
-        xgb.fit(X_train, y_train)
-        y_pred_xgb = xgb.predict(X_test)
-        print('XGBoost Model Performance:')
-        print(classification_report(y_test, y_pred_xgb))
+    xgboost = None
+if xgboost is None:
+    print("XGBoost not installed (pip install -e '.[xgboost]'); skipping step 8.")
+elif not crimes_df.empty and not FULL_RETRAIN and has_training_history('xgboost'):
+    # Continues boosting from the saved booster on the new months only
+    update_model(crimes_df, name='xgboost')
+elif not crimes_df.empty:
+    xgb, xgb_report = train_model(crimes_df, features, target, kind='xgboost')
+    save_model(xgb, features, crimes_df['category'].cat.categories, name='xgboost',
+               weather_codes=weather_codes, training_frame=crimes_df[features],
+               metrics=xgb_report['holdout'], extra={'classes': xgb_report['classes'], 'training': xgb_report})
+profiler.end(rows=len(crimes_df))
+
+# 8b. Next-month crime forecast per grid cell (counts per ~760 m cell and month, see crime_forecast)
+profiler.begin('8b. Forecast')
+from safebristol.crime_forecast import CellForecaster, CountTensor, forecast_next_month
+if not crimes_df.empty:
+    # Streamed runs only hold a sample of the crimes; the full counts are in the streamed cube
+    count_tensor = CountTensor.from_cube(crime_cube) if STREAMING else CountTensor.build(crimes_df)
+    try:
+        print(CellForecaster(weather=weather_store).backtest(count_tensor, months=3))
+        forecast = forecast_next_month(count_tensor, weather=weather_store)
+    except ValueError as exc:
+        # Too few months of history for the lagged features
+        print(f'Skipping the forecast: {exc}')
+    else:
+        print(f"Forecast for {forecast['month'].iloc[0]}: {forecast['expected'].sum():.0f} crimes; highest-risk cells:")
+        print(forecast.nlargest(10, 'expected')[['lat', 'lng', 'expected', 'risk']])
+profiler.end(rows=len(crimes_df))
 
 # 9. Visualize Crime Hotspots (Heatmap)
+# Kernel density by binned FFT convolution on a 50 m grid (crime_hotspots); surfaces are cached
+# per (category, period) under hotspot_cache/ and reused by the dashboards and as model features.
+profiler.begin('9. Hotspots')
+from safebristol.crime_hotspots import HOTSPOT_CACHE_DIR, HotspotEngine
 if not crimes_df.empty:
+    hotspots = HotspotEngine(crimes_df, cache_dir=HOTSPOT_CACHE_DIR)
+    hotspot_surface = hotspots.surface()
+    centre_lat, centre_lng = hotspot_surface.centres()
     plt.figure(figsize=(10, 6))
-    sns.kdeplot(x=crimes_df['lng'], y=crimes_df['lat'], cmap='Reds', fill=True, thresh=0.05)
+    plt.contourf(centre_lng, centre_lat, hotspot_surface.density, levels=hotspot_surface.levels(thresh=0.05), cmap='Reds')
+    plt.colorbar(label='Crimes per km²')
     plt.title('Bristol Crime Hotspots')
     plt.xlabel('Longitude')
     plt.ylabel('Latitude')
     plt.show()
 else:
     print('No geolocation data available for heatmap.')
+profiler.end(rows=len(crimes_df))
 
 # 10. Analysis by Wards and Streets in Bristol
+profiler.begin('10. Ward/street analysis')
 if not crimes_df.empty:
-    crimes_df['ward'] = crimes_df['location'].apply(lambda x: x.get('ward', None) if isinstance(x, dict) else None)
-    crimes_df['street_name'] = crimes_df['location'].apply(lambda x: x['street']['name'] if isinstance(x, dict) and x.get('street') and x['street'].get('name') else None)
-    ward_counts = crimes_df['ward'].value_counts(dropna=True)
+    # ward and street_name were extracted from `location` by normalise_crimes (ward assigned in step 3).
+    # Streamed runs read the rollups the store kept while writing; otherwise they are counted here once.
+    from safebristol.crime_rollups import CrimeRollups
+    from safebristol.crime_store import STORE_DIR
+    crime_rollups = CrimeRollups.load(STORE_DIR) if STREAMING else CrimeRollups.build(crimes_df)
+    ward_counts = crime_rollups.top('ward', 10)
+    street_counts = crime_rollups.top('street_name', 10)
     print('Top 10 Wards by Crime Count:')
     print(ward_counts.head(10))
-    street_counts = crimes_df['street_name'].value_counts(dropna=True)
     print('\nTop 10 Streets by Crime Count:')
     print(street_counts.head(10))
     plt.figure(figsize=(12, 6))
@@ -213,6 +257,29 @@ if not crimes_df.empty:
     plt.show()
 else:
     print('crimes_df is empty, cannot analyze by ward or street.')
+profiler.end(rows=len(crimes_df))
+
+# 10b. Safe-route risk weights (crimes per street segment of the OSM network in STREETS_PATH, see routing)
+# Each month's counts replace that month's previous ones, so reruns only change the months they refetched.
+profiler.begin('10b. Route risk')
+import os
+from safebristol.routing import ROUTING_DIR, STREETS_PATH, Router, update_risk
+if not crimes_df.empty and os.path.exists(STREETS_PATH):
+    if STREAMING:
+        # crimes_df is only a sample; every streamed crime is in the store
+        from safebristol.crime_store import read_crimes
+        route_crimes = read_crimes(columns=['lat', 'lng', 'year', 'month', 'street_name'])
+    else:
+        route_crimes = crimes_df
+    risk_weights, updated_months = update_risk(route_crimes)
+    print(f'Route risk updated for {len(updated_months)} months under {ROUTING_DIR}/')
+    shortest, safest = Router(risk_weights.graph, risk_weights).compare(51.4545, -2.5879, 51.4613, -2.5540)
+    if safest is not None:
+        print(f"Centre -> Easton: shortest {shortest['length_m']:.0f} m ({shortest['crimes_per_month']:.1f} crimes/month), "
+              f"safest {safest['length_m']:.0f} m ({safest['crimes_per_month']:.1f} crimes/month)")
+else:
+    print(f'{STREETS_PATH} not found (an OpenStreetMap XML extract of Bristol); skipping route risk.')
+profiler.end(rows=len(crimes_df))
 
 # 11. Next Steps & Integration
 print('''\nNext Steps:\n- Integrate real weather, transport, and user report APIs.\n- Use predictions for real-time safety alerts and safe route planning.\n- Connect outputs to the SafeBristol app backend.\n''')
@@ -226,9 +293,9 @@ print('''\nNext Steps:\n- Integrate real weather, transport, and user report API
 # import seaborn as sns
 # st.set_page_config(page_title="SafeBristol Crime Dashboard", layout="wide")
 # st.title("SafeBristol: Crime Prediction & Safety Dashboard")
-# # Load data (assume crimes_df is available or load from a CSV/parquet if needed)
-# # For demonstration, you can save crimes_df to a CSV and load here:
-# # crimes_df = pd.read_csv('crimes_api_all_df.csv')
+# # Load data (assume crimes_df is available or load it from the crime store)
+# # from safebristol.crime_store import read_crimes
+# # crimes_df = read_crimes(columns=['lat', 'lng', 'category', 'ward', 'street_name'])
 # st.sidebar.header("Filters")
 # ward_filter = st.sidebar.text_input("Ward (leave blank for all)")
 # street_filter = st.sidebar.text_input("Street (leave blank for all)")
@@ -242,8 +309,12 @@ print('''\nNext Steps:\n- Integrate real weather, transport, and user report API
 #     if category_filter:
 #         df = df[df['category'].str.contains(category_filter, na=False, case=False)]
 #     st.subheader("Crime Hotspots (Heatmap)")
+#     # Binned FFT density (crime_hotspots): milliseconds per filter change even on the full history
+#     from safebristol.crime_hotspots import HotspotEngine
+#     surface = HotspotEngine(df).surface()
+#     centre_lat, centre_lng = surface.centres()
 #     fig, ax = plt.subplots(figsize=(10, 6))
-#     sns.kdeplot(x=df['lng'], y=df['lat'], cmap='Reds', fill=True, thresh=0.05, ax=ax)
+#     ax.contourf(centre_lng, centre_lat, surface.density, levels=surface.levels(thresh=0.05), cmap='Reds')
 #     ax.set_title('Bristol Crime Hotspots')
 #     ax.set_xlabel('Longitude')
 #     ax.set_ylabel('Latitude')
@@ -262,7 +333,16 @@ print('''\nNext Steps:\n- Integrate real weather, transport, and user report API
 # else:
 #     st.warning("No crime data available. Please ensure crimes_df is loaded.")
 
-# At the end of your Safebristol-model.py script, export the DataFrame for Streamlit dashboard use
-if not crimes_df.empty:
-    crimes_df.to_csv('crimes_api_all_df.csv', index=False)
-    print('Crime data exported to crimes_api_all_df.csv for Streamlit dashboard.')
+# At the end of your Safebristol-model.py script, write the DataFrame to the columnar crime store
+# (crime_store/, partitioned by year/month) that app.py and the dashboards read.
+# Streamed runs have already written every month as it was processed.
+profiler.begin('Store write')
+if not crimes_df.empty and not STREAMING:
+    from safebristol.crime_store import STORE_DIR, write_crimes
+    written = write_crimes(crimes_df)
+    print(f'{written} crime records written to {STORE_DIR}/ for the dashboards.')
+profiler.end(rows=len(crimes_df))
+
+# Per-step wall time, CPU time, peak memory and throughput
+profiler.print_table()
+print(f'Stage profile written to {profiler.write(PROFILE_PATH)}')
@@ -0,0 +1,98 @@
+# Local stand-in for data.police.uk's crimes-street/all-crime endpoint. Serves a
+# fixed set of API records by month and polygon, answers 503 when a polygon holds
+# more than max_crimes crimes (as the real API does above 10,000) and 404 for
+# months it has no data for. Optional latency per request mimics the network.
+# Faults queued with fail() answer a month's next requests with an error status
+# (e.g. 429, 500) or a raw body, for testing retries.
+
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from safebristol.crime_ingest import parse_poly, points_in_poly
+
+MAX_CRIMES = 10_000
+PATH = '/api/crimes-street/all-crime'
+
+
+class MockPoliceAPI:
+    def __init__(self, records, max_crimes=MAX_CRIMES, latency_s=0.0):
+        self.max_crimes = max_crimes
+        self.latency_s = latency_s
+        self.requests = 0
+        self.faults = {}
+        self._lock = threading.Lock()
+        self.by_month = {}
+        for record in records:
+            self.by_month.setdefault(record['month'], []).append(record)
+        self.points = {
+            month: (np.array([float(r['location']['latitude']) for r in crimes]),
+                    np.array([float(r['location']['longitude']) for r in crimes]))
+            for month, crimes in self.by_month.items()}
+
+    def fail(self, month, *faults):
+        # Each fault answers one request for `month`: an int status or a bytes 200 body
+        with self._lock:
+            self.faults.setdefault(month, []).extend(faults)
+
+    def next_fault(self, month):
+        with self._lock:
+            faults = self.faults.get(month)
+            return faults.pop(0) if faults else None
+
+    def answer(self, poly, month):
+        # (status, records) for one request
+        if month not in self.by_month:
+            return 404, None
+        lat, lng = self.points[month]
+        inside = np.flatnonzero(points_in_poly(lat, lng, parse_poly(poly)))
+        if len(inside) > self.max_crimes:
+            return 503, None
+        crimes = self.by_month[month]
+        return 200, [crimes[i] for i in inside]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    api = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        with self.api._lock:
+            self.api.requests += 1
+        if self.api.latency_s:
+            time.sleep(self.api.latency_s)
+        if url.path != PATH or 'poly' not in params or 'date' not in params:
+            self.send_error(400)
+            return
+        fault = self.api.next_fault(params['date'])
+        if isinstance(fault, int):
+            self.send_error(fault)
+            return
+        if fault is not None:
+            body = fault
+        else:
+            status, crimes = self.api.answer(params['poly'], params['date'])
+            if status != 200:
+                self.send_error(status)
+                return
+            body = json.dumps(crimes).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve_in_background(api, host='localhost', port=0):
+    # Returns (server, api_url); port 0 picks a free port
+    httpd = ThreadingHTTPServer((host, port), type('MockPoliceHandler', (_Handler,), {'api': api}))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd, f'http://{host}:{httpd.server_address[1]}{PATH}'
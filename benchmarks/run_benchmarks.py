@@ -0,0 +1,236 @@
+# SafeBristol benchmark suite.
+# Runs the pipeline stages (fetch from a local mock of police.uk, normalisation,
+# store write/read, tabular load, cube build, enrichment, hotspots, forecasting,
+# training) on synthetic crime datasets of fixed sizes and seeds, records wall
+# time, CPU time, peak RSS and rows/sec per stage with crime_profile, and
+# compares wall times with benchmarks/thresholds.json. Any stage slower than its
+# threshold fails the run (exit status 1).
+#
+#   python benchmarks/run_benchmarks.py                      # 10k and 100k rows
+#   python benchmarks/run_benchmarks.py --sizes 10k,100k,1M,10M
+#   python benchmarks/run_benchmarks.py --update-thresholds  # record this machine's baseline
+#
+# Thresholds are machine-specific: record them on the machine that runs the checks.
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from safebristol.crime_cube import CrimeCube
+from safebristol.crime_enrich import TTLCache, enrich
+from safebristol.crime_features import normalise_crimes
+from safebristol.crime_forecast import CountTensor, forecast_next_month
+from safebristol.crime_hotspots import HotspotEngine
+from safebristol.crime_ingest import GREATER_BRISTOL_POLY, fetch_region_months
+from safebristol.crime_profile import StageProfiler
+from safebristol.crime_store import read_crimes, read_table_cached, write_crimes
+from safebristol.crime_training import train_model
+from synthetic import synthetic_frame, to_records
+import mock_police_api
+
+THRESHOLDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'thresholds.json')
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+DEFAULT_SIZES = '10k,100k'
+HEADROOM = 1.5                         # thresholds recorded as measured wall time x HEADROOM
+MIN_THRESHOLD_S = 0.05                 # stages faster than this are too noisy to gate on
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    scale = {'k': 1_000, 'm': 1_000_000}.get(text[-1], 1)
+    return int(float(text[:-1] if text[-1] in 'km' else text) * scale)
+
+
+def size_label(n):
+    return f'{n // 1_000_000}M' if n >= 1_000_000 and n % 1_000_000 == 0 else f'{n // 1_000}k'
+
+
+# Stage modules are imported up front so import time is not charged to the first size.
+# Each stage takes the shared context and returns the number of rows it processed.
+# The row cap keeps stages that are inherently per-record (JSON records, model fits)
+# to sizes that finish in minutes.
+
+def stage_fetch(ctx):
+    api = mock_police_api.MockPoliceAPI(ctx['records'])
+    httpd, api_url = mock_police_api.serve_in_background(api)
+    try:
+        months = sorted(api.by_month)
+        crimes_by_month, failed = fetch_region_months(months, GREATER_BRISTOL_POLY, api_url=api_url,
+                                                      checkpoint_dir=None, rate=1e6, burst=1e6, max_retries=0)
+    finally:
+        httpd.shutdown()
+    if failed:
+        raise RuntimeError(f'mock fetch failed: {failed}')
+    return sum(len(crimes) for crimes in crimes_by_month.values())
+
+
+def stage_normalise(ctx):
+    return len(normalise_crimes(ctx['records']))
+
+
+def stage_store_write(ctx):
+    return write_crimes(ctx['df'], os.path.join(ctx['tmp'], 'crime_store'))
+
+
+def stage_store_read(ctx):
+    return len(read_crimes(os.path.join(ctx['tmp'], 'crime_store'),
+                           columns=['lat', 'lng', 'category', 'street_name', 'year', 'month']))
+
+
+def stage_table_load(ctx):
+    # Spreadsheet-style input converted to Parquet on first read (read_table_cached), then reread
+    path = os.path.join(ctx['tmp'], 'crimes.csv')
+    if not os.path.exists(path):
+        ctx['df'].drop(columns=['persistent_id']).to_csv(path, index=False)
+    read_table_cached(path)
+    return len(read_table_cached(path))
+
+
+def stage_cube(ctx):
+    cube = CrimeCube.build(ctx['df'], ['year', 'month', 'category', 'street_name'])
+    return int(cube.total())
+
+
+def stage_enrich(ctx):
+    cache = TTLCache(os.path.join(ctx['tmp'], 'enrichment_cache.sqlite'))
+    try:
+        enriched = enrich(ctx['df'], {'transport_safety_index': lambda lat, lng, date: 0.5}, cache=cache)
+    finally:
+        cache.close()
+    return len(enriched)
+
+
+def stage_hotspots(ctx):
+    engine = HotspotEngine(ctx['df'])
+    engine.surface()
+    engine.surface(category='burglary')
+    return len(ctx['df'])
+
+
+def stage_forecast(ctx):
+    forecast_next_month(CountTensor.build(ctx['df']))
+    return len(ctx['df'])
+
+
+def stage_train(ctx):
+    train_model(ctx['df'], ['lat', 'lng', 'year', 'month'], 'category_code', kind='random_forest',
+                n_jobs=1, random_state=0, n_estimators=20)
+    return len(ctx['df'])
+
+
+STAGES = [
+    ('fetch (mock police.uk)', stage_fetch, 1_000_000),
+    ('normalise', stage_normalise, 1_000_000),
+    ('store write', stage_store_write, None),
+    ('store read', stage_store_read, None),
+    ('table load', stage_table_load, 1_000_000),
+    ('cube build', stage_cube, None),
+    ('enrich', stage_enrich, None),
+    ('hotspots', stage_hotspots, None),
+    ('forecast', stage_forecast, None),
+    ('train', stage_train, 100_000),
+]
+RECORD_STAGES = {'fetch (mock police.uk)', 'normalise'}
+
+
+def run(sizes, stages=None, seed=0):
+    profiler = StageProfiler()
+    results = []
+    for n in sizes:
+        label = size_label(n)
+        tmp = tempfile.mkdtemp(prefix=f'safebristol-bench-{label}-')
+        try:
+            ctx = {'df': synthetic_frame(n, seed=seed), 'tmp': tmp}
+            # API-shaped dicts only for the stages that consume them, within their row cap
+            needs_records = [name for name, _, cap in STAGES if name in RECORD_STAGES and (cap is None or n <= cap)
+                             and (not stages or name in stages)]
+            ctx['records'] = to_records(ctx['df']) if needs_records else []
+            for name, fn, cap in STAGES:
+                if stages and name not in stages:
+                    continue
+                if cap is not None and n > cap:
+                    print(f'{name}@{label}: skipped (above {size_label(cap)} rows)')
+                    continue
+                with profiler.stage(f'{name}@{label}') as stage:
+                    stage['rows'] = fn(ctx)
+                record = dict(profiler.records[-1], size=n)
+                results.append(record)
+                print(f"{record['stage']:<32}{record['wall_s']:>9.3f}s{record['cpu_s']:>9.3f}s cpu"
+                      f"{record['peak_rss_mb']:>8.0f}MB{(record['rows_per_s'] or 0):>14,.0f} rows/s")
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+    return results
+
+
+def check(results, thresholds):
+    # Stages whose wall time (or peak RSS, when a threshold is set) exceeds the threshold
+    regressions = []
+    for r in results:
+        limit = thresholds.get(r['stage'])
+        if not limit:
+            continue
+        for metric in ('wall_s', 'peak_rss_mb'):
+            if metric in limit and r[metric] > limit[metric]:
+                regressions.append({'stage': r['stage'], 'metric': metric, 'value': r[metric], 'threshold': limit[metric]})
+    return regressions
+
+
+def updated_thresholds(results, thresholds, headroom=HEADROOM):
+    thresholds = dict(thresholds)
+    for r in results:
+        thresholds[r['stage']] = {'wall_s': round(max(r['wall_s'], MIN_THRESHOLD_S) * headroom, 3)}
+    return dict(sorted(thresholds.items()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the SafeBristol pipeline stages on synthetic data.')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='comma-separated row counts, e.g. 10k,100k,1M,10M')
+    parser.add_argument('--stages', help='comma-separated stage names (default: all)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--thresholds', default=THRESHOLDS_PATH)
+    parser.add_argument('--update-thresholds', action='store_true', help='record these timings as the new thresholds')
+    parser.add_argument('--headroom', type=float, default=HEADROOM)
+    parser.add_argument('--output', help='results JSON path (default: benchmarks/results/<run>.json)')
+    args = parser.parse_args(argv)
+
+    sizes = [parse_size(s) for s in args.sizes.split(',')]
+    stages = set(args.stages.split(',')) if args.stages else None
+    results = run(sizes, stages, args.seed)
+
+    thresholds = {}
+    if os.path.exists(args.thresholds):
+        with open(args.thresholds) as f:
+            thresholds = json.load(f)
+    regressions = [] if args.update_thresholds else check(results, thresholds)
+    report = {
+        'machine': {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count()},
+        'sizes': sizes,
+        'results': results,
+        'regressions': regressions,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{results[0]['run'] if results else 'empty'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=1)
+    print(f'Results written to {output}')
+
+    if args.update_thresholds:
+        with open(args.thresholds, 'w') as f:
+            json.dump(updated_thresholds(results, thresholds, args.headroom), f, indent=1)
+        print(f'Thresholds updated in {args.thresholds}')
+        return 0
+    for r in regressions:
+        print(f"REGRESSION {r['stage']}: {r['metric']} {r['value']} > threshold {r['threshold']}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,4 @@
+# SafeBristol: crime data ingestion, modelling and serving for Bristol.
+# Submodules are imported on use (see safebristol.cli), so importing the package is free.
+
+__version__ = '0.1.0'
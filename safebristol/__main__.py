@@ -0,0 +1,6 @@
+# python -m safebristol ... (same as the safebristol command)
+import sys
+
+from .cli import main
+
+sys.exit(main())
@@ -0,0 +1,357 @@
+# SafeBristol: real-time safety alerts for geofenced subscriptions.
+# Users subscribe with a geofence, either a point and radius or a ward, optionally
+# limited to some crime categories. Circles are indexed on a grid whose cell size
+# is chosen per fence (powers of two of CELL_M, so a fence spans at most
+# MAX_CELLS_PER_SIDE cells a side) and kept as sorted cell-key arrays, so a batch
+# of events is matched against every fence with a few searchsorted calls. Events
+# arrive as batches on an asyncio queue: newly ingested crimes, and model risk
+# updates (e.g. crime_forecast.forecast_next_month rows with a 'risk' column).
+# Each user gets an alert once per event however many of their fences match, and
+# at most `alerts_per_hour` (token bucket with a burst); alerts over the limit are
+# counted and reported on the user's next delivered alert. Matching, filtering and
+# per-event dedupe are vectorised per batch; Python only loops over users and the
+# alerts actually sent. asyncio.Queue is the
+# local stand-in for a message broker on both sides. Subscriptions are read from a
+# JSON file (load_subscriptions); `safebristol alerts` runs the store's newest
+# months and the next-month forecast through the engine.
+
+import json
+import time
+import asyncio
+import collections
+
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS_M = 6371000.0
+REF_LAT = 51.4545
+CELL_M = 250.0
+MAX_CELLS_PER_SIDE = 4
+KEY_SPAN = 1 << 24
+DEFAULT_MIN_RISK = 0.5
+DEFAULT_ALERTS_PER_HOUR = 12
+DEFAULT_BURST = 4
+DEDUPE_TTL_S = 7 * 24 * 3600
+MAX_DEDUPE_KEYS = 1_000_000
+MAX_BATCH_ROWS = 2000               # queued events merged into one match
+SUBSCRIPTIONS_PATH = 'subscriptions.json'
+
+
+def _project(lat, lng, ref_lat=REF_LAT):
+    # Equirectangular metres around ref_lat
+    x = np.radians(np.asarray(lng, dtype=np.float64)) * np.cos(np.radians(ref_lat)) * EARTH_RADIUS_M
+    y = np.radians(np.asarray(lat, dtype=np.float64)) * EARTH_RADIUS_M
+    return x, y
+
+
+def _cell_keys(x, y, size):
+    return np.floor(x / size).astype(np.int64) * KEY_SPAN + np.floor(y / size).astype(np.int64)
+
+
+class GeofenceIndex:
+    def __init__(self, ref_lat=REF_LAT):
+        self.ref_lat = ref_lat
+        # One entry per subscription, appended in order; removed ones stay as inactive slots
+        self.sub_ids, self.users, self.user_codes, self.category_masks, self.min_risk = [], [], [], [], []
+        # Users and categories as small integer codes; a category filter is a bit mask (0: all)
+        self._user_index, self.category_bits = {}, {}
+        self._x, self._y, self._r, self._ward, self._live = [], [], [], [], []
+        self._positions = {}
+        self._active = np.zeros(0, dtype=bool)
+        self._levels = None
+        self._wards = None
+
+    def __len__(self):
+        return len(self._positions)
+
+    def _add(self, sub_id, user, x, y, r, ward, categories, min_risk):
+        if sub_id in self._positions:
+            self.remove(sub_id)
+        self._positions[sub_id] = len(self.sub_ids)
+        self.sub_ids.append(sub_id)
+        self.users.append(user)
+        self.user_codes.append(self._user_index.setdefault(user, len(self._user_index)))
+        self.category_masks.append(self.category_mask(categories or ()))
+        self.min_risk.append(min_risk)
+        self._x.append(x)
+        self._y.append(y)
+        self._r.append(r)
+        self._ward.append(ward)
+        self._live.append(True)
+        # Index arrays are rebuilt on the next match
+        self._levels = self._wards = None
+
+    def category_mask(self, categories):
+        mask = 0
+        for category in categories:
+            mask |= 1 << self.category_bits.setdefault(category, len(self.category_bits))
+        return mask
+
+    def add_circle(self, sub_id, user, lat, lng, radius_m, categories=None, min_risk=DEFAULT_MIN_RISK):
+        x, y = _project([lat], [lng], self.ref_lat)
+        self._add(sub_id, user, float(x[0]), float(y[0]), float(radius_m), None, categories, min_risk)
+
+    def add_ward(self, sub_id, user, ward, categories=None, min_risk=DEFAULT_MIN_RISK):
+        # ward: a ward code (WARD_CODE) or name, matched case-insensitively
+        self._add(sub_id, user, np.nan, np.nan, np.nan, str(ward).strip().lower(), categories, min_risk)
+
+    def remove(self, sub_id):
+        position = self._positions.pop(sub_id, None)
+        if position is not None:
+            self._live[position] = False
+            # Takes effect at once, without rebuilding the index
+            if position < len(self._active):
+                self._active[position] = False
+
+    def _build(self):
+        # {level: (sorted cell keys, fence positions)} for circles; {ward key: positions} for wards
+        x, y, r = np.array(self._x), np.array(self._y), np.array(self._r)
+        self._active = np.array(self._live, dtype=bool)
+        circles = np.flatnonzero(~np.isnan(r) & self._active)
+        levels = np.ceil(np.log2(np.maximum(2 * r[circles] / (CELL_M * (MAX_CELLS_PER_SIDE - 1)), 1)))
+        self._levels = {}
+        for level in np.unique(levels).astype(int):
+            fences = circles[levels == level]
+            size = CELL_M * 2 ** level
+            x0, x1 = np.floor((x[fences] - r[fences]) / size), np.floor((x[fences] + r[fences]) / size)
+            y0, y1 = np.floor((y[fences] - r[fences]) / size), np.floor((y[fences] + r[fences]) / size)
+            nx, ny = (x1 - x0 + 1).astype(np.int64), (y1 - y0 + 1).astype(np.int64)
+            # Every (fence, cell) pair of each fence's bounding box
+            owner = np.repeat(np.arange(len(fences)), nx * ny)
+            offset = np.arange(len(owner)) - np.repeat(np.cumsum(nx * ny) - nx * ny, nx * ny)
+            keys = ((x0[owner] + offset // ny[owner]).astype(np.int64) * KEY_SPAN
+                    + (y0[owner] + offset % ny[owner]).astype(np.int64))
+            order = np.argsort(keys, kind='stable')
+            self._levels[int(level)] = (keys[order], fences[owner[order]], size)
+        self._wards = collections.defaultdict(list)
+        for position, ward in enumerate(self._ward):
+            if ward is not None and self._live[position]:
+                self._wards[ward].append(position)
+        self._fx, self._fy, self._fr = x, y, r
+        self.user_array = np.array(self.user_codes, dtype=np.int64)
+        self.mask_array = np.array(self.category_masks, dtype=np.int64)
+        self.min_risk_array = np.array(self.min_risk, dtype=np.float64)
+
+    def match(self, lat, lng, wards=()):
+        # (event index, fence position, distance in metres; NaN for ward fences) of every active match.
+        # wards: arrays of per-event ward codes or names (None where unknown)
+        if self._levels is None:
+            self._build()
+        x, y = _project(lat, lng, self.ref_lat)
+        events, fences = [], []
+        for keys, positions, size in self._levels.values():
+            cells = _cell_keys(x, y, size)
+            lo, hi = np.searchsorted(keys, cells, 'left'), np.searchsorted(keys, cells, 'right')
+            counts = hi - lo
+            event = np.repeat(np.arange(len(cells)), counts)
+            events.append(event)
+            fences.append(positions[lo[event] + np.arange(len(event)) - np.repeat(np.cumsum(counts) - counts, counts)])
+        event = np.concatenate(events) if events else np.zeros(0, dtype=np.int64)
+        fence = np.concatenate(fences) if fences else np.zeros(0, dtype=np.int64)
+        distance = np.hypot(x[event] - self._fx[fence], y[event] - self._fy[fence])
+        inside = (distance <= self._fr[fence]) & self._active[fence]
+        event, fence, distance = event[inside], fence[inside], distance[inside]
+        if self._wards:
+            ward_event, ward_fence = [], []
+            for column in wards:
+                for i, ward in enumerate(column):
+                    for position in self._wards.get(str(ward).strip().lower(), ()) if ward is not None else ():
+                        if self._active[position]:
+                            ward_event.append(i)
+                            ward_fence.append(position)
+            event = np.concatenate([event, np.array(ward_event, dtype=np.int64)])
+            fence = np.concatenate([fence, np.array(ward_fence, dtype=np.int64)])
+            distance = np.concatenate([distance, np.full(len(ward_event), np.nan)])
+        return event, fence, distance
+
+
+def event_keys(kind, frame):
+    # Stable identity of each event for deduplication
+    if kind == 'risk':
+        unit = frame['unit'] if 'unit' in frame else frame['lat'].round(5).astype(str) + ',' + frame['lng'].round(5).astype(str)
+        return ('risk:' + unit.astype(str) + ':' + frame['month'].astype(str)).to_numpy()
+    if 'id' in frame:
+        return ('crime:' + frame['id'].astype(str)).to_numpy()
+    return ('crime:' + pd.util.hash_pandas_object(frame, index=False).astype(str)).to_numpy()
+
+
+class AlertEngine:
+    def __init__(self, index, alerts_per_hour=DEFAULT_ALERTS_PER_HOUR, burst=DEFAULT_BURST,
+                 dedupe_ttl=DEDUPE_TTL_S, max_dedupe_keys=MAX_DEDUPE_KEYS, clock=time.monotonic):
+        self.index = index
+        self.rate = alerts_per_hour / 3600.0
+        self.burst = float(burst)
+        self.dedupe_ttl = dedupe_ttl
+        self.max_dedupe_keys = max_dedupe_keys
+        self.clock = clock
+        # (user, event key) -> expiry, oldest first
+        self._seen = collections.OrderedDict()
+        # user -> [tokens, last refill, alerts suppressed since the last delivered one]
+        self._buckets = {}
+        self.stats = collections.Counter()
+
+    def _first_time(self, user, key, now):
+        while self._seen and (len(self._seen) >= self.max_dedupe_keys or next(iter(self._seen.values())) < now):
+            self._seen.popitem(last=False)
+        if (user, key) in self._seen:
+            return False
+        self._seen[(user, key)] = now + self.dedupe_ttl
+        return True
+
+    def _refill(self, user, now):
+        bucket = self._buckets.setdefault(user, [self.burst, now, 0])
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        return bucket
+
+    def process(self, kind, frame):
+        # Alerts for one batch of events: kind 'crime' (lat, lng, category, ...) or 'risk' (lat, lng, risk, ...)
+        index = self.index
+        now = self.clock()
+        frame = frame.reset_index(drop=True)
+        # Ward fences may name the ward by code or by name
+        wards = [frame[column].astype(object).where(frame[column].notna(), None).to_numpy()
+                 for column in ('WARD_CODE', 'ward') if column in frame]
+        event, fence, distance = index.match(frame['lat'].to_numpy(), frame['lng'].to_numpy(), wards)
+        self.stats[f'{kind}_events'] += len(frame)
+        self.stats['matches'] += len(event)
+        if not len(event):
+            return []
+        # Category filters and risk thresholds, then one candidate per (user, event)
+        if kind == 'crime' and 'category' in frame:
+            bits = np.array([1 << index.category_bits[c] if c in index.category_bits else 0
+                             for c in frame['category'].astype(object)], dtype=np.int64)
+            masks = index.mask_array[fence]
+            keep = (masks == 0) | (masks & bits[event] != 0)
+        elif kind == 'risk':
+            keep = frame['risk'].to_numpy(dtype=np.float64)[event] >= index.min_risk_array[fence]
+        else:
+            keep = np.ones(len(event), dtype=bool)
+        event, fence, distance = event[keep], fence[keep], distance[keep]
+        _, first = np.unique(event * len(index.user_array) + index.user_array[fence], return_index=True)
+        self.stats['duplicates'] += len(event) - len(first)
+        event, fence, distance = event[first], fence[first], distance[first]
+        if not len(event):
+            return []
+        keys = event_keys(kind, frame)
+        categories = frame['category'].astype(object).to_numpy() if 'category' in frame else None
+        risk = frame['risk'].to_numpy(dtype=np.float64) if 'risk' in frame else None
+        lat, lng = frame['lat'].to_numpy(dtype=np.float64), frame['lng'].to_numpy(dtype=np.float64)
+        months = None
+        if 'year' in frame and 'month' in frame:
+            months = (frame['year'].astype(str) + '-' + frame['month'].astype(str).str.zfill(2)).to_numpy()
+        elif 'month' in frame:
+            months = frame['month'].astype(str).to_numpy()
+        alerts = []
+        # Per user, in event order: alerts until the user's tokens run out, the rest only counted
+        order = np.lexsort((event, index.user_array[fence]))
+        users = index.user_array[fence[order]]
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(users)) + 1])
+        ends = np.append(starts[1:], len(order))
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            user = index.users[fence[order[start]]]
+            bucket = self._refill(user, now)
+            j = start
+            while j < end and bucket[0] >= 1:
+                i, position, metres = int(event[order[j]]), int(fence[order[j]]), float(distance[order[j]])
+                j += 1
+                if not self._first_time(user, keys[i], now):
+                    self.stats['duplicates'] += 1
+                    continue
+                bucket[0] -= 1
+                alert = {'user': user, 'subscription': index.sub_ids[position], 'kind': kind, 'event': keys[i],
+                         'lat': float(lat[i]), 'lng': float(lng[i]),
+                         'distance_m': None if np.isnan(metres) else round(metres, 1)}
+                if categories is not None:
+                    alert['category'] = categories[i]
+                if risk is not None:
+                    alert['risk'] = float(risk[i])
+                if months is not None:
+                    alert['month'] = months[i]
+                if bucket[2]:
+                    alert['suppressed'] = bucket[2]
+                    bucket[2] = 0
+                alerts.append(alert)
+            # Suppressed alerts are counted without being deduplicated
+            bucket[2] += end - j
+            self.stats['rate_limited'] += end - j
+        self.stats['alerts'] += len(alerts)
+        return alerts
+
+    async def run(self, source, sink, max_rows=MAX_BATCH_ROWS):
+        # Consumes (kind, DataFrame) batches from source until a None sentinel and puts alerts
+        # on sink. Batches already waiting are merged per kind, up to max_rows events per match.
+        while True:
+            items = [await source.get()]
+            rows = 0 if items[0] is None else len(items[0][1])
+            while items[-1] is not None and rows < max_rows and not source.empty():
+                items.append(source.get_nowait())
+                rows += 0 if items[-1] is None else len(items[-1][1])
+            by_kind = collections.defaultdict(list)
+            for item in items:
+                if item is not None:
+                    by_kind[item[0]].append(item[1])
+            for kind, frames in by_kind.items():
+                for alert in self.process(kind, pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]):
+                    # Waits here when a bounded sink is full (backpressure on the matcher)
+                    await sink.put(alert)
+            for _ in items:
+                source.task_done()
+            if items[-1] is None:
+                await sink.put(None)
+                return
+
+
+async def publish(queue, kind, frame, batch_rows=500):
+    # Producer side: puts a frame of events on the queue in batches of batch_rows
+    for start in range(0, len(frame), batch_rows):
+        await queue.put((kind, frame.iloc[start:start + batch_rows]))
+
+
+async def deliver(sink, send):
+    # Fan-out side: calls (and awaits, if it is a coroutine function) send(alert) for every alert until None
+    is_async = asyncio.iscoroutinefunction(send)
+    while True:
+        alert = await sink.get()
+        if alert is None:
+            return
+        if is_async:
+            await send(alert)
+        else:
+            send(alert)
+
+
+def load_subscriptions(path=SUBSCRIPTIONS_PATH, ref_lat=REF_LAT):
+    # GeofenceIndex from a JSON list of {"id", "user", "lat", "lng", "radius_m"} circles or
+    # {"id", "user", "ward"} wards, each with optional "categories" and "min_risk"
+    with open(path) as f:
+        subscriptions = json.load(f)
+    index = GeofenceIndex(ref_lat)
+    for sub in subscriptions:
+        options = {'categories': sub.get('categories'), 'min_risk': sub.get('min_risk', DEFAULT_MIN_RISK)}
+        if 'ward' in sub:
+            index.add_ward(sub['id'], sub['user'], sub['ward'], **options)
+        else:
+            index.add_circle(sub['id'], sub['user'], sub['lat'], sub['lng'], sub['radius_m'], **options)
+    return index
+
+
+def alert_on(engine, batches, send, batch_rows=500, sink_size=1000):
+    # Runs (kind, frame) batches through publish -> engine.run -> deliver(send); returns the alerts sent
+    sent = collections.Counter()
+
+    def count(alert):
+        sent['alerts'] += 1
+        send(alert)
+
+    async def main():
+        source, sink = asyncio.Queue(), asyncio.Queue(sink_size)
+        matcher = asyncio.create_task(engine.run(source, sink))
+        delivery = asyncio.create_task(deliver(sink, count))
+        for kind, frame in batches:
+            await publish(source, kind, frame, batch_rows)
+        await source.put(None)
+        await asyncio.gather(matcher, delivery)
+
+    asyncio.run(main())
+    return sent['alerts']
@@ -0,0 +1,252 @@
+# SafeBristol command line: safebristol {ingest,train,score,route,alerts,serve} (or python -m safebristol).
+# Each subcommand imports what it needs when it runs, so `score` and `serve model`
+# start with NumPy alone (forests are scored from their memory-mapped forest/ export) and never
+# pay for pandas, scikit-learn or the network stack.
+#
+#   safebristol ingest --start 2015-01 --end 2025-07 [--tiled] [--poly greater-bristol]
+#   safebristol train [--kind random_forest|xgboost] [--full]
+#   safebristol score --lat 51.4545 --lng -2.5879 [--top 5]
+#   safebristol score --input crimes.parquet --output scored.csv
+#   safebristol route 51.4545,-2.5879 51.4613,-2.5540 [--variant winter] [--aversion 2]
+#   safebristol alerts subscriptions.json [--months 1 | --since 2025-05] [--forecast]
+#   safebristol serve model|dashboard|tiles|reports [--port N]
+
+import sys
+import json
+import argparse
+
+DEFAULT_START = '2015-01'
+DEFAULT_END = '2025-07'
+BASE_FEATURES = ['lat', 'lng', 'month', 'year']
+OPTIONAL_FEATURES = ['temperature', 'precipitation_sum', 'rainy_days', 'weather_code',
+                     'ward_rate', 'ward_rank', 'ward_rate_change']
+POLYS = {'bristol': 'BRISTOL_POLY', 'greater-bristol': 'GREATER_BRISTOL_POLY', 'avon-somerset': 'AVON_SOMERSET_POLY'}
+
+
+def cmd_ingest(args):
+    import os
+    from . import crime_ingest
+    from .crime_pipeline import stream_crimes
+    from .crime_store import STORE_DIR
+    from .ward_lookup import WARDS_MISSING, WARDS_PATH, WardIndex
+    from .ward_stats import WardStats
+    from .weather_store import WeatherStore
+    has_wards = os.path.exists(WARDS_PATH)
+    if not has_wards:
+        print(WARDS_MISSING)
+    poly = getattr(crime_ingest, POLYS[args.poly])
+    _, sample, report = stream_crimes(
+        crime_ingest.month_range(args.start, args.end), poly=poly, store_dir=args.store,
+        weather_store=WeatherStore.load(), ward_index=WardIndex.from_geojson(WARDS_PATH) if has_wards else None,
+        ward_stats=WardStats.load() if has_wards else None, refresh_window=args.refresh_window,
+        tiled=args.tiled or args.poly != 'bristol', sample_rows=0)
+    if report['failed']:
+        print(f"{len(report['failed'])} months failed to fetch: {', '.join(sorted(report['failed']))}")
+    print(f"Ingested {report['records']} records ({report['months']} months) into {args.store or STORE_DIR}/")
+    return 1 if report['failed'] else 0
+
+
+def cmd_train(args):
+    import os
+    import numpy as np
+    from .crime_model import save_model
+    from .crime_pipeline import add_wards, add_weather
+    from .crime_store import read_crimes, store_exists
+    from .crime_training import has_training_history, train_model, update_model
+    from .ward_lookup import WARDS_MISSING, WARDS_PATH, WardIndex
+    from .ward_stats import WardStats
+    from .weather_store import WeatherStore, weather_condition
+    if not store_exists(args.store):
+        print(f'{args.store}/ not found. Run `safebristol ingest` first.')
+        return 1
+    crimes_df = read_crimes(args.store).dropna(subset=['lat', 'lng'])
+    if os.path.exists(WARDS_PATH):
+        crimes_df = add_wards(crimes_df, WardIndex.from_geojson(WARDS_PATH), WardStats.load())
+    else:
+        print(WARDS_MISSING)
+    crimes_df = add_weather(crimes_df, WeatherStore.load())
+    crimes_df['weather_code'] = crimes_df['weather_code'].fillna(-1)
+    # One code per category across all months read, matching the labels save_model records
+    crimes_df['category'] = crimes_df['category'].cat.remove_unused_categories()
+    crimes_df['category_code'] = crimes_df['category'].cat.codes.astype(np.int16)
+    if not args.full and has_training_history(args.kind, args.models):
+        try:
+            update_model(crimes_df, name=args.kind, root=args.models)
+        except ValueError as exc:
+            print(exc)
+            return 1
+        return 0
+    features = BASE_FEATURES + [col for col in OPTIONAL_FEATURES if col in crimes_df.columns]
+    observed_codes = np.unique(crimes_df['weather_code'])
+    weather_codes = {int(code): label for code, label in zip(observed_codes, weather_condition(observed_codes))}
+    estimator, report = train_model(crimes_df, features, 'category_code', kind=args.kind)
+    model_dir = save_model(estimator, features, crimes_df['category'].cat.categories, name=args.kind,
+                           root=args.models, weather_codes=weather_codes, training_frame=crimes_df[features],
+                           metrics=report['holdout'], extra={'classes': report['classes'], 'training': report})
+    print(f'{args.kind} model saved to {model_dir}')
+    return 0
+
+
+def cmd_score(args):
+    from .crime_model import CrimeModel
+    model = CrimeModel.load(args.model, args.models)
+    if args.input is None:
+        if args.lat is None or args.lng is None:
+            print('score needs --lat and --lng, or --input')
+            return 2
+        json.dump({'model': args.model, 'version': model.version,
+                   'scores': model.score_location(args.lat, args.lng, top=args.top)}, sys.stdout, indent=1)
+        print()
+        return 0
+    # Batch: one predicted category per input row
+    from .crime_store import read_table_cached
+    df = read_table_cached(args.input)
+    df['predicted_category'] = model.predict(df)
+    if args.output is None or args.output.endswith('.csv'):
+        df.to_csv(args.output or sys.stdout, index=False)
+    else:
+        df.to_parquet(args.output, index=False)
+    return 0
+
+
+def cmd_route(args):
+    from .routing import Router
+    router = Router.load(args.routing)
+    (from_lat, from_lng), (to_lat, to_lng) = args.origin, args.destination
+    route = router.route(from_lat, from_lng, to_lat, to_lng, args.variant, args.aversion)
+    if route is None:
+        print('No route between those points')
+        return 1
+    json.dump(route, sys.stdout, indent=1)
+    print()
+    return 0
+
+
+def cmd_alerts(args):
+    # Alerts (JSON lines on stdout) for the crimes of the store's newest months and,
+    # with --forecast, the next month's risk surface
+    import numpy as np
+    from .alerts import AlertEngine, alert_on, load_subscriptions
+    from .crime_store import read_crimes, store_columns, store_exists
+    if not store_exists(args.store):
+        print(f'{args.store}/ not found. Run `safebristol ingest` first.')
+        return 1
+    engine = AlertEngine(load_subscriptions(args.subscriptions))
+    months = read_crimes(args.store, columns=['year', 'month']).drop_duplicates()
+    periods = np.sort(months['year'].to_numpy(dtype=np.int64) * 12 + months['month'].to_numpy(dtype=np.int64) - 1)
+    since = periods[-1] - args.months + 1
+    if args.since:
+        year, month = args.since.split('-')
+        since = int(year) * 12 + int(month) - 1
+    columns = [col for col in ['id', 'lat', 'lng', 'year', 'month', 'category', 'ward', 'WARD_CODE']
+               if col in store_columns(args.store)]
+    crimes = read_crimes(args.store, columns=columns, filters={'year': (int(since // 12), int(periods[-1] // 12))})
+    crimes = crimes[crimes['year'].to_numpy(dtype=np.int64) * 12 + crimes['month'].to_numpy(dtype=np.int64) - 1 >= since]
+    batches = [('crime', crimes.dropna(subset=['lat', 'lng']))]
+    if args.forecast:
+        from .crime_forecast import CountTensor, forecast_next_month
+        from .weather_store import WeatherStore
+        try:
+            history = read_crimes(args.store, columns=['lat', 'lng', 'year', 'month']).dropna(subset=['lat', 'lng'])
+            batches.append(('risk', forecast_next_month(CountTensor.build(history), weather=WeatherStore.load())))
+        except ValueError as exc:
+            # Too few months of history for the lagged features
+            print(f'Skipping the forecast: {exc}', file=sys.stderr)
+    sent = alert_on(engine, batches, lambda alert: print(json.dumps(alert, default=str)))
+    print(f"{sent} alerts for {len(engine.index)} subscriptions ({engine.stats['rate_limited']} rate limited)",
+          file=sys.stderr)
+    return 0
+
+
+def _lat_lng(text):
+    lat, lng = text.split(',')
+    return float(lat), float(lng)
+
+
+def cmd_serve(args):
+    if args.what == 'model':
+        from .crime_model import serve
+        serve(args.model, args.models, args.host, args.port or 8504)
+    elif args.what == 'reports':
+        from .user_reports import PORT, serve as serve_reports
+        serve_reports(args.reports, args.host, args.port or PORT)
+    elif args.what == 'dashboard':
+        from .dashboard import PORT, main as serve_dashboard
+        serve_dashboard(args.port or PORT, args.store, open_browser=False)
+    else:
+        from .crime_cube import CrimeCube
+        from .crime_store import read_crimes, store_exists
+        from .tile_server import TileCache, TileRenderer, make_server
+        if not store_exists(args.store):
+            print(f'{args.store}/ not found. Run `safebristol ingest` first.')
+            return 1
+        dims = ['category', 'year', 'month']
+        cube = CrimeCube.build(read_crimes(args.store, columns=['lat', 'lng'] + dims), dims)
+        httpd = make_server(TileRenderer(cube, TileCache()), args.host, args.port or 8600)
+        print(f'Serving heat tiles at http://{args.host}:{httpd.server_address[1]}/tiles/{{z}}/{{x}}/{{y}}.png')
+        httpd.serve_forever()
+    return 0
+
+
+def build_parser():
+    # Defaults are spelled out here rather than imported, to keep the parser import-free
+    parser = argparse.ArgumentParser(prog='safebristol', description='SafeBristol crime data pipeline.')
+    parser.add_argument('--store', default='crime_store', help='crime store directory')
+    parser.add_argument('--models', default='models', help='model artifact directory')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    ingest = commands.add_parser('ingest', help='fetch police.uk months into the crime store')
+    ingest.add_argument('--start', default=DEFAULT_START)
+    ingest.add_argument('--end', default=DEFAULT_END)
+    ingest.add_argument('--poly', choices=sorted(POLYS), default='bristol')
+    ingest.add_argument('--tiled', action='store_true', help='fetch as a quadtree of tiles (implied by larger areas)')
+    ingest.add_argument('--refresh-window', type=int, default=3, help='trailing months to refetch')
+    ingest.set_defaults(handler=cmd_ingest)
+
+    train = commands.add_parser('train', help='train or update a model from the crime store')
+    train.add_argument('--kind', choices=['random_forest', 'xgboost'], default='random_forest')
+    train.add_argument('--full', action='store_true', help='retrain from all history instead of updating')
+    train.set_defaults(handler=cmd_train)
+
+    score = commands.add_parser('score', help='score a location or a file of crimes')
+    score.add_argument('--model', default='random_forest')
+    score.add_argument('--lat', type=float)
+    score.add_argument('--lng', type=float)
+    score.add_argument('--top', type=int, default=5)
+    score.add_argument('--input', help='CSV/Excel/Parquet file of rows to score')
+    score.add_argument('--output', help='output CSV or Parquet (default: CSV on stdout)')
+    score.set_defaults(handler=cmd_score)
+
+    route = commands.add_parser('route', help='lowest-risk walking route between two points')
+    route.add_argument('origin', type=_lat_lng, help='lat,lng')
+    route.add_argument('destination', type=_lat_lng, help='lat,lng')
+    route.add_argument('--variant', default='all', help='all, a season (winter..autumn) or a time of day (night..evening)')
+    route.add_argument('--aversion', type=float, default=1.0, help='0 for the shortest route')
+    route.add_argument('--routing', default='routing', help='street graph and risk weight directory')
+    route.set_defaults(handler=cmd_route)
+
+    alerts = commands.add_parser('alerts', help='alert geofence subscribers to new crimes and forecast risk')
+    alerts.add_argument('subscriptions', nargs='?', default='subscriptions.json',
+                        help='JSON list of circle (lat, lng, radius_m) or ward subscriptions')
+    alerts.add_argument('--months', type=int, default=1, help="the store's newest months to alert on")
+    alerts.add_argument('--since', help='alert on crimes from this month (YYYY-MM) on instead')
+    alerts.add_argument('--forecast', action='store_true', help="also alert on next month's forecast risk")
+    alerts.set_defaults(handler=cmd_alerts)
+
+    serve = commands.add_parser('serve', help='run the scoring API, Plotly dashboard, tile server or report endpoint')
+    serve.add_argument('what', choices=['model', 'dashboard', 'tiles', 'reports'])
+    serve.add_argument('--reports', default='user_reports', help='user report WAL and rollup directory')
+    serve.add_argument('--model', default='random_forest')
+    serve.add_argument('--host', default='localhost')
+    serve.add_argument('--port', type=int)
+    serve.set_defaults(handler=cmd_serve)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
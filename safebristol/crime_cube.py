@@ -0,0 +1,172 @@
+# SafeBristol: precomputed aggregate cube for the dashboards.
+# The crime table is collapsed once into one row per distinct combination of the
+# filter dimensions (year, month, season, category, street, socio-economic bands,
+# spatial cell). Every dimension is stored as a small integer code array next to
+# a count and coordinate sums, so a filter is an AND of a few integer
+# comparisons over the cube rows and any breakdown is a bincount. Interactive
+# filtering no longer touches the underlying crimes.
+
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+from .spatial_index import BASE_LEVEL, bin_points, cell_keys, level_for_zoom
+
+ALL = 'All'
+
+
+class CrimeCube:
+    def __init__(self, dims, codes, labels, counts, lat_sum, lng_sum):
+        self.dims = list(dims)
+        self.codes = codes
+        self.labels = labels
+        self.counts = counts
+        self.lat_sum = lat_sum
+        self.lng_sum = lng_sum
+        self._label_index = {dim: {label: i for i, label in enumerate(labels[dim])} for dim in self.dims}
+
+    @classmethod
+    def build(cls, df, dims, weight=None, level=BASE_LEVEL):
+        # dims: columns to filter on. A 'cell' dimension (spatial index cell at
+        # `level`) is added automatically from lat/lng. weight: optional column of pre-aggregated counts; otherwise each
+        # row counts as one crime.
+        df = df.dropna(subset=['lat', 'lng'])
+        dims = [d for d in dims if d in df.columns]
+        coded = {}
+        labels = {}
+        for dim in dims:
+            codes, uniques = pd.factorize(df[dim], sort=True)
+            labels[dim] = [u.item() if isinstance(u, np.generic) else u for u in uniques]
+            if (codes < 0).any():
+                # Missing values get their own trailing label so codes stay non-negative
+                codes = np.where(codes < 0, len(uniques), codes)
+                labels[dim].append(None)
+            coded[dim] = codes
+        lat = df['lat'].to_numpy(dtype=np.float64)
+        lng = df['lng'].to_numpy(dtype=np.float64)
+        coded['cell'], cell_uniques = pd.factorize(cell_keys(lat, lng, level), sort=True)
+        labels['cell'] = cell_uniques.tolist()
+        dims = dims + ['cell']
+
+        frame = pd.DataFrame(coded)
+        frame['count'] = df[weight].to_numpy(dtype=np.float64) if weight else 1.0
+        frame['lat_sum'] = lat * frame['count'].to_numpy()
+        frame['lng_sum'] = lng * frame['count'].to_numpy()
+        grouped = frame.groupby(dims, sort=False).sum().reset_index()
+        codes = {dim: grouped[dim].to_numpy(dtype=np.int32) for dim in dims}
+        return cls(dims, codes, labels, grouped['count'].to_numpy(),
+                   grouped['lat_sum'].to_numpy(), grouped['lng_sum'].to_numpy())
+
+    @classmethod
+    def concat(cls, cubes):
+        # One cube from several built over disjoint or overlapping chunks (e.g. one per
+        # month) with the same dims: labels are unioned, codes remapped and rows that
+        # now share every code are summed.
+        cubes = [cube for cube in cubes if len(cube)]
+        if not cubes:
+            raise ValueError('No non-empty cubes to concatenate')
+        dims = cubes[0].dims
+        labels = {}
+        codes = {}
+        for dim in dims:
+            known = {label for cube in cubes for label in cube.labels[dim] if label is not None}
+            labels[dim] = sorted(known)
+            if any(None in cube.labels[dim] for cube in cubes):
+                labels[dim].append(None)
+            index = {label: i for i, label in enumerate(labels[dim])}
+            codes[dim] = np.concatenate([
+                np.array([index[label] for label in cube.labels[dim]], dtype=np.int32)[cube.codes[dim]]
+                for cube in cubes])
+        frame = pd.DataFrame(codes)
+        frame['count'] = np.concatenate([cube.counts for cube in cubes])
+        frame['lat_sum'] = np.concatenate([cube.lat_sum for cube in cubes])
+        frame['lng_sum'] = np.concatenate([cube.lng_sum for cube in cubes])
+        grouped = frame.groupby(dims, sort=False).sum().reset_index()
+        return cls(dims, {dim: grouped[dim].to_numpy(dtype=np.int32) for dim in dims}, labels,
+                   grouped['count'].to_numpy(), grouped['lat_sum'].to_numpy(), grouped['lng_sum'].to_numpy())
+
+    def __len__(self):
+        return len(self.counts)
+
+    def options(self, dim):
+        # Filter choices for a selectbox, in sorted order
+        return [label for label in self.labels[dim] if label is not None]
+
+    def mask(self, **filters):
+        # filters: {dim: value | [values]}; None or 'All' leaves a dimension open
+        mask = np.ones(len(self.counts), dtype=bool)
+        for dim, value in filters.items():
+            if value is None or value == ALL:
+                continue
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            wanted = [self._label_index[dim][v] for v in values if v in self._label_index[dim]]
+            if not wanted:
+                return np.zeros(len(self.counts), dtype=bool)
+            if len(wanted) == 1:
+                mask &= self.codes[dim] == wanted[0]
+            else:
+                mask &= np.isin(self.codes[dim], wanted)
+        return mask
+
+    def total(self, mask=None):
+        return float(self.counts.sum() if mask is None else self.counts[mask].sum())
+
+    def counts_by(self, dim, mask=None):
+        # Series of counts per label of `dim`, largest first
+        codes = self.codes[dim] if mask is None else self.codes[dim][mask]
+        counts = self.counts if mask is None else self.counts[mask]
+        sums = np.bincount(codes, weights=counts, minlength=len(self.labels[dim]))
+        series = pd.Series(sums, index=self.labels[dim])
+        return series[series > 0].sort_values(ascending=False)
+
+    def counts_by_many(self, dims, mask=None):
+        # DataFrame of counts per combination of several dimensions
+        selected = slice(None) if mask is None else mask
+        frame = pd.DataFrame({dim: self.codes[dim][selected] for dim in dims})
+        frame['count'] = self.counts[selected]
+        grouped = frame.groupby(dims, sort=True)['count'].sum().reset_index()
+        for dim in dims:
+            grouped[dim] = np.asarray(self.labels[dim], dtype=object)[grouped[dim].to_numpy()]
+        return grouped
+
+    def cell_points(self, mask=None):
+        # (lat, lng, count) per spatial cell, at the count-weighted centroid of its crimes
+        selected = slice(None) if mask is None else mask
+        cells = self.codes['cell'][selected]
+        n = len(self.labels['cell'])
+        counts = np.bincount(cells, weights=self.counts[selected], minlength=n)
+        lat = np.bincount(cells, weights=self.lat_sum[selected], minlength=n)
+        lng = np.bincount(cells, weights=self.lng_sum[selected], minlength=n)
+        present = counts > 0
+        return lat[present] / counts[present], lng[present] / counts[present], counts[present]
+
+    def heat_points(self, mask=None, zoom=12, bounds=None):
+        # Cell centroids re-binned to the resolution of the map zoom and clipped to
+        # the visible bounds (south, west, north, east)
+        lat, lng, counts = self.cell_points(mask)
+        return bin_points(lat, lng, counts, level_for_zoom(zoom), bounds)
+
+    def save(self, path):
+        arrays = {f'code_{dim}': codes for dim, codes in self.codes.items()}
+        np.savez(path, counts=self.counts, lat_sum=self.lat_sum, lng_sum=self.lng_sum, **arrays)
+        with open(os.path.splitext(path)[0] + '.json', 'w') as f:
+            json.dump({'dims': self.dims, 'labels': self.labels}, f, default=str)
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.splitext(path)[0] + '.json') as f:
+            meta = json.load(f)
+        with np.load(path) as data:
+            codes = {dim: data[f'code_{dim}'] for dim in meta['dims']}
+            return cls(meta['dims'], codes, meta['labels'], data['counts'], data['lat_sum'], data['lng_sum'])
+
+
+def cached_cube(cube_path, source_path, build_frame, dims, weight=None, level=BASE_LEVEL):
+    # Loads the cube from cube_path, rebuilding it from build_frame() when the source file is newer
+    if os.path.exists(cube_path) and os.path.getmtime(cube_path) >= os.path.getmtime(source_path):
+        return CrimeCube.load(cube_path)
+    cube = CrimeCube.build(build_frame(), dims, weight=weight, level=level)
+    cube.save(cube_path)
+    return cube
@@ -0,0 +1,140 @@
+# SafeBristol: batched, cached enrichment of crimes with external features.
+# Weather, transport and user-report lookups do not need per-crime precision, so
+# crimes are bucketed by (grid cell, year-month) key. Each distinct key is looked
+# up once per provider, results are kept in a persistent TTL cache, and the
+# feature columns are filled back onto the crime frame with a vectorised gather.
+# Cost scales with the number of distinct keys, not the number of crimes.
+
+import json
+import time
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+CACHE_PATH = 'enrichment_cache.sqlite'
+DEFAULT_TTL = 7 * 24 * 3600
+# ~550 m north-south, ~350 m east-west at Bristol's latitude
+DEFAULT_CELL_SIZE = 0.005
+
+
+class TTLCache:
+    # Small sqlite-backed key/value cache shared by all providers
+    def __init__(self, path=CACHE_PATH, ttl=DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            'provider TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, stored_at REAL NOT NULL, '
+            'PRIMARY KEY (provider, key))'
+        )
+        self._conn.commit()
+
+    def get_many(self, provider, keys):
+        cutoff = time.time() - self.ttl
+        found = {}
+        with self._lock:
+            # sqlite limits the number of bound parameters per statement
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f'SELECT key, value FROM cache WHERE provider = ? AND stored_at >= ? AND key IN ({placeholders})',
+                    [provider, cutoff, *chunk],
+                )
+                found.update((key, json.loads(value)) for key, value in rows)
+        return found
+
+    def put_many(self, provider, items):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO cache (provider, key, value, stored_at) VALUES (?, ?, ?, ?)',
+                [(provider, key, json.dumps(value), now) for key, value in items.items()],
+            )
+            self._conn.commit()
+
+    def purge_expired(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM cache WHERE stored_at < ?', (time.time() - self.ttl,))
+            self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+
+def enrichment_keys(df, cell_size=DEFAULT_CELL_SIZE):
+    # Returns (keys, inverse): one row per distinct (cell_row, cell_col, year, month)
+    # with the cell centre, and for every crime the index of its key row.
+    cell_row = np.floor(df['lat'].to_numpy(dtype=np.float64) / cell_size).astype(np.int64)
+    cell_col = np.floor(df['lng'].to_numpy(dtype=np.float64) / cell_size).astype(np.int64)
+    period = df['year'].to_numpy(dtype=np.int64) * 12 + df['month'].to_numpy(dtype=np.int64) - 1
+    # Pack into one int64 (21 + 21 + 16 bits) so np.unique sorts a flat array
+    packed = (((cell_row + (1 << 20)) << 37) | ((cell_col + (1 << 20)) << 16) | period)
+    unique, inverse = np.unique(packed, return_inverse=True)
+    keys = pd.DataFrame({
+        'cell_row': (unique >> 37) - (1 << 20),
+        'cell_col': ((unique >> 16) & ((1 << 21) - 1)) - (1 << 20),
+        'year': (unique & 0xFFFF) // 12,
+        'month': (unique & 0xFFFF) % 12 + 1,
+    })
+    keys['lat'] = (keys['cell_row'] + 0.5) * cell_size
+    keys['lng'] = (keys['cell_col'] + 0.5) * cell_size
+    return keys, inverse.ravel()
+
+
+def _cache_key(row):
+    return f"{row.cell_row}:{row.cell_col}:{row.year}-{row.month:02d}"
+
+
+def _lookup(provider, name, keys, cache, max_workers):
+    # One call per distinct key that is not already cached; returns a list of dicts
+    cache_keys = [_cache_key(row) for row in keys.itertuples(index=False)]
+    cached = cache.get_many(name, cache_keys) if cache is not None else {}
+    missing = [i for i, key in enumerate(cache_keys) if key not in cached]
+
+    lat, lng = keys['lat'].to_numpy(), keys['lng'].to_numpy()
+    year, month = keys['year'].to_numpy(), keys['month'].to_numpy()
+
+    def call(i):
+        value = provider(float(lat[i]), float(lng[i]), f"{year[i]}-{month[i]:02d}")
+        if not isinstance(value, dict):
+            value = {name: value}
+        # numpy scalars are not JSON serialisable
+        return {k: (v.item() if isinstance(v, np.generic) else v) for k, v in value.items()}
+
+    fetched = {}
+    if missing:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for i, value in zip(missing, pool.map(call, missing)):
+                fetched[cache_keys[i]] = value
+        if cache is not None:
+            cache.put_many(name, fetched)
+    print(f"{name}: {len(cache_keys)} distinct keys, {len(cache_keys) - len(missing)} cached, {len(missing)} fetched.")
+    return [cached[key] if key in cached else fetched[key] for key in cache_keys]
+
+
+def enrich(df, providers, cache=None, cell_size=DEFAULT_CELL_SIZE, max_workers=8):
+    # providers: {name: fn(lat, lng, 'YYYY-MM')}. A provider returning a dict adds
+    # one column per dict key; a scalar result adds a column called `name`.
+    if df.empty:
+        return df
+    keys, inverse = enrichment_keys(df, cell_size)
+    df = df.copy()
+    for name, provider in providers.items():
+        results = pd.DataFrame(_lookup(provider, name, keys, cache, max_workers))
+        for col in results.columns:
+            values = results[col]
+            if pd.api.types.is_integer_dtype(values):
+                df[col] = values.to_numpy(dtype=np.int32)[inverse]
+            elif pd.api.types.is_numeric_dtype(values):
+                df[col] = values.to_numpy(dtype=np.float32)[inverse]
+            else:
+                # Gather the codes, not the strings
+                cat = values.astype('category')
+                df[col] = pd.Categorical.from_codes(cat.cat.codes.to_numpy()[inverse], categories=cat.cat.categories)
+    return df
@@ -0,0 +1,69 @@
+# SafeBristol: one-pass normalisation of raw UK Police API records.
+# Turns the list of nested crime dicts returned by crimes-street/all-crime into a
+# flat, typed DataFrame: float32 coordinates, int16 year/month and categorical
+# strings. Each field is gathered with one list comprehension and converted in
+# bulk, and blank-string cleaning runs per distinct category rather than per row.
+# Everything the model and the ward/street analysis need is pulled out of
+# `location` and `outcome_status` here, so later steps never touch the dicts.
+
+import numpy as np
+import pandas as pd
+
+
+def _categorical(values):
+    # Categorical with blank/whitespace-only strings mapped to missing; the check
+    # runs over the (few) distinct values rather than every row.
+    codes, uniques = pd.factorize(np.array(values, dtype=object), sort=True)
+    blank = np.array([not str(u).strip() for u in uniques], dtype=bool)
+    if blank.any():
+        remap = np.where(blank, -1, np.cumsum(~blank) - 1)
+        codes = np.where(codes >= 0, remap[np.maximum(codes, 0)], -1)
+        uniques = uniques[~blank]
+    return pd.Categorical.from_codes(codes, categories=pd.Index(uniques, dtype=object))
+
+
+def _floats(values):
+    # Coordinates arrive as decimal strings; missing ones become NaN
+    return np.array([v or 'nan' for v in values], dtype=np.float32)
+
+
+def _year_month(values):
+    # API months are always 'YYYY-MM'; parse each distinct month once
+    codes, uniques = pd.factorize(np.array(values, dtype=object))
+    years = np.zeros(len(uniques) + 1, dtype=np.int16)
+    months = np.zeros(len(uniques) + 1, dtype=np.int16)
+    for i, month in enumerate(uniques):
+        month = str(month)
+        if len(month) >= 7 and month[:4].isdigit() and month[5:7].isdigit():
+            years[i], months[i] = int(month[:4]), int(month[5:7])
+    # Code -1 (missing month) indexes the trailing zero
+    return years[codes], months[codes]
+
+
+def normalise_crimes(records):
+    empty = {}
+    locations = [c.get('location') or empty for c in records]
+    streets = [loc.get('street') or empty for loc in locations]
+    outcomes = [c.get('outcome_status') or empty for c in records]
+    years, months = _year_month([c.get('month') for c in records])
+
+    df = pd.DataFrame({
+        'id': np.array([c.get('id') or 0 for c in records], dtype=np.int64),
+        # Blank persistent ids (e.g. anti-social behaviour) become missing
+        'persistent_id': pd.Series([c.get('persistent_id') or None for c in records], dtype=object),
+        'category': _categorical([c.get('category') for c in records]),
+        'year': years,
+        'month': months,
+        'lat': _floats([loc.get('latitude') for loc in locations]),
+        'lng': _floats([loc.get('longitude') for loc in locations]),
+        'street_id': np.array([-1 if s.get('id') is None else s['id'] for s in streets], dtype=np.int64),
+        'street_name': _categorical([s.get('name') for s in streets]),
+        'ward': _categorical([loc.get('ward') for loc in locations]),
+        'location_type': _categorical([c.get('location_type') for c in records]),
+        'location_subtype': _categorical([c.get('location_subtype') for c in records]),
+        'outcome_category': _categorical([o.get('category') for o in outcomes]),
+        'outcome_date': _categorical([o.get('date') for o in outcomes]),
+        'context': _categorical([c.get('context') for c in records]),
+    })
+    df['category_code'] = df['category'].cat.codes.astype(np.int16)
+    return df
@@ -0,0 +1,211 @@
+# SafeBristol: next-month crime-count forecasts per grid cell or ward.
+# Crimes are collapsed into a dense float32 tensor of counts [unit, month], where a
+# unit is a spatial index cell (or any label column such as a ward). Each unit gets
+# its own linear model on log1p counts: intercept, lags, the mean of the same
+# calendar month in earlier years and the city's monthly weather. All units are
+# fitted together as one batched ridge solve, shrunk towards a pooled city-wide
+# model so sparse cells borrow strength. A forecast for every unit is a single
+# einsum over the next month's feature rows.
+
+import numpy as np
+import pandas as pd
+
+from .spatial_index import BASE_LEVEL, cell_bounds, cell_keys, coarsen
+
+DEFAULT_LEVEL = 15                 # ~760 m cells at Bristol's latitude
+LAGS = (1, 2, 3, 12)
+WEATHER_COLUMNS = ('temperature', 'precipitation_sum')
+RIDGE = 5.0
+
+
+class CountTensor:
+    def __init__(self, units, first_period, counts, lat, lng, unit='cell', level=None):
+        # units: unit labels (cell keys or names); counts: float32 [unit, month] from first_period
+        self.units = np.asarray(units)
+        self.first_period = int(first_period)
+        self.counts = np.asarray(counts, dtype=np.float32)
+        self.lat = np.asarray(lat, dtype=np.float32)
+        self.lng = np.asarray(lng, dtype=np.float32)
+        self.unit = unit
+        self.level = level
+
+    @classmethod
+    def _from_arrays(cls, keys, years, months, lat, lng, weights, unit, level):
+        years = pd.to_numeric(pd.Series(years), errors='coerce').to_numpy(dtype=np.float64)
+        months = pd.to_numeric(pd.Series(months), errors='coerce').to_numpy(dtype=np.float64)
+        periods = years * 12 + months - 1
+        valid = ~np.isnan(periods) & pd.notna(keys)
+        periods = periods[valid].astype(np.int64)
+        weights = np.ones(valid.sum()) if weights is None else np.asarray(weights, dtype=np.float64)[valid]
+        codes, units = pd.factorize(np.asarray(keys)[valid], sort=True)
+        first = int(periods.min())
+        n_units, n_periods = len(units), int(periods.max()) - first + 1
+        counts = np.bincount(codes * n_periods + (periods - first), weights=weights,
+                             minlength=n_units * n_periods).reshape(n_units, n_periods)
+        total = np.bincount(codes, weights=weights, minlength=n_units)
+        lat = np.bincount(codes, weights=np.asarray(lat, dtype=np.float64)[valid] * weights, minlength=n_units) / total
+        lng = np.bincount(codes, weights=np.asarray(lng, dtype=np.float64)[valid] * weights, minlength=n_units) / total
+        return cls(np.asarray(units), first, counts, lat, lng, unit, level)
+
+    @classmethod
+    def build(cls, df, unit='cell', level=DEFAULT_LEVEL, weight=None):
+        # df: crimes with year, month, lat, lng; unit='cell' or the name of a label column (e.g. 'ward')
+        df = df.dropna(subset=['lat', 'lng'])
+        lat = df['lat'].to_numpy(dtype=np.float64)
+        lng = df['lng'].to_numpy(dtype=np.float64)
+        keys = cell_keys(lat, lng, level) if unit == 'cell' else df[unit].astype(object).to_numpy()
+        weights = df[weight].to_numpy(dtype=np.float64) if weight else None
+        return cls._from_arrays(keys, df['year'], df['month'], lat, lng, weights, unit,
+                                level if unit == 'cell' else None)
+
+    @classmethod
+    def from_cube(cls, cube, mask=None, level=DEFAULT_LEVEL, base_level=BASE_LEVEL):
+        # Same tensor from a CrimeCube with year, month and cell dimensions, without the raw crimes
+        selected = slice(None) if mask is None else mask
+        counts = cube.counts[selected]
+        keys = np.asarray(cube.labels['cell'], dtype=np.int64)[cube.codes['cell'][selected]]
+        years = np.asarray(cube.labels['year'], dtype=object)[cube.codes['year'][selected]]
+        months = np.asarray(cube.labels['month'], dtype=object)[cube.codes['month'][selected]]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            lat = cube.lat_sum[selected] / counts
+            lng = cube.lng_sum[selected] / counts
+        return cls._from_arrays(coarsen(keys, base_level, level), years, months, lat, lng, counts, 'cell', level)
+
+    @property
+    def n_periods(self):
+        return self.counts.shape[1]
+
+    def period_label(self, index):
+        period = self.first_period + index
+        return f'{period // 12}-{period % 12 + 1:02d}'
+
+    def year_month(self, indexes):
+        periods = self.first_period + np.asarray(indexes, dtype=np.int64)
+        return periods // 12, periods % 12 + 1
+
+    def unit_bounds(self):
+        # (south, west, north, east) of every cell unit
+        return cell_bounds(self.units.astype(np.int64), self.level)
+
+    def save(self, path):
+        np.savez(path, units=self.units, counts=self.counts, lat=self.lat, lng=self.lng,
+                 first_period=self.first_period, unit=self.unit, level=-1 if self.level is None else self.level)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            level = int(data['level'])
+            return cls(data['units'], int(data['first_period']), data['counts'], data['lat'], data['lng'],
+                       str(data['unit']), None if level < 0 else level)
+
+
+def _weather_matrix(weather, years, months, columns):
+    # [month, column] city weather standardised over the whole series; months outside
+    # the series take the calendar-month climatology
+    if weather is None or not columns:
+        return np.zeros((len(years), 0), dtype=np.float32)
+    values = np.array(weather.monthly_features(years, months, list(columns))[list(columns)], dtype=np.float64)
+    months = np.asarray(months, dtype=np.int64)
+    series_months = (weather.first_period + np.arange(len(weather.monthly_condition))) % 12 + 1
+    for j, col in enumerate(columns):
+        series = weather.monthly[col].astype(np.float64)
+        mean, std = np.nanmean(series), np.nanstd(series)
+        climate = pd.Series(series).groupby(series_months).mean().reindex(range(1, 13)).fillna(mean).to_numpy()
+        missing = np.isnan(values[:, j])
+        values[missing, j] = climate[months[missing] - 1]
+        values[:, j] = (values[:, j] - mean) / (std if std > 0 else 1.0)
+    return values.astype(np.float32)
+
+
+class CellForecaster:
+    def __init__(self, lags=LAGS, ridge=RIDGE, weather=None, weather_columns=WEATHER_COLUMNS):
+        self.lags = tuple(lags)
+        self.ridge = ridge
+        self.weather = weather
+        self.weather_columns = tuple(weather_columns) if weather is not None else ()
+
+    def _design(self, y, targets, weather_rows):
+        # Feature tensor [unit, target month, feature] for predicting y[:, targets]
+        n_units = y.shape[0]
+        seasonal = self._seasonal(y, targets)
+        columns = [np.ones((n_units, len(targets)), dtype=np.float32)]
+        columns += [y[:, targets - lag] for lag in self.lags]
+        columns.append(seasonal)
+        columns += [np.broadcast_to(weather_rows[:, j], (n_units, len(targets))) for j in range(weather_rows.shape[1])]
+        return np.stack(columns, axis=2)
+
+    @staticmethod
+    def _seasonal(y, targets):
+        # Mean of the same calendar month in all earlier years (y is already log1p)
+        out = np.zeros((y.shape[0], len(targets)), dtype=np.float32)
+        for i, t in enumerate(targets):
+            previous = y[:, t - 12::-12] if t >= 12 else y[:, :0]
+            out[:, i] = previous.mean(axis=1) if previous.shape[1] else 0.0
+        return out
+
+    def _weather_rows(self, tensor, targets):
+        years, months = tensor.year_month(targets)
+        return _weather_matrix(self.weather, years, months, self.weather_columns)
+
+    def fit(self, tensor, through=None):
+        # Fits on months up to index `through` (default: all); returns self
+        through = tensor.n_periods - 1 if through is None else through
+        y = np.log1p(tensor.counts[:, :through + 1])
+        targets = np.arange(max(self.lags), through + 1)
+        if len(targets) < 2:
+            raise ValueError(f'Need more than {max(self.lags) + 1} months of counts to fit, got {through + 1}')
+        X = self._design(y, targets, self._weather_rows(tensor, targets))
+        Y = y[:, targets]
+        XtX = np.einsum('utk,utl->ukl', X, X, dtype=np.float64)
+        XtY = np.einsum('utk,ut->uk', X, Y, dtype=np.float64)
+        k = X.shape[2]
+        penalty = self.ridge * np.eye(k)
+        penalty[0, 0] = 0.0
+        # Pooled city-wide coefficients, then per-unit coefficients shrunk towards them
+        self.pooled = np.linalg.solve(XtX.sum(axis=0) + penalty, XtY.sum(axis=0))
+        self.coef = np.linalg.solve(XtX + penalty, (XtY + penalty @ self.pooled)[:, :, None])[:, :, 0].astype(np.float32)
+        self.through = through
+        return self
+
+    def predict(self, tensor, target=None):
+        # Expected counts per unit for month index `target` (default: the month after training);
+        # lags come from the tensor's observed counts
+        target = self.through + 1 if target is None else target
+        padded = tensor.counts
+        if target >= tensor.n_periods:
+            padded = np.concatenate([padded, np.zeros((len(padded), target - tensor.n_periods + 1), dtype=np.float32)], axis=1)
+        y = np.log1p(padded)
+        targets = np.array([target])
+        X = self._design(y, targets, self._weather_rows(tensor, targets))[:, 0, :]
+        return np.maximum(np.expm1(np.einsum('uk,uk->u', X, self.coef)), 0.0)
+
+    def backtest(self, tensor, months=3):
+        # One-step-ahead errors over the last `months` months, refitting before each,
+        # against repeating last month's count
+        rows = []
+        for target in range(tensor.n_periods - months, tensor.n_periods):
+            predicted = self.fit(tensor, through=target - 1).predict(tensor, target)
+            actual = tensor.counts[:, target]
+            rows.append({'month': tensor.period_label(target),
+                         'mae': float(np.abs(predicted - actual).mean()),
+                         'naive_mae': float(np.abs(tensor.counts[:, target - 1] - actual).mean()),
+                         'actual_total': float(actual.sum()),
+                         'predicted_total': float(predicted.sum())})
+        self.fit(tensor)
+        return pd.DataFrame(rows)
+
+
+def forecast_next_month(tensor, weather=None, **params):
+    # Risk surface for the month after the tensor ends: one row per unit with its centroid,
+    # expected count and risk relative to the highest-risk unit
+    forecaster = CellForecaster(weather=weather, **params).fit(tensor)
+    expected = forecaster.predict(tensor)
+    peak = expected.max() if len(expected) and expected.max() > 0 else 1.0
+    return pd.DataFrame({
+        'unit': tensor.units,
+        'lat': tensor.lat,
+        'lng': tensor.lng,
+        'expected': expected.astype(np.float32),
+        'risk': (expected / peak).astype(np.float32),
+        'month': tensor.period_label(tensor.n_periods),
+    })
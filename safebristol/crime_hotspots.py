@@ -0,0 +1,209 @@
+# SafeBristol: gridded crime density (KDE) surfaces by binned FFT convolution.
+# Crimes are assigned once to cells of a regular grid (square in metres) over the
+# city. A surface for any (category, period) key is a bincount of the matching
+# crimes' cells convolved with a Gaussian kernel through the FFT: the cost depends
+# on the grid size, not on the number of crimes. Surfaces are cached per key in
+# memory and, optionally, as .npz files named by the key and a fingerprint of the
+# binned crimes (so re-ingested or revised data never hits a stale file), and are exposed as arrays for plotting,
+# as point lists for map layers and as per-location values for model features.
+
+import os
+import re
+import hashlib
+import collections
+
+import numpy as np
+import pandas as pd
+from scipy.signal import fftconvolve
+
+HOTSPOT_CACHE_DIR = 'hotspot_cache'
+DEFAULT_CELL_M = 50.0
+METRES_PER_DEGREE = 111320.0
+KERNEL_SIGMAS = 4                      # kernel truncated at 4 standard deviations
+MAX_CACHED_SURFACES = 64
+
+
+def scott_bandwidth(lat, lng):
+    # Scott's rule on locally projected coordinates, in metres (the seaborn kdeplot default)
+    lat = np.asarray(lat, dtype=np.float64)
+    lng = np.asarray(lng, dtype=np.float64)
+    if len(lat) < 2:
+        return 200.0
+    y = lat * METRES_PER_DEGREE
+    x = lng * METRES_PER_DEGREE * np.cos(np.radians(lat.mean()))
+    return float(np.sqrt(x.std() * y.std()) * len(lat) ** (-1 / 6))
+
+
+def gaussian_kernel(bandwidth_m, cell_m):
+    # Normalised 2-D Gaussian sampled on the grid, truncated at KERNEL_SIGMAS
+    sigma = max(bandwidth_m / cell_m, 0.5)
+    radius = int(np.ceil(KERNEL_SIGMAS * sigma))
+    offsets = np.arange(-radius, radius + 1)
+    profile = np.exp(-0.5 * (offsets / sigma) ** 2)
+    kernel = np.outer(profile, profile)
+    return kernel / kernel.sum()
+
+
+class HotspotSurface:
+    def __init__(self, density, south, west, cell_lat, cell_lng, cell_m, key=None):
+        # density: float32 [row (south->north), col (west->east)], expected crimes per km²
+        self.density = density
+        self.south = south
+        self.west = west
+        self.cell_lat = cell_lat
+        self.cell_lng = cell_lng
+        self.cell_m = cell_m
+        self.key = key
+
+    @property
+    def extent(self):
+        # (west, east, south, north) for matplotlib imshow
+        rows, cols = self.density.shape
+        return self.west, self.west + cols * self.cell_lng, self.south, self.south + rows * self.cell_lat
+
+    def centres(self):
+        rows, cols = self.density.shape
+        return (self.south + (np.arange(rows) + 0.5) * self.cell_lat,
+                self.west + (np.arange(cols) + 0.5) * self.cell_lng)
+
+    def sample(self, lat, lng):
+        # Density at each location (nearest cell); 0 outside the grid. Usable as a model feature.
+        rows = np.floor((np.asarray(lat, dtype=np.float64) - self.south) / self.cell_lat)
+        cols = np.floor((np.asarray(lng, dtype=np.float64) - self.west) / self.cell_lng)
+        inside = (rows >= 0) & (rows < self.density.shape[0]) & (cols >= 0) & (cols < self.density.shape[1])
+        values = np.zeros(len(rows), dtype=np.float32)
+        values[inside] = self.density[rows[inside].astype(np.int64), cols[inside].astype(np.int64)]
+        return values
+
+    def points(self, thresh=0.05):
+        # (lat, lng, density) of cells above thresh x the peak, for map layers
+        peak = self.density.max()
+        if peak <= 0:
+            empty = np.empty(0)
+            return empty, empty, empty
+        rows, cols = np.nonzero(self.density >= thresh * peak)
+        lat, lng = self.centres()
+        return lat[rows], lng[cols], self.density[rows, cols]
+
+    def levels(self, n=10, thresh=0.05):
+        # Contour levels from thresh x peak to the peak, like kdeplot(fill=True, thresh=...)
+        peak = float(self.density.max())
+        return np.linspace(thresh * peak, peak, n + 1) if peak > 0 else np.array([0.0, 1.0])
+
+
+def _period_range(period):
+    # None (all history), 2024 / '2024' (calendar year), '2024-05' (month), or a
+    # (start, end) pair of 'YYYY-MM' strings (inclusive) -> (first, last) month index
+    if period is None:
+        return None
+    if isinstance(period, tuple):
+        return _period_range(period[0])[0], _period_range(period[1])[1]
+    text = str(period)
+    match = re.fullmatch(r'(\d{4})-(\d{1,2})', text)
+    if match:
+        value = int(match.group(1)) * 12 + int(match.group(2)) - 1
+        return value, value
+    if re.fullmatch(r'\d{4}', text):
+        return int(text) * 12, int(text) * 12 + 11
+    raise ValueError(f'Unrecognised period: {period!r}')
+
+
+class HotspotEngine:
+    def __init__(self, df, cell_m=DEFAULT_CELL_M, bandwidth_m=None, bounds=None, cache_dir=None):
+        # df: crimes with lat, lng and optionally category, year, month.
+        # bounds: (south, west, north, east); default is the data extent plus the kernel reach.
+        df = df.dropna(subset=['lat', 'lng'])
+        lat = df['lat'].to_numpy(dtype=np.float64)
+        lng = df['lng'].to_numpy(dtype=np.float64)
+        self.cell_m = cell_m
+        self.bandwidth_m = bandwidth_m or scott_bandwidth(lat, lng)
+        self.kernel = gaussian_kernel(self.bandwidth_m, cell_m)
+        ref_lat = float(np.mean(lat)) if len(lat) else 51.45
+        self.cell_lat = cell_m / METRES_PER_DEGREE
+        self.cell_lng = cell_m / (METRES_PER_DEGREE * np.cos(np.radians(ref_lat)))
+        if bounds is None:
+            margin = self.kernel.shape[0] // 2
+            south, west = lat.min() - margin * self.cell_lat, lng.min() - margin * self.cell_lng
+            north, east = lat.max() + margin * self.cell_lat, lng.max() + margin * self.cell_lng
+        else:
+            south, west, north, east = bounds
+        self.south, self.west = float(south), float(west)
+        self.n_rows = int(np.ceil((north - south) / self.cell_lat)) + 1
+        self.n_cols = int(np.ceil((east - west) / self.cell_lng)) + 1
+
+        # Per-crime cell index, category code and month index, computed once
+        rows = np.floor((lat - self.south) / self.cell_lat).astype(np.int64)
+        cols = np.floor((lng - self.west) / self.cell_lng).astype(np.int64)
+        inside = (rows >= 0) & (rows < self.n_rows) & (cols >= 0) & (cols < self.n_cols)
+        self.cells = np.where(inside, rows * self.n_cols + cols, -1)
+        if 'category' in df:
+            self.category_codes, categories = pd.factorize(df['category'].astype(object), sort=True)
+            self._category_index = {name: i for i, name in enumerate(categories)}
+        else:
+            self.category_codes, self._category_index = np.zeros(len(df), dtype=np.int64), {}
+        if {'year', 'month'}.issubset(df.columns):
+            years = pd.to_numeric(df['year'], errors='coerce').to_numpy(dtype=np.float64)
+            months = pd.to_numeric(df['month'], errors='coerce').to_numpy(dtype=np.float64)
+            self.periods = np.nan_to_num(years * 12 + months - 1, nan=-1).astype(np.int64)
+        else:
+            self.periods = np.full(len(df), -1, dtype=np.int64)
+        self.cache_dir = cache_dir
+        self._cache = collections.OrderedDict()
+        self._fingerprint = None
+
+    @property
+    def categories(self):
+        return list(self._category_index)
+
+    @property
+    def fingerprint(self):
+        # Digest of the grid and every crime's cell, category and month, computed on first use
+        if self._fingerprint is None:
+            digest = hashlib.sha1(repr((self.south, self.west, self.n_rows, self.n_cols, self.categories)).encode())
+            for array in (self.cells, self.category_codes, self.periods):
+                digest.update(np.ascontiguousarray(array, dtype=np.int64).tobytes())
+            self._fingerprint = digest.hexdigest()[:16]
+        return self._fingerprint
+
+    def _cache_path(self, key):
+        name = re.sub(r'[^A-Za-z0-9_.-]+', '_', '__'.join(str(part) for part in key + (self.fingerprint,)))
+        return os.path.join(self.cache_dir, f'{name}.npz')
+
+    def counts(self, category=None, period=None):
+        # Binned crime counts [row, col] for the key, before smoothing
+        selected = self.cells >= 0
+        if category is not None:
+            selected &= self.category_codes == self._category_index.get(category, -2)
+        period_range = _period_range(period)
+        if period_range is not None:
+            selected &= (self.periods >= period_range[0]) & (self.periods <= period_range[1])
+        counts = np.bincount(self.cells[selected], minlength=self.n_rows * self.n_cols)
+        return counts.reshape(self.n_rows, self.n_cols).astype(np.float32)
+
+    def surface(self, category=None, period=None):
+        # Density surface for a (category, period) key; None means all categories / all history
+        key = (category or 'all', str(period) if period is not None else 'all', int(self.cell_m), int(self.bandwidth_m))
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        density = None
+        if self.cache_dir and os.path.exists(self._cache_path(key)):
+            with np.load(self._cache_path(key)) as data:
+                if data['density'].shape == (self.n_rows, self.n_cols) and str(data['fingerprint']) == self.fingerprint:
+                    density = data['density']
+        if density is None:
+            smoothed = fftconvolve(self.counts(category, period), self.kernel, mode='same')
+            # Crimes per km²; FFT round-off can leave tiny negatives
+            density = np.maximum(smoothed, 0).astype(np.float32) / (self.cell_m / 1000.0) ** 2
+            if self.cache_dir:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                np.savez(self._cache_path(key), density=density, fingerprint=self.fingerprint)
+        surface = HotspotSurface(density, self.south, self.west, self.cell_lat, self.cell_lng, self.cell_m, key)
+        self._cache[key] = surface
+        if len(self._cache) > MAX_CACHED_SURFACES:
+            self._cache.popitem(last=False)
+        return surface
+
+    def features(self, lat, lng, category=None, period=None):
+        # Hotspot density at each location, e.g. as a model feature
+        return self.surface(category, period).sample(lat, lng)
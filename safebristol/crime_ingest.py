@@ -0,0 +1,494 @@
+# SafeBristol: concurrent, resumable ingest of UK Police street-level crime data.
+# Months are fetched in parallel through one pooled HTTP session, throttled by a
+# shared token bucket, retried with exponential backoff on 429/5xx, and written
+# to per-month checkpoint files so a crashed run resumes where it stopped.
+# A manifest of ingested months (fetch time, record count, content hash) lets
+# later runs fetch only missing months plus a trailing window of recent ones.
+# Regions too large for one police.uk request are fetched as an adaptive
+# quadtree of tiles (iter_region_months).
+
+import os
+import json
+import math
+import time
+import hashlib
+import datetime
+import random
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+API_URL = 'https://data.police.uk/api/crimes-street/all-crime'
+BRISTOL_POLY = '51.4645,-2.6200:51.4645,-2.5400:51.4300,-2.5400:51.4300,-2.6200'
+CHECKPOINT_DIR = 'crime_checkpoints'
+MANIFEST_FILE = 'manifest.json'
+# Wider areas for region-wide ingest (see iter_region_months): greater Bristol and the
+# Avon & Somerset force area, as bounding rectangles
+GREATER_BRISTOL_POLY = '51.5600,-2.7500:51.5600,-2.4400:51.3700,-2.4400:51.3700,-2.7500'
+AVON_SOMERSET_POLY = '51.7000,-3.8500:51.7000,-2.2400:50.8200,-2.2400:50.8200,-3.8500'
+TILE_DIR = 'tiles'
+SPLITS_FILE = 'splits.json'
+MIN_TILE_DEG = 0.002                   # ~200 m; tiles are not split below this
+# Recent months are re-fetched on every run because police.uk revises them
+# (late outcomes, relocated crimes) for a while after first publication.
+DEFAULT_REFRESH_WINDOW = 3
+
+# data.police.uk allows 15 requests/second with bursts of up to 30.
+DEFAULT_RATE = 15
+DEFAULT_BURST = 30
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRY_DELAY_S = 60.0              # longest wait between attempts, whatever Retry-After says
+
+
+class MonthFetchError(Exception):
+    pass
+
+
+class TooManyCrimes(MonthFetchError):
+    # police.uk answers 503 when a custom area holds more than 10,000 crimes
+    pass
+
+
+def month_range(start, end):
+    # Inclusive list of 'YYYY-MM' strings between two 'YYYY-MM' strings
+    year, month = (int(p) for p in start.split('-'))
+    end_year, end_month = (int(p) for p in end.split('-'))
+    months = []
+    while (year, month) <= (end_year, end_month):
+        months.append(f"{year}-{month:02d}")
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+    return months
+
+
+class TokenBucket:
+    # Thread-safe token bucket: `rate` tokens per second, at most `capacity` banked
+    def __init__(self, rate=DEFAULT_RATE, capacity=DEFAULT_BURST):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def make_session(pool_size=8):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def checkpoint_path(checkpoint_dir, date_str):
+    return os.path.join(checkpoint_dir, f"{date_str}.json")
+
+
+def load_checkpoint(checkpoint_dir, date_str):
+    path = checkpoint_path(checkpoint_dir, date_str)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        # A truncated file from a crashed run is treated as missing
+        return None
+
+
+def save_checkpoint(checkpoint_dir, date_str, crimes):
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    path = checkpoint_path(checkpoint_dir, date_str)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(crimes, f)
+    os.replace(tmp_path, path)
+
+
+def content_hash(crimes):
+    # Order-independent digest of a month's records, used to detect revisions
+    digest = hashlib.sha256()
+    for line in sorted(json.dumps(c, sort_keys=True) for c in crimes):
+        digest.update(line.encode())
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+def load_manifest(checkpoint_dir):
+    path = os.path.join(checkpoint_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(checkpoint_dir, manifest):
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    path = os.path.join(checkpoint_dir, MANIFEST_FILE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def manifest_entry(crimes, fetched_at=None):
+    if fetched_at is None:
+        fetched_at = datetime.datetime.now(datetime.timezone.utc)
+    return {
+        'fetched_at': fetched_at.isoformat(timespec='seconds'),
+        'records': len(crimes),
+        'sha256': content_hash(crimes),
+    }
+
+
+def months_to_fetch(months, manifest, refresh_window=DEFAULT_REFRESH_WINDOW):
+    # Months missing from the manifest plus the trailing `refresh_window` months
+    months = list(months)
+    refresh = set(months[-refresh_window:]) if refresh_window > 0 else set()
+    return [m for m in months if m not in manifest or m in refresh]
+
+
+def _retry_delay(response, attempt, backoff, max_delay=MAX_RETRY_DELAY_S):
+    # The server's Retry-After when it is a sane number of seconds, else exponential backoff with jitter
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    delay = backoff * (2 ** attempt) + random.uniform(0, backoff)
+    if retry_after:
+        try:
+            seconds = float(retry_after)
+        except ValueError:
+            seconds = math.nan
+        if not math.isnan(seconds):
+            delay = seconds
+    return min(max(delay, 0.0), max_delay)
+
+
+def fetch_month(session, date_str, poly=BRISTOL_POLY, api_url=API_URL, bucket=None,
+                max_retries=5, backoff=1.0, timeout=30, split_on_503=False):
+    # Returns the list of crimes for one month ([] for a published month without
+    # crimes in the area), None if the month is not published yet (404), or raises
+    # MonthFetchError once the retries are exhausted. With split_on_503 a 503 raises
+    # TooManyCrimes at once so the caller can split the area.
+    params = {'poly': poly, 'date': date_str}
+    for attempt in range(max_retries + 1):
+        if bucket is not None:
+            bucket.acquire()
+        response = None
+        try:
+            response = session.get(api_url, params=params, timeout=timeout)
+        except requests.RequestException as exc:
+            error = f"{type(exc).__name__}: {exc}"
+        else:
+            if response.status_code == 200:
+                # A truncated or malformed body is retried like a server error
+                try:
+                    crimes = response.json()
+                except ValueError as exc:
+                    crimes, error = None, f"malformed response body: {exc}"
+                else:
+                    error = f"unexpected response body: {response.text[:200]}"
+                if isinstance(crimes, list):
+                    return [c for c in crimes if c is not None]
+            elif response.status_code == 404:
+                return None
+            else:
+                error = f"status code {response.status_code}"
+                if response.status_code == 503 and split_on_503:
+                    raise TooManyCrimes(f"{date_str}: {error} for poly {poly}")
+                if response.status_code not in RETRY_STATUSES:
+                    raise MonthFetchError(f"{date_str}: {error}: {response.text[:200]}")
+        if attempt < max_retries:
+            time.sleep(_retry_delay(response, attempt, backoff))
+    raise MonthFetchError(f"{date_str}: {error} after {max_retries + 1} attempts")
+
+
+def _record_month(checkpoint_dir, manifest, date_str, crimes):
+    # Checkpoint a freshly fetched month if its content changed and update the manifest.
+    # Unpublished months (404 -> None) are not checkpointed so they are retried next run;
+    # published months without crimes are, so they are not fetched again.
+    if crimes is None:
+        print(f"{date_str}: not published yet.")
+    elif checkpoint_dir:
+        entry = manifest_entry(crimes)
+        previous = manifest.get(date_str)
+        if previous is None or previous['sha256'] != entry['sha256']:
+            save_checkpoint(checkpoint_dir, date_str, crimes)
+            status = 'new' if previous is None else 'changed'
+        else:
+            status = 'unchanged'
+        manifest[date_str] = entry
+        save_manifest(checkpoint_dir, manifest)
+        print(f"{date_str}: {len(crimes)} records fetched ({status}).")
+    else:
+        print(f"{date_str}: {len(crimes)} records fetched.")
+
+
+def iter_months(months, poly=BRISTOL_POLY, api_url=API_URL, checkpoint_dir=CHECKPOINT_DIR,
+                max_workers=8, rate=DEFAULT_RATE, burst=DEFAULT_BURST, max_retries=5,
+                backoff=1.0, session=None, refresh_window=0, failed=None):
+    # Yields (date_str, crimes) in month order. Months recorded in the manifest are read
+    # from their checkpoint when their turn comes, unless they fall in the trailing
+    # `refresh_window`; the rest are fetched concurrently with at most 2 * max_workers
+    # months in flight, so only a bounded number of months is ever held in memory.
+    # Months that fail are recorded in `failed` ({date_str: error message}).
+    months = list(months)
+    failed = {} if failed is None else failed
+    manifest = load_manifest(checkpoint_dir) if checkpoint_dir else {}
+    for date_str in months:
+        if not checkpoint_dir or not os.path.exists(checkpoint_path(checkpoint_dir, date_str)):
+            manifest.pop(date_str, None)
+        elif date_str not in manifest:
+            # Checkpoint written before the manifest existed: adopt it
+            cached = load_checkpoint(checkpoint_dir, date_str)
+            if cached is not None:
+                mtime = os.path.getmtime(checkpoint_path(checkpoint_dir, date_str))
+                fetched_at = datetime.datetime.fromtimestamp(mtime, datetime.timezone.utc)
+                manifest[date_str] = manifest_entry(cached, fetched_at)
+    pending = months_to_fetch(months, manifest, refresh_window)
+    if len(pending) < len(months):
+        print(f"{len(months) - len(pending)} months loaded from checkpoints, {len(pending)} to fetch.")
+
+    own_session = session is None and bool(pending)
+    if own_session:
+        session = make_session(max_workers)
+    bucket = TokenBucket(rate, burst)
+    queue = iter(pending)
+    pending = set(pending)
+    futures = {}
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            def submit_next():
+                date_str = next(queue, None)
+                if date_str is not None:
+                    futures[date_str] = pool.submit(fetch_month, session, date_str, poly, api_url, bucket,
+                                                    max_retries, backoff)
+
+            for _ in range(2 * max_workers):
+                submit_next()
+            for date_str in months:
+                if date_str not in pending:
+                    crimes = load_checkpoint(checkpoint_dir, date_str) if checkpoint_dir else None
+                    if crimes is not None:
+                        yield date_str, crimes
+                    continue
+                future = futures.pop(date_str)
+                submit_next()
+                try:
+                    crimes = future.result()
+                except MonthFetchError as exc:
+                    failed[date_str] = str(exc)
+                    print(f"{date_str}: Failed to fetch data. {exc}")
+                    # Keep serving the last good copy of a month we were only refreshing
+                    cached = load_checkpoint(checkpoint_dir, date_str) if checkpoint_dir else None
+                    if cached is not None:
+                        yield date_str, cached
+                    continue
+                _record_month(checkpoint_dir, manifest, date_str, crimes)
+                yield date_str, crimes if crimes is not None else []
+    finally:
+        for future in futures.values():
+            future.cancel()
+        if own_session:
+            session.close()
+        if checkpoint_dir:
+            save_manifest(checkpoint_dir, manifest)
+
+
+def fetch_months(months, poly=BRISTOL_POLY, api_url=API_URL, checkpoint_dir=CHECKPOINT_DIR,
+                 max_workers=8, rate=DEFAULT_RATE, burst=DEFAULT_BURST, max_retries=5,
+                 backoff=1.0, session=None, refresh_window=0):
+    # Fetch every month concurrently (see iter_months) and keep them all in memory.
+    # Returns ({date_str: crimes}, {date_str: error message}).
+    failed = {}
+    crimes_by_month = dict(iter_months(months, poly, api_url, checkpoint_dir, max_workers, rate, burst,
+                                       max_retries, backoff, session, refresh_window, failed))
+    return crimes_by_month, failed
+
+
+def parse_poly(poly):
+    # 'lat,lng:lat,lng:...' -> float64 array [vertex, (lat, lng)]
+    return np.array([[float(v) for v in point.split(',')] for point in poly.split(':')], dtype=np.float64)
+
+
+def tile_poly(bounds):
+    # (south, west, north, east) -> police.uk poly string of the rectangle
+    south, west, north, east = bounds
+    return f'{north:.6f},{west:.6f}:{north:.6f},{east:.6f}:{south:.6f},{east:.6f}:{south:.6f},{west:.6f}'
+
+
+def tile_bounds(root_bounds, path):
+    # Bounds of a quadtree tile; path is a string of quadrants 0-3 (0=SW, 1=SE, 2=NW, 3=NE)
+    south, west, north, east = root_bounds
+    for quadrant in path:
+        mid_lat, mid_lng = (south + north) / 2, (west + east) / 2
+        q = int(quadrant)
+        south, north = (mid_lat, north) if q >= 2 else (south, mid_lat)
+        west, east = (mid_lng, east) if q % 2 else (west, mid_lng)
+    return south, west, north, east
+
+
+def points_in_poly(lat, lng, vertices):
+    # Even-odd ray casting for many points against one polygon, vectorised over points
+    lat = np.asarray(lat, dtype=np.float64)
+    lng = np.asarray(lng, dtype=np.float64)
+    inside = np.zeros(len(lat), dtype=bool)
+    y0, x0 = vertices[-1]
+    for y1, x1 in vertices:
+        crosses = (y1 > lat) != (y0 > lat)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = x1 + (lat - y1) * (x0 - x1) / (y0 - y1)
+        inside ^= crosses & (lng < x_cross)
+        y0, x0 = y1, x1
+    return inside
+
+
+def crime_key(crime):
+    # Identity of a crime across overlapping tiles: its id, else its persistent id
+    return crime.get('id') or crime.get('persistent_id') or json.dumps(crime, sort_keys=True)
+
+
+def dedupe_crimes(crimes):
+    unique = {}
+    for crime in crimes:
+        unique.setdefault(crime_key(crime), crime)
+    return list(unique.values())
+
+
+def _in_region(crimes, vertices):
+    locations = [c.get('location') or {} for c in crimes]
+    lat = [float(loc.get('latitude') or 'nan') for loc in locations]
+    lng = [float(loc.get('longitude') or 'nan') for loc in locations]
+    inside = points_in_poly(lat, lng, vertices)
+    return [c for c, keep in zip(crimes, inside) if keep]
+
+
+def _load_splits(region_dir):
+    path = os.path.join(region_dir, SPLITS_FILE)
+    try:
+        with open(path) as f:
+            return set(json.load(f))
+    except (OSError, ValueError):
+        return set()
+
+
+def _save_splits(region_dir, splits):
+    os.makedirs(region_dir, exist_ok=True)
+    path = os.path.join(region_dir, SPLITS_FILE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(sorted(splits), f)
+    os.replace(tmp_path, path)
+
+
+def iter_region_months(months, poly=GREATER_BRISTOL_POLY, api_url=API_URL, checkpoint_dir=CHECKPOINT_DIR,
+                       max_workers=8, rate=DEFAULT_RATE, burst=DEFAULT_BURST, max_retries=5, backoff=1.0,
+                       session=None, refresh_window=0, failed=None, min_tile_deg=MIN_TILE_DEG):
+    # Yields (date_str, crimes) in month order for a region of any size. The region's
+    # bounding box is covered by a quadtree of rectangular tiles: a tile that police.uk
+    # rejects as too large (503) is split into four and its children fetched instead.
+    # Tiles of a month are fetched in parallel through one throttled session. Each
+    # (tile, month) is checkpointed under <checkpoint_dir>/tiles/<region>/<tile>/, and
+    # tiles that ever needed splitting are remembered so later months and runs start
+    # from their children. Crimes are deduplicated across tile edges by id/persistent_id
+    # and clipped to the region polygon. Months with a tile that could not be fetched
+    # are recorded in `failed` and not yielded.
+    months = list(months)
+    failed = {} if failed is None else failed
+    vertices = parse_poly(poly)
+    root_bounds = (vertices[:, 0].min(), vertices[:, 1].min(), vertices[:, 0].max(), vertices[:, 1].max())
+    region = hashlib.sha1(poly.encode()).hexdigest()[:10]
+    region_dir = os.path.join(checkpoint_dir, TILE_DIR, region) if checkpoint_dir else None
+    splits = _load_splits(region_dir) if region_dir else set()
+    refresh = set(months[-refresh_window:]) if refresh_window > 0 else set()
+
+    own_session = session is None
+    if own_session:
+        session = make_session(max_workers)
+    bucket = TokenBucket(rate, burst)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for date_str in months:
+                crimes, errors, requests_made = [], [], 0
+                futures = {}
+
+                def visit(path):
+                    # Cached leaf, known split, or a fetch to schedule
+                    tile_dir = os.path.join(region_dir, path or 'root') if region_dir else None
+                    if tile_dir and date_str not in refresh:
+                        cached = load_checkpoint(tile_dir, date_str)
+                        if cached is not None:
+                            crimes.extend(cached)
+                            return
+                    if path in splits:
+                        for quadrant in '0123':
+                            visit(path + quadrant)
+                        return
+                    tile = tile_poly(tile_bounds(root_bounds, path))
+                    futures[pool.submit(fetch_month, session, date_str, tile, api_url, bucket,
+                                        max_retries, backoff, 30, True)] = (path, tile_dir)
+
+                visit('')
+                while futures:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        path, tile_dir = futures.pop(future)
+                        requests_made += 1
+                        try:
+                            tile_crimes = future.result()
+                        except TooManyCrimes as exc:
+                            south, west, north, east = tile_bounds(root_bounds, path)
+                            if min(north - south, east - west) / 2 < min_tile_deg:
+                                errors.append(str(exc))
+                                continue
+                            splits.add(path)
+                            if region_dir:
+                                _save_splits(region_dir, splits)
+                            for quadrant in '0123':
+                                visit(path + quadrant)
+                            continue
+                        except MonthFetchError as exc:
+                            errors.append(str(exc))
+                            continue
+                        if tile_crimes is None:
+                            # Not published yet (404): nothing to cache, retried next run
+                            continue
+                        crimes.extend(tile_crimes)
+                        # Empty tiles are cached too, so sparse areas are not refetched every run
+                        if tile_dir:
+                            save_checkpoint(tile_dir, date_str, tile_crimes)
+                if errors:
+                    failed[date_str] = '; '.join(errors)
+                    print(f"{date_str}: Failed to fetch {len(errors)} tiles. {errors[0]}")
+                    continue
+                crimes = _in_region(dedupe_crimes(crimes), vertices)
+                if requests_made:
+                    print(f"{date_str}: {len(crimes)} records ({requests_made} tile requests).")
+                yield date_str, crimes
+    finally:
+        if own_session:
+            session.close()
+
+
+def fetch_region_months(months, poly=GREATER_BRISTOL_POLY, **params):
+    # Every month of a region in memory (see iter_region_months).
+    # Returns ({date_str: crimes}, {date_str: error message}).
+    failed = {}
+    crimes_by_month = dict(iter_region_months(months, poly, failed=failed, **params))
+    return crimes_by_month, failed
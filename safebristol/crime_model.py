@@ -0,0 +1,314 @@
+# SafeBristol: versioned model artifacts and low-latency scoring.
+# A trained estimator is saved with everything needed to use it later: the
+# feature list, the category labels behind category_code, the weather code
+# mapping, default feature values and evaluation metrics. Artifacts live in
+# models/<name>/<version>/ with a LATEST pointer per model name. Forests are also
+# exported as flat NumPy arrays (forest/, one .npy per array, memory-mapped on
+# load) that score with NumPy alone, so a scoring process starts without importing
+# scikit-learn, joblib or pandas and processes serving one model share its pages. Loading
+# happens once per process, after which scoring a batch is one vectorised predict
+# and a single location is a one-row predict.
+
+import os
+import io
+import json
+import datetime
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+MODELS_DIR = 'models'
+MODEL_FILE = 'model.joblib'
+FOREST_DIR = 'forest'
+LEGACY_FOREST_FILE = 'forest.npz'
+METADATA_FILE = 'metadata.json'
+LATEST_FILE = 'LATEST'
+
+
+def _write_atomic(path, text):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class ForestArrays:
+    # A fitted sklearn tree ensemble flattened into NumPy arrays, all trees' nodes back to
+    # back. predict_proba matches the forest's (mean of per-tree leaf class proportions)
+    # and walks every tree for a block of rows at once.
+    ROW_BLOCK = 8192
+    ARRAYS = ('roots', 'left', 'right', 'feature', 'threshold', 'missing_left', 'value', 'classes')
+
+    def __init__(self, roots, left, right, feature, threshold, missing_left, value, classes):
+        self.roots = roots
+        self.left = left
+        self.right = right
+        self.feature = feature
+        self.threshold = threshold
+        self.missing_left = missing_left
+        self.value = value
+        self.classes_ = classes
+
+    @classmethod
+    def from_forest(cls, forest):
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        sizes = np.array([tree.node_count for tree in trees])
+        offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+
+        def children(side):
+            # Leaves keep -1; internal nodes point into the concatenated arrays
+            return np.concatenate([np.where(side(tree) >= 0, side(tree) + offset, -1)
+                                   for tree, offset in zip(trees, offsets)]).astype(np.int32)
+
+        values = np.concatenate([tree.value[:, 0, :] for tree in trees])
+        totals = values.sum(axis=1, keepdims=True)
+        return cls(offsets.astype(np.int32),
+                   children(lambda tree: tree.children_left),
+                   children(lambda tree: tree.children_right),
+                   np.concatenate([tree.feature for tree in trees]).astype(np.int32),
+                   np.concatenate([tree.threshold for tree in trees]),
+                   np.concatenate([getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count, dtype=np.uint8))
+                                   for tree in trees]).astype(bool),
+                   (values / np.where(totals > 0, totals, 1)).astype(np.float32),
+                   # String labels are stored as fixed-width strings, which need no pickling
+                   np.asarray(forest.classes_, dtype=None if np.asarray(forest.classes_).dtype != object else str))
+
+    def _arrays(self):
+        return (self.roots, self.left, self.right, self.feature, self.threshold, self.missing_left, self.value,
+                self.classes_)
+
+    def save(self, path):
+        # One plain .npy per array under the directory `path`, so load can memory-map them
+        os.makedirs(path, exist_ok=True)
+        for key, array in zip(self.ARRAYS, self._arrays()):
+            np.save(os.path.join(path, f'{key}.npy'), np.ascontiguousarray(array), allow_pickle=False)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        # A directory written by save (memory-mapped), or a forest.npz from older versions (read in full)
+        if path.endswith('.npz'):
+            with np.load(path) as data:
+                return cls(*(data[key] for key in cls.ARRAYS))
+        return cls(*(np.load(os.path.join(path, f'{key}.npy'), mmap_mode=mmap_mode) for key in cls.ARRAYS))
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        proba = np.empty((len(X), self.value.shape[1]), dtype=np.float64)
+        for start in range(0, len(X), self.ROW_BLOCK):
+            block = X[start:start + self.ROW_BLOCK]
+            node = np.broadcast_to(self.roots, (len(block), len(self.roots))).copy()
+            active = self.left[node] >= 0
+            while active.any():
+                r, t = np.nonzero(active)
+                current = node[r, t]
+                x = block[r, self.feature[current]]
+                go_left = np.where(np.isnan(x), self.missing_left[current], x <= self.threshold[current])
+                node[r, t] = np.where(go_left, self.left[current], self.right[current])
+                active[r, t] = self.left[node[r, t]] >= 0
+            proba[start:start + len(block)] = self.value[node].mean(axis=1)
+        return proba
+
+
+def save_model(estimator, features, category_labels, name='random_forest', root=MODELS_DIR,
+               weather_codes=None, training_frame=None, metrics=None, extra=None):
+    # Writes a new version of `name` and points LATEST at it. Returns the version directory.
+    import joblib
+    version = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%S%f')
+    version_dir = os.path.join(root, name, version)
+    os.makedirs(version_dir)
+    # Uncompressed so the estimator's arrays can be memory-mapped on load
+    joblib.dump(estimator, os.path.join(version_dir, MODEL_FILE), compress=0)
+    if _is_forest(estimator):
+        ForestArrays.from_forest(estimator).save(os.path.join(version_dir, FOREST_DIR))
+    defaults = {}
+    if training_frame is not None:
+        # Medians fill any feature an online caller does not supply
+        defaults = {col: float(training_frame[col].median()) for col in features}
+    metadata = {
+        'name': name,
+        'version': version,
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'estimator': type(estimator).__name__,
+        'features': list(features),
+        'category_labels': [str(label) for label in category_labels],
+        'weather_codes': weather_codes or {},
+        'defaults': defaults,
+        'metrics': metrics or {},
+    }
+    metadata.update(extra or {})
+    with open(os.path.join(version_dir, METADATA_FILE), 'w') as f:
+        json.dump(metadata, f, indent=1)
+    _write_atomic(os.path.join(root, name, LATEST_FILE), version)
+    return version_dir
+
+
+def _is_forest(estimator):
+    trees = getattr(estimator, 'estimators_', None)
+    return isinstance(trees, list) and bool(trees) and all(hasattr(t, 'tree_') for t in trees)
+
+
+def list_versions(name='random_forest', root=MODELS_DIR):
+    model_dir = os.path.join(root, name)
+    if not os.path.isdir(model_dir):
+        return []
+    return sorted(v for v in os.listdir(model_dir) if os.path.isfile(os.path.join(model_dir, v, METADATA_FILE)))
+
+
+def latest_version(name='random_forest', root=MODELS_DIR):
+    path = os.path.join(root, name, LATEST_FILE)
+    if os.path.exists(path):
+        with open(path) as f:
+            return f.read().strip()
+    versions = list_versions(name, root)
+    return versions[-1] if versions else None
+
+
+class CrimeModel:
+    def __init__(self, estimator, metadata):
+        self.estimator = estimator
+        self.metadata = metadata
+        self.features = metadata['features']
+        self.labels = np.asarray(metadata['category_labels'], dtype=object)
+        self.defaults = metadata.get('defaults', {})
+        self.version = metadata.get('version')
+        # Classes seen in training, as indexes into labels. Models trained on re-encoded
+        # labels (crime_training) record the mapping in their metadata.
+        classes = metadata.get('classes', getattr(estimator, 'classes_', np.arange(len(self.labels))))
+        self.classes = np.asarray(classes, dtype=np.int64)
+        # Forests score single rows through their NumPy arrays (no per-call validation)
+        if isinstance(estimator, ForestArrays):
+            self._forest = estimator
+        else:
+            self._forest = ForestArrays.from_forest(estimator) if _is_forest(estimator) else None
+        self._defaults_row = np.array([self.defaults.get(col, np.nan) for col in self.features], dtype=np.float32)
+        self._feature_index = {col: i for i, col in enumerate(self.features)}
+
+    @classmethod
+    def load(cls, name='random_forest', root=MODELS_DIR, version=None, compiled=True):
+        # compiled: use the NumPy export of a forest when there is one; otherwise (and with
+        # compiled=False) unpickle the fitted estimator, memory-mapping its arrays
+        version = version or latest_version(name, root)
+        if version is None:
+            raise FileNotFoundError(f"No saved versions of model '{name}' under {root}/")
+        version_dir = os.path.join(root, name, version)
+        with open(os.path.join(version_dir, METADATA_FILE)) as f:
+            metadata = json.load(f)
+        for forest_path in (FOREST_DIR, LEGACY_FOREST_FILE):
+            if compiled and os.path.exists(os.path.join(version_dir, forest_path)):
+                return cls(ForestArrays.load(os.path.join(version_dir, forest_path)), metadata)
+        import joblib
+        estimator = joblib.load(os.path.join(version_dir, MODEL_FILE), mmap_mode='r')
+        return cls(estimator, metadata)
+
+    def _frame(self, df):
+        # float32 feature matrix in training order; missing features fall back to training medians.
+        # Estimators fitted on a DataFrame get one back so their feature-name check passes.
+        import pandas as pd
+        if not isinstance(df, pd.DataFrame):
+            df = pd.DataFrame(df)
+        X = np.empty((len(df), len(self.features)), dtype=np.float32)
+        for i, col in enumerate(self.features):
+            if col in df:
+                X[:, i] = pd.to_numeric(df[col], errors='coerce')
+            else:
+                X[:, i] = self.defaults.get(col, np.nan)
+        if hasattr(self.estimator, 'feature_names_in_'):
+            return pd.DataFrame(X, columns=self.features, index=df.index)
+        return X
+
+    def predict_proba(self, df):
+        return self.estimator.predict_proba(self._frame(df))
+
+    def predict(self, df):
+        # Category label per row
+        proba = self.predict_proba(df)
+        return self.labels[self.classes[np.argmax(proba, axis=1)]]
+
+    def score_location(self, lat, lng, top=5, **features):
+        # Online path: one location (plus optional feature values) -> ranked categories
+        if 'year' not in features or 'month' not in features:
+            today = datetime.date.today()
+            features.setdefault('year', today.year)
+            features.setdefault('month', today.month)
+        features.update(lat=lat, lng=lng)
+        if self._forest is None:
+            proba = self.predict_proba({key: [value] for key, value in features.items()})[0]
+        else:
+            row = self._defaults_row.copy()
+            for key, value in features.items():
+                if key in self._feature_index:
+                    row[self._feature_index[key]] = value
+            proba = self._forest.predict_proba(row[None, :])[0][:len(self.classes)]
+        best = np.argsort(proba)[::-1][:top]
+        return [{'category': str(self.labels[self.classes[i]]), 'probability': float(proba[i])} for i in best]
+
+
+class _ScoringHandler(BaseHTTPRequestHandler):
+    model = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        # /score?lat=51.45&lng=-2.59[&year=2025&month=7&temperature=...]
+        url = urlparse(self.path)
+        if url.path == '/health':
+            return self._send_json({'model': self.model.metadata.get('name'), 'version': self.model.version})
+        if url.path != '/score':
+            return self._send_json({'error': 'not found'}, 404)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            lat = float(params.pop('lat'))
+            lng = float(params.pop('lng'))
+            top = int(params.pop('top', 5))
+            features = {key: float(value) for key, value in params.items() if key in self.model.features}
+        except (KeyError, ValueError) as exc:
+            return self._send_json({'error': f'bad query: {exc}'}, 400)
+        self._send_json({'version': self.model.version,
+                         'predictions': self.model.score_location(lat, lng, top=top, **features)})
+
+    def do_POST(self):
+        # /predict with a JSON list of feature records -> one category per record
+        if urlparse(self.path).path != '/predict':
+            return self._send_json({'error': 'not found'}, 404)
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            records = json.load(io.BytesIO(self.rfile.read(length)))
+            if isinstance(records, dict):
+                records = [records]
+            if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+                raise ValueError('expected a JSON object or a list of objects')
+            import pandas as pd
+            frame = pd.DataFrame.from_records(records)
+        except ValueError as exc:
+            return self._send_json({'error': f'bad body: {exc}'}, 400)
+        self._send_json({'version': self.model.version, 'predictions': self.model.predict(frame).tolist()})
+
+
+def make_server(model, host='localhost', port=8504):
+    handler = type('ScoringHandler', (_ScoringHandler,), {'model': model})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def serve(name='random_forest', root=MODELS_DIR, host='localhost', port=8504):
+    model = CrimeModel.load(name, root)
+    httpd = make_server(model, host, port)
+    print(f"Serving {name} {model.version} at http://{host}:{port}/score")
+    httpd.serve_forever()
+
+
+def serve_in_background(model, host='localhost', port=0):
+    # For notebooks and local checks: returns the running server (port 0 picks a free port)
+    httpd = make_server(model, host, port)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
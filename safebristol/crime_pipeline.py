@@ -0,0 +1,165 @@
+# SafeBristol: streaming, out-of-core ingest over month partitions.
+# The in-memory path holds every crime as dicts, then as one DataFrame, then as
+# copies of it. Here each stage is a generator over months: fetch (or read the
+# checkpoint) -> normalise -> enrich (wards, ward statistics, weather) -> write
+# the month's partition to the crime store. While the months stream past, the
+# aggregate cube used by the dashboards and forecasts is built incrementally and
+# a fixed-size uniform sample of crimes is kept as the training set. Only a few
+# months plus the aggregates are in memory at once, however many years or areas
+# are ingested.
+
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from .crime_cube import CrimeCube
+from .crime_features import normalise_crimes
+from .crime_ingest import BRISTOL_POLY, iter_months, iter_region_months
+from .crime_store import STORE_DIR, write_crimes
+
+CUBE_DIMS = ['year', 'month', 'category', 'ward', 'street_name']
+DEFAULT_SAMPLE_ROWS = 500_000
+MERGE_EVERY = 12                       # months of cube chunks folded into the running cube at a time
+WEATHER_COLUMNS = ['temperature', 'precipitation_sum', 'rainy_days', 'weather_code']
+
+
+class Reservoir:
+    # Uniform random sample of at most `capacity` rows from a stream of DataFrames
+    # (Algorithm R, vectorised per chunk). Rows are kept inside their source chunk so
+    # per-chunk categoricals survive; a chunk is compacted once most of its rows
+    # have been replaced, so memory stays around `capacity` rows.
+    def __init__(self, capacity=DEFAULT_SAMPLE_ROWS, random_state=None):
+        self.capacity = int(capacity)
+        self.seen = 0
+        self.rng = np.random.default_rng(random_state)
+        self._slot_chunk = np.full(self.capacity, -1, dtype=np.int64)
+        self._slot_row = np.zeros(self.capacity, dtype=np.int64)
+        self._chunks = {}
+        self._next_chunk = 0
+
+    def __len__(self):
+        return int(min(self.seen, self.capacity))
+
+    def add(self, df):
+        n = len(df)
+        if n == 0:
+            return
+        positions = self.seen + np.arange(n)
+        slots = np.where(positions < self.capacity, positions, self.rng.integers(0, positions + 1))
+        rows = np.flatnonzero(slots < self.capacity)
+        slots = slots[rows]
+        self.seen += n
+        if not len(rows):
+            return
+        # Later rows win a contested slot, as in the sequential algorithm
+        _, last = np.unique(slots[::-1], return_index=True)
+        keep = len(slots) - 1 - last
+        slots, rows = slots[keep], rows[keep]
+        chunk = self._next_chunk
+        self._next_chunk += 1
+        self._chunks[chunk] = df.iloc[rows].reset_index(drop=True)
+        self._slot_chunk[slots] = chunk
+        self._slot_row[slots] = np.arange(len(rows))
+        self._compact()
+
+    def _compact(self):
+        live = np.bincount(self._slot_chunk[self._slot_chunk >= 0], minlength=self._next_chunk)
+        for chunk in list(self._chunks):
+            if live[chunk] == 0:
+                del self._chunks[chunk]
+            elif live[chunk] * 2 < len(self._chunks[chunk]):
+                slots = np.flatnonzero(self._slot_chunk == chunk)
+                self._chunks[chunk] = self._chunks[chunk].iloc[self._slot_row[slots]].reset_index(drop=True)
+                self._slot_row[slots] = np.arange(len(slots))
+
+    def frame(self):
+        # The sample as one DataFrame in stream order; categoricals get the union of categories
+        pieces = []
+        for chunk in sorted(self._chunks):
+            rows = np.sort(self._slot_row[self._slot_chunk == chunk])
+            pieces.append(self._chunks[chunk].iloc[rows])
+        if not pieces:
+            return pd.DataFrame()
+        columns = {}
+        for col in pieces[0].columns:
+            parts = [piece[col] for piece in pieces if col in piece]
+            if isinstance(parts[0].dtype, pd.CategoricalDtype) and len(parts) == len(pieces):
+                columns[col] = pd.Series(union_categoricals([p.astype('category') for p in parts],
+                                                            sort_categories=True))
+            else:
+                columns[col] = pd.concat(parts, ignore_index=True)
+        return pd.DataFrame(columns)
+
+
+def iter_frames(month_records):
+    # (date_str, raw records) -> (date_str, normalised frame), one month at a time
+    for date_str, crimes in month_records:
+        crimes = [c for c in crimes if c is not None]
+        if crimes:
+            yield date_str, normalise_crimes(crimes)
+
+
+def add_wards(df, ward_index=None, ward_stats=None):
+    # WARD_CODE / WARD_NAME from the ward boundaries and the ward's official statistics
+    if ward_index is None or 'WARD_CODE' in df:
+        return df
+    df = ward_index.assign(df)
+    df['ward'] = df['WARD_NAME']
+    if ward_stats is not None:
+        ward_features = ward_stats.features(df['WARD_CODE'], df['year'], df['month'])
+        ward_features.index = df.index
+        df = df.join(ward_features)
+    return df
+
+
+def add_weather(df, weather_store=None, columns=WEATHER_COLUMNS):
+    if weather_store is None or 'temperature' in df:
+        return df
+    return weather_store.add_monthly_features(df, columns=columns)
+
+
+def iter_enriched(frames, weather_store=None, ward_index=None, ward_stats=None):
+    for date_str, df in frames:
+        df = df.dropna(subset=['lat', 'lng'])
+        yield date_str, add_weather(add_wards(df, ward_index, ward_stats), weather_store)
+
+
+def stream_crimes(months, poly=BRISTOL_POLY, store_dir=STORE_DIR, weather_store=None, ward_index=None,
+                  ward_stats=None, cube_dims=CUBE_DIMS, sample_rows=DEFAULT_SAMPLE_ROWS, random_state=0,
+                  refresh_window=0, write=True, tiled=False, **fetch_params):
+    # Runs fetch -> normalise -> enrich -> write month by month. Returns
+    # (cube, sample, report): the CrimeCube over every streamed crime, a uniform
+    # sample of at most sample_rows crimes for training, and a summary. tiled=True
+    # fetches areas too large for one request as a quadtree of tiles.
+    failed = {}
+    fetch = iter_region_months if tiled else iter_months
+    records = fetch(months, poly=poly, refresh_window=refresh_window, failed=failed, **fetch_params)
+    reservoir = Reservoir(sample_rows, random_state)
+    cube, chunks = None, []
+    streamed_months, rows = 0, 0
+    for date_str, df in iter_enriched(iter_frames(records), weather_store, ward_index, ward_stats):
+        if write and store_dir:
+            write_crimes(df, store_dir)
+        chunks.append(CrimeCube.build(df, cube_dims))
+        if len(chunks) >= MERGE_EVERY:
+            cube = CrimeCube.concat(([cube] if cube is not None else []) + chunks)
+            chunks = []
+        reservoir.add(df)
+        streamed_months += 1
+        rows += len(df)
+    if chunks:
+        cube = CrimeCube.concat(([cube] if cube is not None else []) + chunks)
+    sample = reservoir.frame()
+    if 'category' in sample:
+        # Per-month category codes are only meaningful within their month; recode on the union
+        sample['category_code'] = sample['category'].cat.codes.astype(np.int16)
+    report = {
+        'months': streamed_months,
+        'records': rows,
+        'failed': failed,
+        'sample_rows': len(sample),
+        'store_dir': os.path.abspath(store_dir) if write and store_dir else None,
+    }
+    return cube, sample, report
@@ -0,0 +1,173 @@
+# SafeBristol: stage timing and memory profiling.
+# A StageProfiler records, for every named stage (a numbered step of
+# Safebristol-model.py, a dashboard loader, a benchmark stage), its wall time,
+# CPU time, peak resident memory and throughput in rows per second. Finished
+# stages are kept as plain dicts, appended as JSON lines to a sink file when one
+# is configured (SAFEBRISTOL_PROFILE) and can be written out as one JSON report.
+
+import os
+import sys
+import json
+import time
+import datetime
+import functools
+import threading
+import contextlib
+
+PROFILE_ENV = 'SAFEBRISTOL_PROFILE'
+
+
+def reset_peak_rss():
+    # Linux resets the process's resident high-water mark on writing 5 to clear_refs
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    # /proc on Linux, getrusage elsewhere on POSIX, psutil (if installed) on Windows;
+    # 0.0 where the platform offers no measurement
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        pass
+    else:
+        # ru_maxrss is in bytes on macOS, kilobytes elsewhere
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024
+    try:
+        import psutil
+    except ImportError:
+        return 0.0
+    memory = psutil.Process().memory_info()
+    return getattr(memory, 'peak_wset', memory.rss) / 2 ** 20
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+class StageProfiler:
+    def __init__(self, sink=None, run=None):
+        # sink: path of a JSON-lines file receiving each finished stage (default: $SAFEBRISTOL_PROFILE)
+        self.sink = sink if sink is not None else os.environ.get(PROFILE_ENV)
+        self.run = run or datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%S')
+        self.records = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def begin(self, name, rows=None):
+        # Peaks are per stage: the high-water mark is folded into any enclosing stages, then reset
+        current_peak = peak_rss_mb()
+        for open_stage in self._stack:
+            open_stage['_peak'] = max(open_stage['_peak'], current_peak)
+        resettable = reset_peak_rss()
+        self._stack.append({
+            'stage': name,
+            'rows': rows,
+            '_wall': time.perf_counter(),
+            '_cpu': time.process_time(),
+            '_peak': rss_mb() if resettable else current_peak,
+            'rss_start_mb': round(rss_mb(), 1),
+            'started_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        })
+
+    def end(self, rows=None):
+        # Finishes the innermost open stage and returns its record
+        stage = self._stack.pop()
+        wall = time.perf_counter() - stage.pop('_wall')
+        cpu = time.process_time() - stage.pop('_cpu')
+        peak = max(stage.pop('_peak'), peak_rss_mb())
+        if self._stack:
+            self._stack[-1]['_peak'] = max(self._stack[-1]['_peak'], peak)
+        rows = stage['rows'] if rows is None else rows
+        record = {
+            'run': self.run,
+            'stage': stage['stage'],
+            'wall_s': round(wall, 4),
+            'cpu_s': round(cpu, 4),
+            'peak_rss_mb': round(peak, 1),
+            'rss_start_mb': stage['rss_start_mb'],
+            'rows': None if rows is None else int(rows),
+            'rows_per_s': round(rows / wall, 1) if rows and wall > 0 else None,
+            'started_at': stage['started_at'],
+        }
+        with self._lock:
+            self.records.append(record)
+            if self.sink:
+                with open(self.sink, 'a') as f:
+                    f.write(json.dumps(record) + '\n')
+        return record
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=None):
+        # with profiler.stage('4. Weather', rows=len(df)) as stage: ...; stage['rows'] may be set inside
+        self.begin(name, rows)
+        stage = self._stack[-1]
+        try:
+            yield stage
+        finally:
+            self.end(stage['rows'])
+
+    def summary(self):
+        return {'run': self.run, 'stages': list(self.records)}
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=1)
+        return path
+
+    def print_table(self):
+        print(f"{'stage':<36}{'wall s':>10}{'cpu s':>10}{'peak MB':>10}{'rows/s':>14}")
+        for r in self.records:
+            rate = f"{r['rows_per_s']:,.0f}" if r['rows_per_s'] else '-'
+            print(f"{r['stage']:<36}{r['wall_s']:>10.2f}{r['cpu_s']:>10.2f}{r['peak_rss_mb']:>10.0f}{rate:>14}")
+
+
+# Process-wide profiler for the dashboards; set SAFEBRISTOL_PROFILE to collect its records
+PROFILER = StageProfiler()
+
+
+def profiled(name=None, profiler=None, rows=len):
+    # Decorator timing every call of a function as a stage. rows(result) gives the row
+    # count for throughput (default len; None to skip).
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            target = profiler or PROFILER
+            target.begin(name or fn.__name__)
+            result = None
+            try:
+                result = fn(*args, **kwargs)
+                return result
+            finally:
+                try:
+                    count = rows(result) if rows is not None and result is not None else None
+                except TypeError:
+                    count = None
+                target.end(count)
+        return wrapper
+    return decorate
@@ -0,0 +1,168 @@
+# SafeBristol: persisted category/ward/street counts and monthly trends.
+# For each rollup dimension the store keeps integer arrays keyed by that
+# dimension's label codes: crimes per label and month, and per label and crime
+# category (for ward and street), plus crimes per month overall. They live next
+# to the data (crime_store/_rollups.npz, skipped by the Parquet reader) and are
+# updated by crime_store.write_crimes as partitions are written: the partitions a
+# write replaces are subtracted and the new rows added, so the rollups always
+# match the store without a rescan. Top-N rankings and trend series are then read
+# from the arrays; a ranking is sorted once per update and sliced after that.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+ROLLUP_FILE = '_rollups.npz'
+ROLLUP_DIMS = ['category', 'ward', 'street_name']
+
+
+class CrimeRollups:
+    def __init__(self, labels=None, first_period=0, by_month=None, by_category=None, month_totals=None):
+        # labels: {dim: label array}; by_month: {dim: int64 [label, period]};
+        # by_category: {dim: int64 [label, category code]} for dims other than category;
+        # month_totals: int64 [period]; period = year * 12 + month - 1, from first_period
+        self.labels = {dim: np.asarray(labels[dim], dtype=object) if labels else np.array([], dtype=object)
+                       for dim in ROLLUP_DIMS}
+        self.first_period = int(first_period)
+        self.month_totals = np.zeros(0, dtype=np.int64) if month_totals is None else np.asarray(month_totals, np.int64)
+        n_periods = len(self.month_totals)
+        self.by_month = {dim: np.zeros((len(self.labels[dim]), n_periods), dtype=np.int64) if by_month is None
+                         else np.asarray(by_month[dim], dtype=np.int64) for dim in ROLLUP_DIMS}
+        n_categories = len(self.labels['category'])
+        self.by_category = {dim: np.zeros((len(self.labels[dim]), n_categories), dtype=np.int64) if by_category is None
+                            else np.asarray(by_category[dim], dtype=np.int64) for dim in ROLLUP_DIMS[1:]}
+        self._index = {dim: {label: code for code, label in enumerate(self.labels[dim])} for dim in ROLLUP_DIMS}
+        self._rankings = {}
+
+    @classmethod
+    def build(cls, df):
+        rollups = cls()
+        rollups.add(df)
+        return rollups
+
+    def _codes(self, dim, values):
+        # Label codes of a column (-1 for missing), registering labels not seen before
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            categories, codes = values.cat.categories, values.cat.codes.to_numpy()
+        else:
+            codes, categories = pd.factorize(values.astype(object))
+        index = self._index[dim]
+        new = [label for label in categories if label not in index]
+        if new:
+            for label in new:
+                index[label] = len(index)
+            self.labels[dim] = np.append(self.labels[dim], np.asarray(new, dtype=object))
+            grow = len(self.labels[dim]) - len(self.by_month[dim])
+            self.by_month[dim] = np.pad(self.by_month[dim], ((0, grow), (0, 0)))
+            if dim in self.by_category:
+                self.by_category[dim] = np.pad(self.by_category[dim], ((0, grow), (0, 0)))
+            if dim == 'category':
+                for other in self.by_category:
+                    self.by_category[other] = np.pad(self.by_category[other], ((0, 0), (0, grow)))
+        mapping = np.array([index[label] for label in categories], dtype=np.int64)
+        return np.where(codes >= 0, mapping[np.maximum(codes, 0)] if len(mapping) else -1, -1)
+
+    def _periods(self, periods):
+        # Grows the period axis to cover `periods`; returns their column indexes
+        if not len(periods):
+            return periods
+        low, high = int(periods.min()), int(periods.max())
+        if not len(self.month_totals):
+            self.first_period = low
+        last_period = max(self.first_period + len(self.month_totals) - 1, low - 1)
+        before, after = max(self.first_period - low, 0), max(high - last_period, 0)
+        if before or after:
+            self.month_totals = np.pad(self.month_totals, (before, after))
+            for dim in ROLLUP_DIMS:
+                self.by_month[dim] = np.pad(self.by_month[dim], ((0, 0), (before, after)))
+            self.first_period -= before
+        return periods - self.first_period
+
+    def add(self, df, sign=1):
+        # Adds (sign=-1: removes) the crimes in df: needs year and month plus any rollup dims present
+        if df.empty:
+            return
+        periods = df['year'].to_numpy(dtype=np.int64) * 12 + df['month'].to_numpy(dtype=np.int64) - 1
+        codes = {dim: self._codes(dim, df[dim]) for dim in ROLLUP_DIMS if dim in df}
+        columns = self._periods(periods)
+        n_periods = len(self.month_totals)
+        self.month_totals += sign * np.bincount(columns, minlength=n_periods)
+        for dim, code in codes.items():
+            valid = code >= 0
+            shape = self.by_month[dim].shape
+            self.by_month[dim] += sign * np.bincount(code[valid] * n_periods + columns[valid],
+                                                     minlength=shape[0] * shape[1]).reshape(shape)
+            if dim in self.by_category and 'category' in codes:
+                both = valid & (codes['category'] >= 0)
+                shape = self.by_category[dim].shape
+                self.by_category[dim] += sign * np.bincount(code[both] * shape[1] + codes['category'][both],
+                                                            minlength=shape[0] * shape[1]).reshape(shape)
+        self._rankings.clear()
+
+    def subtract(self, df):
+        self.add(df, sign=-1)
+
+    def _totals(self, dim, category=None):
+        if category is None:
+            return self.by_month[dim].sum(axis=1)
+        code = self._index['category'].get(category)
+        if code is None:
+            return np.zeros(len(self.labels[dim]), dtype=np.int64)
+        if dim == 'category':
+            return np.where(np.arange(len(self.labels[dim])) == code, self.by_month[dim].sum(axis=1), 0)
+        return self.by_category[dim][:, code]
+
+    def top(self, dim, n=10, category=None):
+        # Series of the n labels with most crimes (optionally of one category), largest first,
+        # as CrimeCube.counts_by(dim).head(n) would give
+        key = (dim, category)
+        if key not in self._rankings:
+            totals = self._totals(dim, category)
+            order = np.argsort(-totals, kind='stable')
+            order = order[totals[order] > 0]
+            self._rankings[key] = (order, totals[order])
+        order, counts = self._rankings[key]
+        order, counts = order if n is None else order[:n], counts if n is None else counts[:n]
+        return pd.Series(counts, index=self.labels[dim][order])
+
+    def counts(self, dim, category=None):
+        # Full value counts of a dimension, largest first
+        return self.top(dim, None, category)
+
+    def total(self):
+        return int(self.month_totals.sum())
+
+    def trend(self, category=None, dim='category'):
+        # Crimes per month (year, month, count) overall or for one label of `dim`
+        if category is None:
+            counts = self.month_totals
+        else:
+            code = self._index[dim].get(category)
+            counts = self.by_month[dim][code] if code is not None else np.zeros_like(self.month_totals)
+        periods = self.first_period + np.arange(len(counts))
+        return pd.DataFrame({'year': periods // 12, 'month': periods % 12 + 1, 'count': counts})
+
+    def save(self, root):
+        path = os.path.join(root, ROLLUP_FILE)
+        arrays = {'first_period': self.first_period, 'month_totals': self.month_totals}
+        for dim in ROLLUP_DIMS:
+            arrays[f'labels_{dim}'] = np.asarray([str(label) for label in self.labels[dim]])
+            arrays[f'by_month_{dim}'] = self.by_month[dim]
+        for dim in self.by_category:
+            arrays[f'by_category_{dim}'] = self.by_category[dim]
+        tmp_path = path + '.tmp.npz'
+        np.savez_compressed(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, root):
+        with np.load(os.path.join(root, ROLLUP_FILE)) as data:
+            return cls({dim: data[f'labels_{dim}'].astype(object) for dim in ROLLUP_DIMS}, int(data['first_period']),
+                       {dim: data[f'by_month_{dim}'] for dim in ROLLUP_DIMS},
+                       {dim: data[f'by_category_{dim}'] for dim in ROLLUP_DIMS[1:]}, data['month_totals'])
+
+
+def rollups_exist(root):
+    return os.path.exists(os.path.join(root, ROLLUP_FILE))
@@ -0,0 +1,166 @@
+# SafeBristol: columnar on-disk crime store shared by the model and the dashboards.
+# Crimes are kept as flat, typed Parquet columns partitioned by year/month
+# (crime_store/year=2024/month=3/...). String columns with few distinct values
+# are stored as Arrow dictionaries and come back as pandas categoricals.
+# Reads support column projection and predicate pushdown, so a dashboard only
+# touches the partitions and columns it actually shows. Every write also keeps
+# the category/ward/street count rollups beside the partitions up to date (see
+# crime_rollups).
+
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from .crime_features import normalise_crimes
+from .crime_rollups import ROLLUP_DIMS, CrimeRollups, rollups_exist
+
+STORE_DIR = 'crime_store'
+PARTITION_COLUMNS = ['year', 'month']
+CATEGORICAL_COLUMNS = ['category', 'ward', 'street_name', 'location_type', 'location_subtype',
+                       'outcome_category', 'weather_condition']
+FLOAT_COLUMNS = ['lat', 'lng', 'temperature', 'transport_safety_index']
+# Codes normalise_crimes numbers per month; read_crimes derives them over the whole read instead
+DERIVED_COLUMNS = ['category_code']
+PARTITIONING = ds.partitioning(pa.schema([('year', pa.int16()), ('month', pa.int16())]), flavor='hive')
+
+
+def prepare_frame(df):
+    # Flatten nested API columns, derive the year/month partition keys and cast
+    # every column to a compact type that survives the Parquet round trip.
+    if 'location' in df.columns or 'outcome_status' in df.columns:
+        # Raw API frame: flatten it with the same stage the model uses
+        df = normalise_crimes(df.to_dict('records'))
+    else:
+        df = df.copy()
+    if 'month' in df.columns and not pd.api.types.is_integer_dtype(df['month']):
+        dates = pd.to_datetime(df['month'], format='%Y-%m', errors='coerce')
+        df['year'] = dates.dt.year
+        df['month'] = dates.dt.month
+    df = df.dropna(subset=PARTITION_COLUMNS)
+    df = df.drop(columns=[col for col in DERIVED_COLUMNS if col in df.columns])
+    for col in PARTITION_COLUMNS:
+        df[col] = df[col].astype(np.int16)
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    for col in FLOAT_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(np.float32)
+    # Any remaining dict/list columns are not representable as flat Parquet
+    nested = [c for c in df.columns if df[c].dtype == object and df[c].map(lambda x: isinstance(x, (dict, list))).any()]
+    return df.drop(columns=nested)
+
+
+def store_exists(root=STORE_DIR):
+    return os.path.isdir(root) and any(name.startswith('year=') for name in os.listdir(root))
+
+
+def store_columns(root=STORE_DIR):
+    # Column names of the stored crimes, partition keys included
+    return ds.dataset(root, format='parquet', partitioning=PARTITIONING).schema.names
+
+
+def _normalise_schema(table):
+    # All-null columns (e.g. no outcomes yet in a fresh month) and large strings
+    # are cast to plain strings so every partition shares one schema.
+    fields = []
+    for field in table.schema:
+        if pa.types.is_null(field.type) or pa.types.is_large_string(field.type):
+            field = field.with_type(pa.string())
+        elif pa.types.is_dictionary(field.type) and not pa.types.is_string(field.type.value_type):
+            field = field.with_type(pa.dictionary(pa.int32(), pa.string()))
+        fields.append(field)
+    return table.cast(pa.schema(fields, metadata=table.schema.metadata))
+
+
+def _rollups_before_write(df, root):
+    # The store's rollups without the partitions `df` is about to replace. A store
+    # written before rollups existed is counted once in full.
+    if not store_exists(root):
+        return CrimeRollups()
+    dims = [dim for dim in ROLLUP_DIMS if dim in store_columns(root)]
+    columns = PARTITION_COLUMNS + dims
+    if not rollups_exist(root):
+        rollups = CrimeRollups.build(read_crimes(root, columns=columns))
+    else:
+        rollups = CrimeRollups.load(root)
+    months = df[PARTITION_COLUMNS].drop_duplicates()
+    replaced = read_crimes(root, columns=columns, filters={'year': set(months['year'].tolist()),
+                                                           'month': set(months['month'].tolist())})
+    # The year and month filters select their cross product; keep only the replaced pairs
+    replaced = replaced.merge(months.astype(replaced[PARTITION_COLUMNS].dtypes.to_dict()), on=PARTITION_COLUMNS)
+    rollups.subtract(replaced)
+    return rollups
+
+
+def write_crimes(df, root=STORE_DIR):
+    # Writes `df` into the store, replacing any year/month partitions it covers
+    df = prepare_frame(df)
+    rollups = _rollups_before_write(df, root)
+    table = _normalise_schema(pa.Table.from_pandas(df, preserve_index=False))
+    ds.write_dataset(
+        table, root, format='parquet', partitioning=PARTITIONING,
+        existing_data_behavior='delete_matching', basename_template='part-{i}.parquet',
+    )
+    if len(df):
+        rollups.add(df)
+        rollups.save(root)
+    return table.num_rows
+
+
+def _filter_expression(filters):
+    # filters: {column: value | [values] | (low, high)} with an inclusive range for tuples
+    expression = None
+    for col, value in (filters or {}).items():
+        field = ds.field(col)
+        if isinstance(value, tuple):
+            low, high = value
+            term = (field >= low) & (field <= high)
+        elif isinstance(value, (list, set, frozenset)):
+            term = field.isin(list(value))
+        else:
+            term = field == value
+        expression = term if expression is None else expression & term
+    return expression
+
+
+def read_crimes(root=STORE_DIR, columns=None, filters=None):
+    # Only the requested columns are decoded and only matching partitions/row groups are read
+    dataset = ds.dataset(root, format='parquet', partitioning=PARTITIONING)
+    stored = None if columns is None else [col for col in columns if col not in DERIVED_COLUMNS]
+    if stored is not None and 'category_code' in columns and 'category' not in stored:
+        stored.append('category')
+    # Stores written before DERIVED_COLUMNS existed still hold month-local codes
+    stored = stored if stored is not None else [col for col in dataset.schema.names if col not in DERIVED_COLUMNS]
+    df = dataset.to_table(columns=stored, filter=_filter_expression(filters)).to_pandas()
+    if 'category' in df and (columns is None or 'category_code' in columns):
+        # One code per category name across every partition read, in sorted order as normalise_crimes gives
+        category = df['category'].astype('category')
+        df['category'] = category.cat.set_categories(sorted(category.cat.categories))
+        df['category_code'] = df['category'].cat.codes.astype(np.int16)
+    return df if columns is None else df[list(columns)]
+
+
+def read_table_cached(path, columns=None, sheet_name=0):
+    # Excel/CSV inputs are converted once to a Parquet file next to the source and
+    # re-read from there until the source changes.
+    cache_path = os.path.splitext(path)[0] + '.parquet'
+    if not os.path.exists(cache_path) or os.path.getmtime(cache_path) < os.path.getmtime(path):
+        if path.endswith('.csv'):
+            df = pd.read_csv(path)
+        else:
+            df = pd.read_excel(path, sheet_name=sheet_name)
+        df.columns = df.columns.astype(str).str.strip()
+        for col in df.columns:
+            if not (pd.api.types.is_object_dtype(df[col]) or pd.api.types.is_string_dtype(df[col])):
+                continue
+            # Spreadsheet columns often mix numbers and strings; Parquet needs one type
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+            if df[col].nunique(dropna=True) < 0.5 * len(df):
+                df[col] = df[col].astype('category')
+        df.to_parquet(cache_path, index=False)
+    return pq.read_table(cache_path, columns=columns).to_pandas()
@@ -0,0 +1,325 @@
+# SafeBristol: parallel, memory-bounded model training with time-based evaluation.
+# Features are packed once into a float32 matrix and labels into small integer
+# codes. Evaluation is rolling-origin by month: every fold trains on all months
+# before a cutoff and tests on the months that follow, and the final model is
+# scored on the most recent months it never saw, so no future crimes leak into
+# training. Folds run in parallel worker processes (joblib shares the feature
+# matrix with them by memory-mapping), each estimator uses the remaining cores,
+# and every fit reports its wall time, CPU time and peak memory.
+# update_model() refreshes a saved model with newly ingested months only: a forest
+# grows extra trees fitted on the new rows, an XGBoost booster keeps boosting, and
+# the candidate replaces the current version only if it scores at least as well
+# on the newest month and the new data uses no categories the saved model lacks.
+
+import os
+import copy
+import time
+import tracemalloc
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.ensemble import HistGradientBoostingClassifier, RandomForestClassifier
+from sklearn.metrics import accuracy_score, f1_score
+from sklearn.tree._tree import Tree
+
+from .crime_model import MODELS_DIR, CrimeModel, save_model
+from .crime_profile import peak_rss_mb, reset_peak_rss
+
+DEFAULT_FOLDS = 3
+DEFAULT_TEST_MONTHS = 6
+DEFAULT_HOLDOUT_MONTHS = 3
+MIN_TRAIN_MONTHS = 24
+
+
+def make_estimator(kind='random_forest', n_jobs=-1, random_state=42, **params):
+    # 'random_forest', 'hist_gradient_boosting' or 'xgboost' (histogram tree method).
+    # Forests are subsampled per tree with a minimum leaf size, which keeps the trees
+    # (and the saved artifact) small on ten years of crimes.
+    if kind == 'random_forest':
+        defaults = dict(n_estimators=100, min_samples_leaf=5, max_samples=0.5)
+        defaults.update(params)
+        return RandomForestClassifier(n_jobs=n_jobs, random_state=random_state, **defaults)
+    if kind == 'hist_gradient_boosting':
+        defaults = dict(max_iter=200, learning_rate=0.1, early_stopping=False)
+        defaults.update(params)
+        return HistGradientBoostingClassifier(random_state=random_state, **defaults)
+    if kind == 'xgboost':
+        from xgboost import XGBClassifier
+        defaults = dict(n_estimators=200, tree_method='hist', max_bin=256, eval_metric='mlogloss')
+        defaults.update(params)
+        return XGBClassifier(n_jobs=n_jobs, random_state=random_state, **defaults)
+    raise ValueError(f'Unknown estimator kind: {kind}')
+
+
+def compact_features(df, features):
+    # One C-contiguous float32 matrix: half the memory of float64 and the dtype the
+    # tree estimators work in internally, so fitting does not copy it again
+    X = np.empty((len(df), len(features)), dtype=np.float32)
+    for i, col in enumerate(features):
+        X[:, i] = df[col].to_numpy(dtype=np.float32, na_value=np.nan)
+    return X
+
+
+def month_periods(years, months):
+    # Months since year 0, so consecutive months differ by one
+    return np.asarray(years, dtype=np.int32) * 12 + np.asarray(months, dtype=np.int32) - 1
+
+
+def period_label(period):
+    return f'{period // 12}-{period % 12 + 1:02d}'
+
+
+def parse_period(label):
+    year, month = label.split('-')
+    return int(year) * 12 + int(month) - 1
+
+
+def rolling_time_folds(periods, n_folds=DEFAULT_FOLDS, test_months=DEFAULT_TEST_MONTHS,
+                       min_train_months=MIN_TRAIN_MONTHS):
+    # Expanding-window folds in chronological order: (train rows, test rows) where every
+    # training month precedes every test month. Folds with too little history are skipped.
+    periods = np.asarray(periods)
+    first, last = int(periods.min()), int(periods.max())
+    folds = []
+    for k in range(n_folds - 1, -1, -1):
+        test_end = last - k * test_months
+        test_start = test_end - test_months + 1
+        if test_start - first < min_train_months:
+            continue
+        train = np.flatnonzero(periods < test_start)
+        test = np.flatnonzero((periods >= test_start) & (periods <= test_end))
+        if len(test):
+            folds.append((train, test))
+    return folds
+
+
+def _fit_and_score(kind, X, y, train, test, n_jobs, random_state, params, keep_estimator=False):
+    # Peak memory is the process's resident high-water mark during the fit where the OS
+    # can reset it, otherwise the peak of Python-tracked allocations (NumPy included)
+    rss_reset = reset_peak_rss()
+    if not rss_reset:
+        tracemalloc.start()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    # Estimators see contiguous class codes; predictions are mapped back before scoring,
+    # so labels absent from the training window simply count as misses
+    classes, y_train = np.unique(y[train], return_inverse=True)
+    estimator = make_estimator(kind, n_jobs=n_jobs, random_state=random_state, **params)
+    estimator.fit(X[train], y_train)
+    y_pred = classes[np.asarray(estimator.predict(X[test])).astype(np.int64).ravel()]
+    if rss_reset:
+        peak_mb = peak_rss_mb()
+    else:
+        peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    result = {
+        'train_rows': int(len(train)),
+        'test_rows': int(len(test)),
+        'accuracy': float(accuracy_score(y[test], y_pred)),
+        'f1_weighted': float(f1_score(y[test], y_pred, average='weighted', zero_division=0)),
+        'wall_seconds': round(time.perf_counter() - wall_start, 3),
+        'cpu_seconds': round(time.process_time() - cpu_start, 3),
+        'peak_mb': round(peak_mb, 1),
+    }
+    if keep_estimator:
+        result['estimator'] = estimator
+        result['classes'] = classes
+    return result
+
+
+def cross_validate(X, y, periods, kind='random_forest', n_folds=DEFAULT_FOLDS, test_months=DEFAULT_TEST_MONTHS,
+                   n_jobs=-1, random_state=42, **params):
+    # Scores each rolling fold in its own worker process; per-estimator threads share the rest
+    folds = rolling_time_folds(periods, n_folds, test_months)
+    if not folds:
+        return []
+    cores = os.cpu_count() if n_jobs in (None, -1) else n_jobs
+    workers = max(1, min(len(folds), cores))
+    threads = max(1, cores // workers)
+    return Parallel(n_jobs=workers)(
+        delayed(_fit_and_score)(kind, X, y, train, test, threads, random_state, params) for train, test in folds)
+
+
+def train_model(df, features, target='category_code', kind='random_forest', n_folds=DEFAULT_FOLDS,
+                test_months=DEFAULT_TEST_MONTHS, holdout_months=DEFAULT_HOLDOUT_MONTHS, n_jobs=-1,
+                random_state=42, **params):
+    # Rolling CV on everything before the holdout months, then a final fit on that same
+    # history scored on the holdout. Returns (estimator, report); report['classes'] maps
+    # the estimator's class indexes back to target codes.
+    X = compact_features(df, features)
+    y = df[target].to_numpy(dtype=np.int16)
+    periods = month_periods(df['year'], df['month'])
+    cutoff = int(periods.max()) - holdout_months + 1
+    history = np.flatnonzero(periods < cutoff)
+    holdout = np.flatnonzero(periods >= cutoff)
+
+    folds = cross_validate(X[history], y[history], periods[history], kind, n_folds, test_months,
+                           n_jobs, random_state, **params)
+    final = _fit_and_score(kind, X, y, history, holdout, n_jobs, random_state, params, keep_estimator=True)
+    estimator = final.pop('estimator')
+    classes = final.pop('classes')
+    report = {
+        'kind': kind,
+        'features': list(features),
+        'classes': classes.tolist(),
+        'trained_through': period_label(cutoff - 1),
+        'holdout_from': period_label(cutoff),
+        'folds': folds,
+        'holdout': final,
+    }
+    print_training_report(report)
+    return estimator, report
+
+
+def print_training_report(report):
+    print(f"{report['kind']}: rolling CV + holdout from {report['holdout_from']}")
+    rows = [(f'fold {i + 1}', fold) for i, fold in enumerate(report['folds'])] + [('holdout', report['holdout'])]
+    for name, r in rows:
+        print(f"  {name:<8} train={r['train_rows']:>8} test={r['test_rows']:>7} "
+              f"acc={r['accuracy']:.3f} f1={r['f1_weighted']:.3f} "
+              f"wall={r['wall_seconds']:.1f}s cpu={r['cpu_seconds']:.1f}s peak={r['peak_mb']:.0f}MB")
+
+
+def _pad_tree_classes(tree, present, n_classes):
+    # A tree fitted on a subset of the classes, re-homed onto the full class axis so
+    # it can sit in a forest fitted on all of them
+    state = tree.tree_.__getstate__()
+    values = np.zeros(state['values'].shape[:2] + (n_classes,), dtype=state['values'].dtype)
+    values[:, :, present] = state['values']
+    state['values'] = values
+    padded = Tree(tree.tree_.n_features, np.array([n_classes], dtype=np.intp), 1)
+    padded.__setstate__(state)
+    tree.tree_ = padded
+    tree.classes_ = np.arange(n_classes)
+    tree.n_classes_ = n_classes
+    return tree
+
+
+def extend_forest(forest, X, y, n_trees=20, random_state=None):
+    # warm_start-style growth that tolerates months missing some classes: the extra trees
+    # are fitted on the new rows alone and appended to a copy of the forest.
+    # y: class indexes of the existing forest.
+    present, y_local = np.unique(y, return_inverse=True)
+    extra = clone(forest).set_params(n_estimators=n_trees, warm_start=False, random_state=random_state)
+    extra.fit(X, y_local)
+    n_classes = len(forest.classes_)
+    candidate = copy.copy(forest)
+    candidate.estimators_ = list(forest.estimators_) + [_pad_tree_classes(t, present, n_classes)
+                                                        for t in extra.estimators_]
+    candidate.n_estimators = len(candidate.estimators_)
+    return candidate
+
+
+def continue_boosting(model, X, y, rounds=50):
+    # More boosting rounds on the new rows, starting from the saved booster
+    import xgboost
+    params = {key: value for key, value in model.get_xgb_params().items() if value is not None}
+    params['num_class'] = len(model.classes_)
+    candidate = copy.copy(model)
+    candidate._Booster = xgboost.train(params, xgboost.DMatrix(X, label=y), num_boost_round=rounds,
+                                       xgb_model=model.get_booster())
+    candidate.n_estimators = (model.n_estimators or 0) + rounds
+    return candidate
+
+
+def _holdout_scores(estimator, classes, X, y):
+    y_pred = classes[np.asarray(estimator.predict(X)).astype(np.int64).ravel()]
+    return {'accuracy': float(accuracy_score(y, y_pred)),
+            'f1_weighted': float(f1_score(y, y_pred, average='weighted', zero_division=0))}
+
+
+def has_training_history(name='random_forest', root=MODELS_DIR):
+    # True when the latest saved version can be refreshed with update_model
+    try:
+        model = CrimeModel.load(name, root)
+    except FileNotFoundError:
+        return False
+    return 'trained_through' in model.metadata.get('training', {})
+
+
+def update_model(df, name='random_forest', root=MODELS_DIR, label='category', holdout_months=1,
+                 extra_trees=20, boost_rounds=50, random_state=None):
+    # Adds the months after the saved model's trained_through to it, holding out the newest
+    # holdout_months for the promotion check. Only rows after trained_through are touched.
+    # Rows are labelled by category name (`label`), not by the frame's own category codes.
+    # Returns the update record (also stored in the new version's metadata when promoted).
+    # The fitted estimator itself (not the NumPy scoring copy) is what gets extended
+    current = CrimeModel.load(name, root, compiled=False)
+    training = current.metadata.get('training')
+    if not training or 'trained_through' not in training:
+        raise ValueError(f"Model '{name}' {current.version} has no training history; retrain it with train_model")
+    trained_through = parse_period(training['trained_through'])
+    periods = month_periods(df['year'], df['month'])
+    cutoff = int(periods.max()) - holdout_months + 1
+    if cutoff <= trained_through + 1:
+        print(f"{name}: no new months after {training['trained_through']} to learn from.")
+        return None
+
+    missing = [col for col in current.features if col not in df.columns]
+    if missing:
+        raise ValueError(f"Model '{name}' {current.version} was trained on {', '.join(missing)}, which the new rows "
+                         f"lack; add them (e.g. ward boundaries for ward_*) or retrain with train_model")
+
+    start = time.perf_counter()
+    rows = np.flatnonzero(periods > trained_through)
+    new = df.iloc[rows]
+    X = compact_features(new, current.features)
+    # A frame's category codes follow the categories present in that frame, so rows are
+    # recoded by name into the saved model's labels; unknown categories get -1
+    label_index = {str(name): i for i, name in enumerate(current.labels)}
+    names = new[label].astype(object)
+    y = names.map(label_index).fillna(-1).to_numpy(dtype=np.int64)
+    unknown_labels = sorted(str(name) for name in names[(y < 0) & names.notna().to_numpy()].unique())
+    fresh = periods[rows] < cutoff
+    holdout = ~fresh
+    # New rows in class-index space; crimes of categories the model has never seen
+    # cannot be learned by extra trees/rounds and are only scored
+    classes = current.classes
+    index = np.clip(np.searchsorted(classes, y), 0, len(classes) - 1)
+    learnable = fresh & (y >= 0) & (classes[index] == y)
+    if not learnable.any():
+        # e.g. a month that failed to ingest, or only categories the model has never seen
+        print(f"{name}: nothing to learn in {period_label(trained_through + 1)}..{period_label(cutoff - 1)}; "
+              f"kept {current.version}.")
+        return {'from_version': current.version,
+                'trained_months': [period_label(trained_through + 1), period_label(cutoff - 1)],
+                'train_rows': 0, 'unknown_labels': unknown_labels, 'promoted': False, 'reason': 'nothing to learn'}
+
+    if hasattr(current.estimator, 'estimators_'):
+        candidate = extend_forest(current.estimator, X[learnable], index[learnable], extra_trees, random_state)
+    elif hasattr(current.estimator, 'get_booster'):
+        candidate = continue_boosting(current.estimator, X[learnable], index[learnable], boost_rounds)
+    else:
+        raise ValueError(f"{type(current.estimator).__name__} cannot be updated incrementally; retrain it with train_model")
+
+    current_scores = _holdout_scores(current.estimator, classes, X[holdout], y[holdout])
+    candidate_scores = _holdout_scores(candidate, classes, X[holdout], y[holdout])
+    # A model cannot be compared fairly on (or serve) categories outside its label space
+    promoted = not unknown_labels and candidate_scores['f1_weighted'] >= current_scores['f1_weighted']
+    update = {
+        'from_version': current.version,
+        'trained_months': [period_label(trained_through + 1), period_label(cutoff - 1)],
+        'train_rows': int(learnable.sum()),
+        'holdout_from': period_label(cutoff),
+        'holdout_rows': int(holdout.sum()),
+        'current': current_scores,
+        'candidate': candidate_scores,
+        'unknown_labels': unknown_labels,
+        'promoted': bool(promoted),
+        'wall_seconds': round(time.perf_counter() - start, 3),
+    }
+    print(f"{name}: +{update['train_rows']} rows ({update['trained_months'][0]}..{update['trained_months'][1]}), "
+          f"holdout f1 {current_scores['f1_weighted']:.3f} -> {candidate_scores['f1_weighted']:.3f}, "
+          f"{'promoted' if promoted else 'kept current'} in {update['wall_seconds']:.1f}s")
+    if unknown_labels:
+        print(f"{name}: {', '.join(unknown_labels)} not among {current.version}'s categories; "
+              f"not promoted, retrain with train_model to learn them.")
+    if promoted:
+        history = dict(training, trained_through=period_label(cutoff - 1), holdout_from=period_label(cutoff),
+                       holdout=candidate_scores, updates=training.get('updates', []) + [update])
+        version_dir = save_model(candidate, current.features, current.labels, name=name, root=root,
+                                 weather_codes=current.metadata.get('weather_codes'), metrics=candidate_scores,
+                                 extra={'classes': classes.tolist(), 'defaults': current.defaults,
+                                        'training': history})
+        update['version_dir'] = version_dir
+    return update
@@ -0,0 +1,245 @@
+# Standalone Plotly Dashboard for SafeBristol Visualization
+# Run with: python app.py [port]  or  safebristol serve dashboard [--port N]
+# The crime store is read once into an in-memory aggregate cube. Every request
+# carries its own ward/street/category filters, answered by slicing the cube; the
+# figure JSON for a filter combination is built once, kept gzipped in an LRU
+# cache and sent with an ETag. The unfiltered view takes its top-N bars and trend
+# from the store's persisted rollups (crime_rollups) instead. The page and the Plotly JS bundle are served from
+# memory, so many users can use the dashboard at once without any file rewrites.
+# Plotly is imported when the first figures are built, not at server start.
+import sys
+import gzip
+import json
+import hashlib
+import threading
+import collections
+import webbrowser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+import numpy as np
+
+from .crime_cube import CrimeCube
+from .crime_profile import profiled
+from .crime_rollups import CrimeRollups, rollups_exist
+from .crime_store import STORE_DIR, read_crimes, store_exists
+
+PORT = 8503
+FILTER_DIMS = ['ward', 'street_name', 'category']
+CUBE_DIMS = FILTER_DIMS + ['year', 'month']
+MAX_CACHED_FIGURES = 256
+MAX_MAP_POINTS = 2000
+
+PAGE_HTML = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>SafeBristol Plotly Dashboard</title>
+<script src="/plotly.min.js"></script></head><body>
+<h1>SafeBristol: AI-Powered Crime Prediction & Safety Dashboard (Plotly)</h1>
+<form id="filters">
+Ward <input name="ward"> Street <input name="street_name"> Category <input name="category">
+<button type="submit">Apply</button>
+</form>
+<p id="status"></p>
+<div id="figures"></div>
+<script>
+async function render(query) {
+  const response = await fetch('/figures' + query);
+  const payload = await response.json();
+  const container = document.getElementById('figures');
+  container.innerHTML = '';
+  document.getElementById('status').textContent = payload.total ? payload.total + ' crimes' : 'No crime data available after filtering.';
+  payload.figures.forEach(function (figure) {
+    const div = document.createElement('div');
+    container.appendChild(div);
+    Plotly.newPlot(div, figure.data, figure.layout, {responsive: true});
+  });
+}
+const form = document.getElementById('filters');
+new URLSearchParams(location.search).forEach(function (value, key) {
+  if (form.elements[key]) { form.elements[key].value = value; }
+});
+form.addEventListener('submit', function (event) {
+  event.preventDefault();
+  const params = new URLSearchParams();
+  new FormData(form).forEach(function (value, key) { if (value) { params.set(key, value); } });
+  const query = params.toString() ? '?' + params.toString() : '';
+  history.replaceState(null, '', '/' + query);
+  render(query);
+});
+render(location.search);
+</script></body></html>
+"""
+
+
+@profiled('app: load_cube')
+def load_cube(root=STORE_DIR):
+    # One row per distinct (ward, street, category, year, month, cell) combination
+    crimes_df = read_crimes(root, columns=['lat', 'lng'] + CUBE_DIMS)
+    return CrimeCube.build(crimes_df, CUBE_DIMS)
+
+
+def _category_cells(cube, mask, limit=MAX_MAP_POINTS):
+    # (lat, lng, count, category) per (spatial cell, category), busiest first, for the map
+    cells = cube.codes['cell'][mask].astype(np.int64)
+    categories = cube.codes['category'][mask].astype(np.int64)
+    keys, inverse = np.unique(cells * len(cube.labels['category']) + categories, return_inverse=True)
+    counts = np.bincount(inverse, weights=cube.counts[mask])
+    import pandas as pd
+    frame = pd.DataFrame({
+        'lat': np.bincount(inverse, weights=cube.lat_sum[mask]) / counts,
+        'lng': np.bincount(inverse, weights=cube.lng_sum[mask]) / counts,
+        'count': counts,
+        'category': np.asarray(cube.labels['category'], dtype=object)[keys % len(cube.labels['category'])],
+    })
+    return frame.nlargest(limit, 'count')
+
+
+def load_rollups(root=STORE_DIR):
+    return CrimeRollups.load(root) if rollups_exist(root) else None
+
+
+class Dashboard:
+    def __init__(self, cube, max_cached=MAX_CACHED_FIGURES, rollups=None):
+        self.cube = cube
+        self.rollups = rollups
+        self.max_cached = max_cached
+        # Figures of an older dataset never match a newer one
+        self.data_version = hashlib.sha1(np.ascontiguousarray(cube.counts).tobytes()).hexdigest()[:12]
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.page = PAGE_HTML.encode()
+        self._plotly_js = None
+
+    @property
+    def plotly_js(self):
+        # (bundle, gzipped bundle), read from plotly on first request
+        if self._plotly_js is None:
+            from plotly.offline import get_plotlyjs
+            bundle = get_plotlyjs().encode()
+            self._plotly_js = (bundle, gzip.compress(bundle, 6))
+        return self._plotly_js
+
+    def resolve(self, texts):
+        # Case-insensitive substring filters (as before) -> the matching labels of each dimension
+        return {dim: [label for label in self.cube.options(dim) if text in str(label).lower()]
+                for dim, text in texts.items() if dim in self.cube.dims}
+
+    @profiled('app: build figures', rows=None)
+    def build(self, filters):
+        import plotly.express as px
+        cube = self.cube
+        if all(filters.values()):
+            mask = cube.mask(**filters)
+        else:
+            # A filter text that matches no label selects nothing
+            mask = np.zeros(len(cube), dtype=bool)
+        # Without filters the bars and trend are read from the rollups, not summed over the cube
+        rollups = self.rollups if not filters else None
+        total = cube.total(mask)
+        figures = []
+        if total:
+            # Crime Hotspots (Scatter Map) over every cell, sized by count
+            fig_map = px.scatter_map(_category_cells(cube, mask), lat="lat", lon="lng", color="category",
+                size="count", hover_data=["count"],
+                color_discrete_sequence=px.colors.qualitative.Safe, zoom=11, height=500)
+            fig_map.update_layout(map_style="open-street-map")
+            fig_map.update_layout(margin={"r":0,"t":0,"l":0,"b":0})
+            figures.append(fig_map)
+
+            # Crime Category Distribution, Top 10 Wards, Top 10 Streets
+            for dim, name, title in [('category', 'Category', 'Top 10 Crime Categories'),
+                                     ('ward', 'Ward', 'Top 10 Wards by Crime Count'),
+                                     ('street_name', 'Street', 'Top 10 Streets by Crime Count')]:
+                if dim in cube.dims:
+                    counts = rollups.top(dim, 10) if rollups is not None else cube.counts_by(dim, mask).head(10)
+                    figures.append(px.bar(counts,
+                                          labels={'index': name, 'value': 'Count'}, title=title))
+
+            # Monthly Crime Trend
+            if {'year', 'month'}.issubset(cube.dims):
+                trend = rollups.trend() if rollups is not None else cube.counts_by_many(['year', 'month'], mask)
+                trend['year_month'] = trend['year'].astype(str) + '-' + trend['month'].astype(str).str.zfill(2)
+                figures.append(px.line(trend, x='year_month', y='count', title='Monthly Crime Trend'))
+        # Figure JSON is spliced in as produced by plotly, without a decode/encode round trip
+        return ('{"total": %s, "figures": [%s]}' % (json.dumps(total), ', '.join(fig.to_json() for fig in figures))).encode()
+
+    def figures(self, params):
+        # (ETag, body, gzipped body) for the request's filters, built once per filter key
+        texts = {dim: params.get(dim, '').strip().lower() for dim in FILTER_DIMS}
+        key = tuple(texts[dim] for dim in FILTER_DIMS)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        body = self.build(self.resolve({dim: text for dim, text in texts.items() if text}))
+        entry = (f'"{self.data_version}-{hashlib.sha1(body).hexdigest()[:16]}"', body, gzip.compress(body, 6))
+        with self._lock:
+            self._cache[key] = entry
+            if len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+        return entry
+
+
+class _DashboardHandler(BaseHTTPRequestHandler):
+    dashboard = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, body, content_type, etag=None, gzipped=None, cache_control='no-cache'):
+        if etag and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        if gzipped is not None and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzipped
+            encoding = 'gzip'
+        else:
+            encoding = None
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', cache_control)
+        self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        if etag:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path in ('/', '/plotly_dashboard.html'):
+            return self._send(self.dashboard.page, 'text/html; charset=utf-8')
+        if url.path == '/plotly.min.js':
+            bundle, gzipped = self.dashboard.plotly_js
+            return self._send(bundle, 'application/javascript', gzipped=gzipped, cache_control='public, max-age=86400')
+        if url.path == '/figures':
+            # /figures?ward=ashley&street_name=park&category=burglary
+            etag, body, gzipped = self.dashboard.figures(dict(parse_qsl(url.query)))
+            return self._send(body, 'application/json', etag=etag, gzipped=gzipped)
+        self.send_error(404)
+
+
+def make_server(dashboard, host='localhost', port=PORT):
+    handler = type('DashboardHandler', (_DashboardHandler,), {'dashboard': dashboard})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def serve_in_background(dashboard, host='localhost', port=0):
+    # Returns the running server; port 0 picks a free port (see server.server_address)
+    httpd = make_server(dashboard, host, port)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def main(port=PORT, root=STORE_DIR, open_browser=True):
+    if not store_exists(root):
+        print(f"{root}/ not found. Please run Safebristol-model.py to build the crime store.")
+        sys.exit(1)
+    httpd = make_server(Dashboard(load_cube(root), rollups=load_rollups(root)), 'localhost', port)
+    print(f'Serving Plotly dashboard at http://localhost:{port}')
+    if open_browser:
+        threading.Timer(1.5, webbrowser.open_new, [f'http://localhost:{port}']).start()
+    httpd.serve_forever()
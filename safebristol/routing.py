@@ -0,0 +1,396 @@
+# SafeBristol: risk-weighted route planning over the local street network.
+# A walkable street network is read once from an OpenStreetMap XML extract into a
+# compact CSR graph: node coordinates, one row of neighbours per node, and per
+# directed edge the index of its (undirected) street segment. Crimes are snapped
+# to the nearest segment (or, failing that, spread over the segments of their
+# street_name) and counted per segment, for all months together and for each
+# season and, when crimes carry an hour, each time of day. A segment costs its
+# length plus RISK_PENALTY_M metres per crime it sees in an average month, scaled
+# by the caller's risk aversion, and routes are shortest paths under that cost
+# (SciPy's Dijkstra over the CSR arrays). Counts are kept per month, so a newly
+# ingested or re-fetched month only replaces its own contribution. Saved counts
+# record the graph they index; after the graph is rebuilt from a newer extract
+# they are recounted from the crime store.
+
+import os
+import array
+import hashlib
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+STREETS_PATH = 'Data/bristol_streets.osm'
+ROUTING_DIR = 'routing'
+GRAPH_FILE = 'graph.npz'
+RISK_FILE = 'risk.npz'
+EARTH_RADIUS_M = 6371000.0
+# OSM highway types a pedestrian cannot use
+EXCLUDED_HIGHWAYS = {'motorway', 'motorway_link', 'trunk', 'trunk_link', 'construction', 'proposed',
+                     'bus_guideway', 'raceway', 'busway', 'abandoned', 'platform'}
+SNAP_M = 60.0                       # police.uk street points further than this from any segment are matched by name
+RISK_PENALTY_M = 500.0              # extra metres per crime per month on a segment, at aversion 1
+MIN_SEGMENT_M = 0.5
+STREET_PREFIX = 'on or near '
+SEASONS = ['winter', 'spring', 'summer', 'autumn']
+TIME_BANDS = ['night', 'morning', 'afternoon', 'evening']
+VARIANTS = ['all'] + SEASONS + TIME_BANDS
+
+
+def season_of(months):
+    # Dec-Feb winter, Mar-May spring, Jun-Aug summer, Sep-Nov autumn -> index into SEASONS
+    return (np.asarray(months, dtype=np.int64) % 12) // 3
+
+
+def time_band_of(hours):
+    # 0-5 night, 6-11 morning, 12-17 afternoon, 18-23 evening -> index into TIME_BANDS
+    return np.asarray(hours, dtype=np.int64) // 6
+
+
+def _project(lat, lng, ref_lat):
+    # Equirectangular metres around ref_lat
+    x = np.radians(np.asarray(lng, dtype=np.float64)) * np.cos(np.radians(ref_lat)) * EARTH_RADIUS_M
+    y = np.radians(np.asarray(lat, dtype=np.float64)) * EARTH_RADIUS_M
+    return np.column_stack([x, y])
+
+
+def _street_key(name):
+    name = str(name).strip().lower()
+    return name[len(STREET_PREFIX):] if name.startswith(STREET_PREFIX) else name
+
+
+class StreetGraph:
+    def __init__(self, lat, lng, seg_u, seg_v, seg_name, names):
+        # Nodes: lat/lng. Segments: undirected (u, v) node pairs with a street name code (-1 unnamed).
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lng = np.asarray(lng, dtype=np.float64)
+        self.seg_u = np.asarray(seg_u, dtype=np.int32)
+        self.seg_v = np.asarray(seg_v, dtype=np.int32)
+        self.seg_name = np.asarray(seg_name, dtype=np.int32)
+        self.names = np.asarray(names, dtype=object)
+        self.ref_lat = float(self.lat.mean())
+        xy = _project(self.lat, self.lng, self.ref_lat)
+        self.seg_length = np.maximum(np.hypot(*(xy[self.seg_u] - xy[self.seg_v]).T), MIN_SEGMENT_M)
+        # CSR over directed edges, both directions of every segment
+        n = len(self.lat)
+        src = np.concatenate([self.seg_u, self.seg_v])
+        order = np.argsort(src, kind='stable')
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(src, minlength=n))]).astype(np.int32)
+        self.indices = np.concatenate([self.seg_v, self.seg_u])[order]
+        self.edge_segment = np.concatenate([np.arange(len(self.seg_u))] * 2).astype(np.int32)[order]
+        self._nodes = cKDTree(xy)
+        self._segments = cKDTree((xy[self.seg_u] + xy[self.seg_v]) / 2)
+        self._name_codes = {_street_key(name): code for code, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.lat)
+
+    @classmethod
+    def from_osm(cls, path=STREETS_PATH):
+        # Walkable highway ways of an OSM XML extract, reduced to the largest connected component
+        node_ids, node_lat, node_lng = array.array('q'), array.array('d'), array.array('d')
+        seg_a, seg_b, seg_names, names = array.array('q'), array.array('q'), array.array('i'), {}
+        for _, elem in ET.iterparse(path):
+            if elem.tag == 'node':
+                node_ids.append(int(elem.get('id')))
+                node_lat.append(float(elem.get('lat')))
+                node_lng.append(float(elem.get('lon')))
+            elif elem.tag == 'way':
+                tags = {tag.get('k'): tag.get('v') for tag in elem.iter('tag')}
+                highway = tags.get('highway')
+                if (highway and highway not in EXCLUDED_HIGHWAYS and tags.get('foot') != 'no'
+                        and tags.get('access') not in ('private', 'no')):
+                    refs = [int(nd.get('ref')) for nd in elem.iter('nd')]
+                    code = names.setdefault(tags['name'], len(names)) if tags.get('name') else -1
+                    seg_a.extend(refs[:-1])
+                    seg_b.extend(refs[1:])
+                    seg_names.extend([code] * (len(refs) - 1))
+            if elem.tag in ('node', 'way', 'relation'):
+                elem.clear()
+        ids = np.frombuffer(node_ids, dtype=np.int64)
+        order = np.argsort(ids)
+        ids = ids[order]
+        seg_a, seg_b = np.frombuffer(seg_a, dtype=np.int64), np.frombuffer(seg_b, dtype=np.int64)
+        seg_names = np.frombuffer(seg_names, dtype=np.int32)
+        # Segments whose nodes are missing from the extract (clipped ways) are dropped
+        pos_a = np.minimum(np.searchsorted(ids, seg_a), len(ids) - 1)
+        pos_b = np.minimum(np.searchsorted(ids, seg_b), len(ids) - 1)
+        keep = (ids[pos_a] == seg_a) & (ids[pos_b] == seg_b) & (seg_a != seg_b)
+        pos_a, pos_b, seg_names = pos_a[keep], pos_b[keep], seg_names[keep]
+        # Renumber to the nodes actually used, and keep one segment per node pair
+        used, inverse = np.unique(np.concatenate([pos_a, pos_b]), return_inverse=True)
+        u, v = inverse[:len(pos_a)], inverse[len(pos_a):]
+        u, v = np.minimum(u, v), np.maximum(u, v)
+        _, first = np.unique(u.astype(np.int64) * len(used) + v, return_index=True)
+        u, v, seg_names = u[first], v[first], seg_names[first]
+        lat = np.frombuffer(node_lat, dtype=np.float64)[order][used]
+        lng = np.frombuffer(node_lng, dtype=np.float64)[order][used]
+        name_list = sorted(names, key=names.get)
+        return cls(lat, lng, u, v, seg_names, name_list)._largest_component()
+
+    def _largest_component(self):
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import connected_components
+        n = len(self)
+        _, labels = connected_components(coo_matrix((np.ones(len(self.seg_u)), (self.seg_u, self.seg_v)), shape=(n, n)),
+                                         directed=False)
+        main = np.argmax(np.bincount(labels))
+        if (labels == main).all():
+            return self
+        renumber = np.cumsum(labels == main) - 1
+        keep = labels[self.seg_u] == main
+        return StreetGraph(self.lat[labels == main], self.lng[labels == main], renumber[self.seg_u[keep]],
+                           renumber[self.seg_v[keep]], self.seg_name[keep], self.names)
+
+    def save(self, path):
+        np.savez(path, lat=self.lat, lng=self.lng, seg_u=self.seg_u, seg_v=self.seg_v, seg_name=self.seg_name,
+                 names=self.names.astype(str))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['lat'], data['lng'], data['seg_u'], data['seg_v'], data['seg_name'], data['names'])
+
+    @property
+    def fingerprint(self):
+        # Identifies the segment numbering that risk counts refer to
+        digest = hashlib.sha1(np.int64(len(self.seg_u)).tobytes())
+        digest.update(np.ascontiguousarray(self.seg_u, dtype=np.int64).tobytes())
+        digest.update(np.ascontiguousarray(self.seg_v, dtype=np.int64).tobytes())
+        return digest.hexdigest()[:16]
+
+    @classmethod
+    def cached(cls, osm_path=STREETS_PATH, root=ROUTING_DIR):
+        # Loads the graph from root/graph.npz, rebuilding it when the OSM extract is newer
+        # (a saved graph is used as is when the extract is not present)
+        path = os.path.join(root, GRAPH_FILE)
+        if os.path.exists(path) and (not os.path.exists(osm_path)
+                                     or os.path.getmtime(path) >= os.path.getmtime(osm_path)):
+            return cls.load(path)
+        graph = cls.from_osm(osm_path)
+        os.makedirs(root, exist_ok=True)
+        graph.save(path)
+        return graph
+
+    def nearest_node(self, lat, lng):
+        _, index = self._nodes.query(_project([lat], [lng], self.ref_lat))
+        return int(index[0])
+
+    def snap(self, df, max_distance=SNAP_M):
+        # Segment index per crime: the nearest segment midpoint within max_distance, else -1
+        _, index = self._segments.query(_project(df['lat'], df['lng'], self.ref_lat),
+                                        distance_upper_bound=max_distance)
+        return np.where(index < len(self.seg_u), index, -1)
+
+    def name_codes(self, street_names):
+        # police.uk street names ("On or near X") -> graph street name codes (-1 unknown)
+        return np.array([self._name_codes.get(_street_key(name), -1) for name in street_names], dtype=np.int64)
+
+
+class RiskWeights:
+    def __init__(self, graph, contributions=None):
+        # contributions: {period: (variant rows, segments, counts)} of every month added so far,
+        # with period = year * 12 + month - 1
+        self.graph = graph
+        self.contributions = contributions or {}
+        self.counts = np.zeros((len(VARIANTS), len(graph.seg_u)), dtype=np.float64)
+        for rows, segments, counts in self.contributions.values():
+            np.add.at(self.counts, (rows, segments), counts)
+        self.has_hours = False
+        self._costs = {}
+
+    @classmethod
+    def build(cls, graph, df):
+        weights = cls(graph)
+        weights.add_crimes(df)
+        return weights
+
+    def _month_contribution(self, df, season):
+        # (variant rows, segments, counts) for one month of crimes
+        graph = self.graph
+        segments = graph.snap(df)
+        lengths = graph.seg_length
+        # Crimes that did not snap are spread over their street's segments in proportion to length
+        unmatched = segments < 0
+        codes = graph.name_codes(df['street_name'].to_numpy()[unmatched]) if 'street_name' in df else np.array([], int)
+        name_counts = np.bincount(codes[codes >= 0], minlength=len(graph.names))
+        name_lengths = np.bincount(graph.seg_name[graph.seg_name >= 0], weights=lengths[graph.seg_name >= 0],
+                                   minlength=len(graph.names))
+        spread = np.flatnonzero((graph.seg_name >= 0) & (name_counts[np.maximum(graph.seg_name, 0)] > 0))
+        spread_counts = (name_counts[graph.seg_name[spread]] * lengths[spread] / name_lengths[graph.seg_name[spread]])
+        matched = segments[~unmatched]
+        base_segments = np.concatenate([matched, spread])
+        base_counts = np.concatenate([np.ones(len(matched)), spread_counts])
+        rows = [np.zeros(len(base_segments), dtype=np.int64), np.full(len(base_segments), 1 + season)]
+        segs, counts = [base_segments, base_segments], [base_counts, base_counts]
+        if 'hour' in df and len(matched):
+            # Time-of-day variants only from crimes with an hour and a snapped location
+            hours = pd.to_numeric(df['hour'], errors='coerce').to_numpy()[~unmatched]
+            known = ~np.isnan(hours)
+            rows.append(1 + len(SEASONS) + time_band_of(hours[known]))
+            segs.append(matched[known])
+            counts.append(np.ones(known.sum()))
+        rows, segs, counts = np.concatenate(rows), np.concatenate(segs), np.concatenate(counts)
+        keys, inverse = np.unique(rows * len(lengths) + segs, return_inverse=True)
+        return ((keys // len(lengths)).astype(np.int8), (keys % len(lengths)).astype(np.int32),
+                np.bincount(inverse, weights=counts).astype(np.float32))
+
+    def add_crimes(self, df):
+        # Adds (or replaces) the months present in df; returns the periods updated
+        df = df.dropna(subset=['lat', 'lng', 'year', 'month'])
+        periods = df['year'].to_numpy(dtype=np.int64) * 12 + df['month'].to_numpy(dtype=np.int64) - 1
+        updated = []
+        for period in np.unique(periods):
+            period = int(period)
+            month = df[periods == period]
+            old = self.contributions.pop(period, None)
+            if old is not None:
+                np.subtract.at(self.counts, (old[0], old[1]), old[2])
+            rows, segments, counts = self._month_contribution(month, int(season_of(period % 12 + 1)))
+            np.add.at(self.counts, (rows, segments), counts)
+            self.contributions[period] = (rows, segments, counts)
+            updated.append(period)
+        self.has_hours = self.has_hours or 'hour' in df
+        self._costs.clear()
+        return updated
+
+    def months_in(self, variant):
+        # Number of months behind a variant's counts
+        periods = np.fromiter(self.contributions, dtype=np.int64)
+        if variant in SEASONS:
+            return int((season_of(periods % 12 + 1) == SEASONS.index(variant)).sum())
+        return len(periods)
+
+    def rate(self, variant='all'):
+        # Crimes per segment in an average month of the variant
+        # (clipped, as replacing months can leave float residue just below zero)
+        return np.maximum(self.counts[VARIANTS.index(variant)], 0) / max(self.months_in(variant), 1)
+
+    def cost(self, variant='all', aversion=1.0):
+        # Per-segment routing cost in metres; cached per (variant, aversion)
+        key = (variant, float(aversion))
+        if key not in self._costs:
+            if len(self._costs) > 32:
+                self._costs.clear()
+            self._costs[key] = self.graph.seg_length + aversion * RISK_PENALTY_M * self.rate(variant)
+        return self._costs[key]
+
+    def save(self, path):
+        periods = np.array(sorted(self.contributions), dtype=np.int64)
+        parts = [self.contributions[p] for p in periods]
+        sizes = np.array([len(part[0]) for part in parts], dtype=np.int64)
+        empty = np.array([], dtype=np.float32)
+        np.savez(path, periods=periods, sizes=sizes,
+                 rows=np.concatenate([part[0] for part in parts]) if parts else empty.astype(np.int8),
+                 segments=np.concatenate([part[1] for part in parts]) if parts else empty.astype(np.int32),
+                 counts=np.concatenate([part[2] for part in parts]) if parts else empty,
+                 has_hours=self.has_hours, graph=self.graph.fingerprint)
+
+    @classmethod
+    def load(cls, graph, path):
+        # None when the counts were made for another graph (their segment indexes do not apply)
+        with np.load(path) as data:
+            if 'graph' not in data or str(data['graph']) != graph.fingerprint:
+                return None
+            bounds = np.concatenate([[0], np.cumsum(data['sizes'])])
+            contributions = {int(period): (data['rows'][a:b], data['segments'][a:b], data['counts'][a:b])
+                             for period, a, b in zip(data['periods'], bounds[:-1], bounds[1:])}
+            weights = cls(graph, contributions=contributions)
+            weights.has_hours = bool(data['has_hours'])
+        return weights
+
+
+class Router:
+    def __init__(self, graph, weights):
+        self.graph = graph
+        self.weights = weights
+        self._matrices = {}
+
+    @classmethod
+    def load(cls, root=ROUTING_DIR, osm_path=STREETS_PATH):
+        graph = StreetGraph.cached(osm_path, root)
+        return cls(graph, load_risk(graph, root))
+
+    def _matrix(self, variant, aversion):
+        from scipy.sparse import csr_matrix
+        cost = self.weights.cost(variant, aversion)
+        key = (variant, float(aversion))
+        matrix = self._matrices.get(key)
+        # Rebuilt only when the weights object handed out a new cost array
+        if matrix is None or matrix[0] is not cost:
+            graph = self.graph
+            n = len(graph)
+            if len(self._matrices) > 32:
+                self._matrices.clear()
+            matrix = (cost, csr_matrix((cost[graph.edge_segment], graph.indices, graph.indptr), shape=(n, n)))
+            self._matrices[key] = matrix
+        return matrix[1]
+
+    def route(self, from_lat, from_lng, to_lat, to_lng, variant='all', aversion=1.0):
+        # Lowest-cost path between the street nodes nearest the two points
+        from scipy.sparse.csgraph import dijkstra
+        graph = self.graph
+        if variant not in VARIANTS:
+            raise ValueError(f'Unknown variant {variant!r}; expected one of {VARIANTS}')
+        source, target = graph.nearest_node(from_lat, from_lng), graph.nearest_node(to_lat, to_lng)
+        _, predecessors = dijkstra(self._matrix(variant, aversion), indices=source, return_predecessors=True)
+        nodes = [target]
+        while nodes[-1] != source:
+            nodes.append(int(predecessors[nodes[-1]]))
+            if nodes[-1] < 0:
+                return None
+        nodes.reverse()
+        # The cheapest segment between each consecutive node pair
+        cost = self.weights.cost(variant, aversion)
+        segments = []
+        for a, b in zip(nodes[:-1], nodes[1:]):
+            edges = np.arange(graph.indptr[a], graph.indptr[a + 1])
+            edges = edges[graph.indices[edges] == b]
+            segments.append(graph.edge_segment[edges[np.argmin(cost[graph.edge_segment[edges]])]])
+        segments = np.asarray(segments, dtype=np.int64)
+        named = graph.seg_name[segments]
+        streets = list(dict.fromkeys(graph.names[named[named >= 0]]))
+        return {
+            'lat': graph.lat[nodes].tolist(),
+            'lng': graph.lng[nodes].tolist(),
+            'length_m': float(graph.seg_length[segments].sum()),
+            'cost': float(cost[segments].sum()),
+            'crimes_per_month': float(self.weights.rate(variant)[segments].sum()),
+            'streets': [str(name) for name in streets],
+        }
+
+    def compare(self, from_lat, from_lng, to_lat, to_lng, variant='all', aversion=1.0):
+        # (shortest, safest) routes between the same points
+        return (self.route(from_lat, from_lng, to_lat, to_lng, variant, 0.0),
+                self.route(from_lat, from_lng, to_lat, to_lng, variant, aversion))
+
+
+def load_risk(graph, root=ROUTING_DIR, store_dir=None):
+    # The saved segment counts of `graph`. Counts saved for an earlier graph are recounted
+    # from every crime in the store (and saved), or dropped when there is no store.
+    from .crime_store import STORE_DIR, read_crimes, store_columns, store_exists
+    store_dir = store_dir or STORE_DIR
+    risk_path = os.path.join(root, RISK_FILE)
+    if not os.path.exists(risk_path):
+        return RiskWeights(graph)
+    weights = RiskWeights.load(graph, risk_path)
+    if weights is not None:
+        return weights
+    if not store_exists(store_dir):
+        print(f'{risk_path} belongs to an earlier street graph and {store_dir}/ is missing; starting without risk.')
+        return RiskWeights(graph)
+    print(f'{risk_path} belongs to an earlier street graph; recounting crimes from {store_dir}/')
+    columns = [col for col in ['lat', 'lng', 'year', 'month', 'street_name', 'hour'] if col in store_columns(store_dir)]
+    weights = RiskWeights.build(graph, read_crimes(store_dir, columns=columns))
+    weights.save(risk_path)
+    return weights
+
+
+def update_risk(df, root=ROUTING_DIR, osm_path=STREETS_PATH, store_dir=None):
+    # Folds the months in df into the saved segment counts (building them on first use)
+    graph = StreetGraph.cached(osm_path, root)
+    weights = load_risk(graph, root, store_dir)
+    updated = weights.add_crimes(df)
+    weights.save(os.path.join(root, RISK_FILE))
+    return weights, updated
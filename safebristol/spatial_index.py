@@ -0,0 +1,116 @@
+# SafeBristol: hierarchical grid index for crime points and server-side heatmap binning.
+# Cells follow the Web Mercator tile pyramid: at level L the world is split into
+# 2^L x 2^L cells, so a cell at level L+1 sits exactly inside one cell at level
+# L and coarsening is a bit shift. Points are keyed once at a fine base level;
+# heatmaps are served as count-weighted cell centroids at the level matching
+# the map zoom, clipped to the visible bounds. Payload size is bounded by the
+# number of visible cells, not the number of crimes, and nothing is sampled.
+
+import numpy as np
+
+BASE_LEVEL = 17          # ~190 m cells at Bristol's latitude
+BINS_PER_TILE = 16       # heat cells per 256 px map tile side (~16 px per cell)
+MAX_LAT = 85.05112878
+
+
+def mercator_xy(lat, lng):
+    # Normalised Web Mercator coordinates in [0, 1)
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -MAX_LAT, MAX_LAT)
+    lng = np.asarray(lng, dtype=np.float64)
+    x = (lng + 180.0) / 360.0
+    sin_lat = np.sin(np.radians(lat))
+    y = 0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * np.pi)
+    return np.clip(x, 0, 1 - 1e-12), np.clip(y, 0, 1 - 1e-12)
+
+
+def cell_xy(lat, lng, level=BASE_LEVEL):
+    x, y = mercator_xy(lat, lng)
+    scale = float(1 << level)
+    return (x * scale).astype(np.int64), (y * scale).astype(np.int64)
+
+
+def cell_keys(lat, lng, level=BASE_LEVEL):
+    # One int64 key per point: cell x in the high 32 bits, cell y in the low 32
+    cx, cy = cell_xy(lat, lng, level)
+    return (cx << 32) | cy
+
+
+def split_keys(keys):
+    keys = np.asarray(keys, dtype=np.int64)
+    return keys >> 32, keys & 0xFFFFFFFF
+
+
+def coarsen(keys, from_level, to_level):
+    # Parent cell keys: both coordinates shift right by the level difference
+    if to_level >= from_level:
+        return np.asarray(keys, dtype=np.int64)
+    shift = from_level - to_level
+    cx, cy = split_keys(keys)
+    return ((cx >> shift) << 32) | (cy >> shift)
+
+
+def level_for_zoom(zoom, bins_per_tile=BINS_PER_TILE, max_level=BASE_LEVEL):
+    # Map zoom z shows 2^z tiles per world side; each tile gets bins_per_tile cells
+    level = int(round(zoom)) + int(np.log2(bins_per_tile))
+    return max(0, min(level, max_level))
+
+
+def cell_bounds(keys, level):
+    # (south, west, north, east) of each cell, for drawing or debugging
+    cx, cy = split_keys(keys)
+    scale = float(1 << level)
+    west = cx / scale * 360.0 - 180.0
+    east = (cx + 1) / scale * 360.0 - 180.0
+    north = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * cy / scale))))
+    south = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (cy + 1) / scale))))
+    return south, west, north, east
+
+
+def bin_points(lat, lng, weights=None, level=BASE_LEVEL, bounds=None):
+    # Aggregate points (or finer cell centroids) into cells at `level`.
+    # bounds: optional (south, west, north, east) viewport; points outside are dropped.
+    # Returns (lat, lng, weight) per non-empty cell at the weighted centroid.
+    lat = np.asarray(lat, dtype=np.float64)
+    lng = np.asarray(lng, dtype=np.float64)
+    weights = np.ones(len(lat)) if weights is None else np.asarray(weights, dtype=np.float64)
+    if bounds is not None:
+        south, west, north, east = bounds
+        visible = (lat >= south) & (lat <= north) & (lng >= west) & (lng <= east)
+        lat, lng, weights = lat[visible], lng[visible], weights[visible]
+    if len(lat) == 0:
+        empty = np.empty(0)
+        return empty, empty, empty
+    keys = cell_keys(lat, lng, level)
+    unique, inverse = np.unique(keys, return_inverse=True)
+    total = np.bincount(inverse, weights=weights, minlength=len(unique))
+    lat_sum = np.bincount(inverse, weights=lat * weights, minlength=len(unique))
+    lng_sum = np.bincount(inverse, weights=lng * weights, minlength=len(unique))
+    present = total > 0
+    return lat_sum[present] / total[present], lng_sum[present] / total[present], total[present]
+
+
+class SpatialIndex:
+    # Precomputed pyramid of binned points for every level from min_level to base_level
+    def __init__(self, lat, lng, weights=None, base_level=BASE_LEVEL, min_level=8):
+        self.base_level = base_level
+        self.min_level = min_level
+        lat = np.asarray(lat, dtype=np.float64)
+        lng = np.asarray(lng, dtype=np.float64)
+        valid = ~(np.isnan(lat) | np.isnan(lng))
+        weights = np.ones(valid.sum()) if weights is None else np.asarray(weights, dtype=np.float64)[valid]
+        self.levels = {}
+        level_lat, level_lng, level_w = bin_points(lat[valid], lng[valid], weights, base_level)
+        self.levels[base_level] = (level_lat, level_lng, level_w)
+        # Each coarser level is binned from the level below, not from the raw points
+        for level in range(base_level - 1, min_level - 1, -1):
+            level_lat, level_lng, level_w = bin_points(level_lat, level_lng, level_w, level)
+            self.levels[level] = (level_lat, level_lng, level_w)
+
+    def heat(self, zoom, bounds=None, bins_per_tile=BINS_PER_TILE):
+        level = max(self.min_level, level_for_zoom(zoom, bins_per_tile, self.base_level))
+        lat, lng, weights = self.levels[level]
+        if bounds is not None:
+            south, west, north, east = bounds
+            visible = (lat >= south) & (lat <= north) & (lng >= west) & (lng <= east)
+            lat, lng, weights = lat[visible], lng[visible], weights[visible]
+        return lat, lng, weights
@@ -0,0 +1,264 @@
+# SafeBristol: pre-rendered heatmap tiles for the dashboards.
+# Heat tiles are 256 px PNG rasters in the standard z/x/y Web Mercator scheme,
+# rendered from a CrimeCube's per-cell centroids for one filter combination. A
+# tile is drawn once per (data version, filter key, z, x, y): the points under it
+# are splatted onto pixels, blurred, coloured and encoded, then kept in an
+# on-disk LRU cache bounded by total size. A local HTTP endpoint serves the
+# tiles, so a map overlay only fetches the tiles it shows and pan/zoom never
+# re-sends the underlying points to the browser.
+
+import os
+import json
+import zlib
+import struct
+import hashlib
+import threading
+import collections
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+import numpy as np
+
+from .spatial_index import BINS_PER_TILE, bin_points, level_for_zoom, mercator_xy
+
+TILE_CACHE_DIR = 'tile_cache'
+TILE_SIZE = 256
+DEFAULT_MAX_BYTES = 256 * 2 ** 20
+BLUR_PX = 6.0
+MAX_FILTER_KEYS = 32
+MAX_SCALES = 8 * MAX_FILTER_KEYS       # (filter key, zoom) peaks kept
+# Colour stops matching the folium HeatMap gradient used before: (intensity, r, g, b)
+GRADIENT = np.array([[0.0, 255, 165, 0], [0.2, 255, 165, 0], [0.5, 255, 0, 0], [1.0, 139, 0, 0]])
+
+
+def encode_png(rgba):
+    # Minimal RGBA PNG encoder (no imaging library needed)
+    height, width, _ = rgba.shape
+    rows = np.concatenate([np.zeros((height, 1), dtype=np.uint8), rgba.reshape(height, width * 4)], axis=1)
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows.tobytes(), 6))
+            + chunk(b'IEND', b''))
+
+
+EMPTY_TILE = encode_png(np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8))
+
+
+def filter_key(filters):
+    # Stable short key for a filter dict; 'All'/None entries do not change the key
+    active = {dim: str(value) for dim, value in filters.items() if value not in (None, 'All', '')}
+    return hashlib.sha1(json.dumps(active, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _blur_kernel(sigma):
+    radius = int(np.ceil(3 * sigma))
+    offsets = np.arange(-radius, radius + 1)
+    profile = np.exp(-0.5 * (offsets / sigma) ** 2)
+    kernel = np.outer(profile, profile)
+    return kernel / kernel.sum()
+
+
+class TileCache:
+    # PNG bytes on disk under root/<key parts>.png; least recently used files are
+    # removed once the total size passes max_bytes
+    def __init__(self, root=TILE_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self.total_bytes = 0
+        found = []
+        for directory, _, files in os.walk(root):
+            for name in files:
+                if name.endswith('.png'):
+                    path = os.path.join(directory, name)
+                    stat = os.stat(path)
+                    found.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(found):
+            self._entries[path] = size
+            self.total_bytes += size
+
+    def path(self, *parts):
+        return os.path.join(self.root, *[str(p) for p in parts[:-1]], f'{parts[-1]}.png')
+
+    def get(self, path):
+        with self._lock:
+            if path not in self._entries:
+                return None
+            self._entries.move_to_end(path)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except OSError:
+            with self._lock:
+                self.total_bytes -= self._entries.pop(path, 0)
+            return None
+
+    def put(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.total_bytes += len(data) - self._entries.pop(path, 0)
+            self._entries[path] = len(data)
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                old_path, size = self._entries.popitem(last=False)
+                self.total_bytes -= size
+                try:
+                    os.remove(old_path)
+                except OSError:
+                    pass
+
+
+class TileRenderer:
+    def __init__(self, cube, cache=None, blur_px=BLUR_PX):
+        self.cube = cube
+        self.cache = cache or TileCache()
+        self.kernel = _blur_kernel(blur_px)
+        self.margin = self.kernel.shape[0] // 2
+        # Tiles of an older cube never match a newer one
+        self.data_version = hashlib.sha1(np.ascontiguousarray(cube.counts).tobytes()).hexdigest()[:12]
+        self._points = collections.OrderedDict()
+        self._scales = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def recognised(self, filters):
+        # Only the cube's dimensions filter tiles (and enter their cache key)
+        return {dim: value for dim, value in filters.items() if dim in self.cube.dims}
+
+    def _filtered_points(self, key, filters):
+        # Mercator x/y and counts of the filtered cells, computed once per filter key
+        with self._lock:
+            if key in self._points:
+                self._points.move_to_end(key)
+                return self._points[key]
+        mask = self.cube.mask(**self.recognised(filters))
+        lat, lng, counts = self.cube.cell_points(mask)
+        x, y = mercator_xy(lat, lng)
+        entry = (lat, lng, x, y, counts)
+        with self._lock:
+            self._points[key] = entry
+            if len(self._points) > MAX_FILTER_KEYS:
+                self._points.popitem(last=False)
+        return entry
+
+    def _scale(self, key, z, lat, lng, counts):
+        # Peak count per heat cell at this zoom, so intensity is comparable across tiles
+        with self._lock:
+            if (key, z) in self._scales:
+                self._scales.move_to_end((key, z))
+                return self._scales[(key, z)]
+        _, _, binned = bin_points(lat, lng, counts, level_for_zoom(z))
+        scale = float(binned.max()) if len(binned) else 1.0
+        with self._lock:
+            self._scales[(key, z)] = scale
+            if len(self._scales) > MAX_SCALES:
+                self._scales.popitem(last=False)
+        return scale
+
+    def render(self, z, x, y, filters):
+        filters = self.recognised(filters)
+        lat, lng, px, py, counts = self._filtered_points(filter_key(filters), filters)
+        world = TILE_SIZE * float(1 << z)
+        size = TILE_SIZE + 2 * self.margin
+        col = np.floor(px * world - x * TILE_SIZE + self.margin).astype(np.int64)
+        row = np.floor(py * world - y * TILE_SIZE + self.margin).astype(np.int64)
+        visible = (col >= 0) & (col < size) & (row >= 0) & (row < size)
+        if not visible.any():
+            return None
+        grid = np.bincount(row[visible] * size + col[visible], weights=counts[visible],
+                           minlength=size * size).reshape(size, size)
+        from scipy.signal import fftconvolve
+        blurred = fftconvolve(grid, self.kernel, mode='same')[self.margin:-self.margin, self.margin:-self.margin]
+        # A heat cell holds (TILE_SIZE / BINS_PER_TILE)^2 pixels; the densest cell maps to ~1
+        cell_px = (TILE_SIZE / BINS_PER_TILE) ** 2
+        intensity = np.clip(blurred * cell_px / self._scale(filter_key(filters), z, lat, lng, counts), 0, 1)
+        rgba = np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8)
+        for channel in range(3):
+            rgba[:, :, channel] = np.interp(intensity, GRADIENT[:, 0], GRADIENT[:, channel + 1])
+        rgba[:, :, 3] = (np.clip(intensity / 0.2, 0, 1) * 210).astype(np.uint8)
+        if not rgba[:, :, 3].any():
+            return None
+        return encode_png(rgba)
+
+    def tile(self, z, x, y, filters):
+        # PNG bytes for a tile, from the disk cache when already rendered
+        filters = self.recognised(filters)
+        path = self.cache.path(self.data_version, filter_key(filters), z, x, y)
+        data = self.cache.get(path)
+        if data is None:
+            data = self.render(z, x, y, filters)
+            if data is None:
+                return EMPTY_TILE
+            self.cache.put(path, data)
+        return data
+
+
+class _TileHandler(BaseHTTPRequestHandler):
+    renderer = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        # /tiles/{z}/{x}/{y}.png?category=Burglary&year=2024
+        url = urlparse(self.path)
+        parts = url.path.strip('/').split('/')
+        try:
+            if len(parts) != 4 or parts[0] != 'tiles' or not parts[3].endswith('.png'):
+                raise ValueError(url.path)
+            z, x, y = int(parts[1]), int(parts[2]), int(parts[3][:-4])
+            if not (0 <= z <= 22 and 0 <= x < 1 << z and 0 <= y < 1 << z):
+                raise ValueError(url.path)
+        except ValueError:
+            self.send_error(404)
+            return
+        filters = self.renderer.recognised(dict(parse_qsl(url.query)))
+        for dim in filters:
+            # Numeric cube labels (e.g. year) arrive as strings
+            if filters[dim] not in self.renderer.cube._label_index[dim]:
+                try:
+                    filters[dim] = int(filters[dim])
+                except ValueError:
+                    pass
+        etag = f'"{self.renderer.data_version}-{filter_key(filters)}-{z}-{x}-{y}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        data = self.renderer.tile(z, x, y, filters)
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Cache-Control', 'public, max-age=3600')
+        self.send_header('ETag', etag)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def make_server(renderer, host='localhost', port=8600):
+    handler = type('TileHandler', (_TileHandler,), {'renderer': renderer})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def serve_in_background(renderer, host='localhost', port=0):
+    # Returns the running server; port 0 picks a free port (see server.server_address)
+    httpd = make_server(renderer, host, port)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def tile_url(httpd, filters):
+    # Leaflet / MapLibre URL template for the filtered heat tiles of a running server
+    host, port = httpd.server_address[:2]
+    query = urlencode([(dim, value) for dim, value in sorted(filters.items()) if value not in (None, 'All', '')])
+    return f'http://{host}:{port}/tiles/{{z}}/{{x}}/{{y}}.png' + (f'?{query}' if query else '')
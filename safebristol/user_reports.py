@@ -0,0 +1,436 @@
+# SafeBristol: ingestion of user-submitted safety reports.
+# An asyncio HTTP endpoint (POST /reports: one JSON report, a JSON array or
+# newline-delimited JSON) validates each report and hands the accepted ones to a
+# single writer task. The writer group-commits whatever has queued up, one write
+# and fsync per micro-batch, to an append-only write-ahead log of JSON-lines
+# segments, and only then answers the requests in that batch (202), so an
+# acknowledged report is on disk. Every committed batch is folded into a rollup of
+# counts per spatial cell (spatial_index, BASE_LEVEL), month and category, which is
+# snapshotted with its WAL position; a restart loads the snapshot and replays only
+# the log after it. The model and dashboards read the rollup (ReportRollup.load),
+# never the raw reports. Requests wait in a bounded queue: when it is full the
+# endpoint answers 503 with Retry-After instead of buffering without limit.
+#
+#   python -m safebristol serve reports --port 8505
+#   curl -X POST localhost:8505/reports -d '{"lat": 51.455, "lng": -2.59, "category": "poor-lighting"}'
+
+import os
+import json
+import math
+import time
+import uuid
+import asyncio
+import datetime
+import collections
+from urllib.parse import parse_qsl, urlparse
+
+import numpy as np
+
+from .spatial_index import BASE_LEVEL, cell_bounds, cell_keys, coarsen
+
+REPORTS_DIR = 'user_reports'
+WAL_DIR = 'wal'
+SNAPSHOT_FILE = 'rollup.npz'
+PORT = 8505
+# (south, west, north, east): Greater Bristol
+BOUNDS = (51.25, -2.90, 51.65, -2.30)
+REPORT_CATEGORIES = ['feeling-unsafe', 'harassment', 'poor-lighting', 'anti-social-behaviour', 'theft',
+                     'violence', 'vandalism', 'drugs', 'other']
+MAX_AGE_DAYS = 90
+MAX_DESCRIPTION = 1000
+MAX_BODY_BYTES = 1 << 20
+MAX_REPORTS_PER_REQUEST = 1000
+MAX_PENDING_REQUESTS = 2000         # queued requests before the endpoint answers 503
+MAX_BATCH_REPORTS = 5000            # reports per WAL write
+FLUSH_INTERVAL_S = 0.02             # longest a report waits for its batch to fill
+SEGMENT_BYTES = 64 << 20
+SNAPSHOT_EVERY_S = 30.0
+IDLE_TIMEOUT_S = 30.0
+
+
+def validate_report(report, now=None):
+    # (record, None) for a valid report, else (None, reason). Records get a server id and receive time.
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    if not isinstance(report, dict):
+        return None, 'report must be a JSON object'
+    lat, lng = report.get('lat'), report.get('lng')
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) and math.isfinite(v) for v in (lat, lng)):
+        return None, 'lat and lng must be numbers'
+    south, west, north, east = BOUNDS
+    if not (south <= lat <= north and west <= lng <= east):
+        return None, 'location outside the Bristol area'
+    category = report.get('category')
+    if category not in REPORT_CATEGORIES:
+        return None, f'category must be one of {REPORT_CATEGORIES}'
+    when = now
+    if report.get('time') is not None:
+        try:
+            when = datetime.datetime.fromisoformat(str(report['time']).replace('Z', '+00:00'))
+        except ValueError:
+            return None, 'time must be an ISO 8601 timestamp'
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=datetime.timezone.utc)
+        if when > now + datetime.timedelta(minutes=5) or when < now - datetime.timedelta(days=MAX_AGE_DAYS):
+            return None, f'time must be within the last {MAX_AGE_DAYS} days'
+    description = report.get('description')
+    if description is not None and (not isinstance(description, str) or len(description) > MAX_DESCRIPTION):
+        return None, f'description must be a string of at most {MAX_DESCRIPTION} characters'
+    user = report.get('user')
+    if user is not None and (not isinstance(user, str) or len(user) > 128):
+        return None, 'user must be a string of at most 128 characters'
+    return {'id': uuid.uuid4().hex, 'lat': float(lat), 'lng': float(lng), 'category': category,
+            'time': when.isoformat(timespec='seconds'), 'received': now.isoformat(timespec='seconds'),
+            'description': description, 'user': user}, None
+
+
+def parse_reports(body):
+    # A JSON object, a JSON array of objects, or newline-delimited JSON objects
+    text = body.decode('utf-8').strip()
+    if text.startswith('['):
+        return json.loads(text)
+    if '\n' in text:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    return [json.loads(text)]
+
+
+def _segment_path(root, seq):
+    return os.path.join(root, f'{seq:08d}.jsonl')
+
+
+def wal_segments(root):
+    return sorted(int(name[:-6]) for name in os.listdir(root) if name.endswith('.jsonl')) if os.path.isdir(root) else []
+
+
+def replay_wal(root, position=(0, 0)):
+    # Records after position, in order; a torn last line (crash mid-write) is skipped
+    seq, offset = position
+    for segment in wal_segments(root):
+        if segment < seq:
+            continue
+        with open(_segment_path(root, segment), 'rb') as f:
+            if segment == seq:
+                f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    print(f'Skipping an unreadable WAL line in segment {segment}')
+                    continue
+                yield record
+
+
+def _truncate_torn_tail(path, chunk=64 * 1024):
+    # Cut a segment back to its last newline, dropping a record half-written before a crash
+    with open(path, 'r+b') as f:
+        end = f.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(end - chunk, 0)
+            f.seek(start)
+            last = f.read(end - start).rfind(b'\n')
+            if last >= 0:
+                keep = start + last + 1
+                break
+            end = start
+        else:
+            keep = 0
+        if keep < f.seek(0, os.SEEK_END):
+            f.truncate(keep)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class WriteAheadLog:
+    # Append-only JSON-lines segments <seq>.jsonl; a position is (segment seq, byte offset)
+    def __init__(self, root, segment_bytes=SEGMENT_BYTES):
+        self.root = root
+        self.segment_bytes = segment_bytes
+        os.makedirs(root, exist_ok=True)
+        segments = wal_segments(root)
+        self.seq = segments[-1] if segments else 0
+        if segments:
+            # Appends must start on a fresh line, not after a torn one
+            _truncate_torn_tail(_segment_path(root, self.seq))
+        self._file = open(_segment_path(root, self.seq), 'ab')
+
+    @property
+    def position(self):
+        return self.seq, self._file.tell()
+
+    def append(self, data):
+        # Durable once this returns; returns the position after the data
+        if self._file.tell() and self._file.tell() + len(data) > self.segment_bytes:
+            self._file.close()
+            self.seq += 1
+            self._file = open(_segment_path(self.root, self.seq), 'ab')
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self.position
+
+    def drop_before(self, seq):
+        # Segments wholly covered by a snapshot
+        for segment in wal_segments(self.root):
+            if segment < seq:
+                os.remove(_segment_path(self.root, segment))
+
+    def close(self):
+        self._file.close()
+
+
+class ReportRollup:
+    def __init__(self, counts=None, position=(0, 0)):
+        # {(cell key, period, category code): count}, period = year * 12 + month - 1
+        self.counts = counts if counts is not None else collections.Counter()
+        self.position = tuple(position)
+
+    def add(self, records):
+        if not records:
+            return
+        lat = np.fromiter((r['lat'] for r in records), dtype=np.float64, count=len(records))
+        lng = np.fromiter((r['lng'] for r in records), dtype=np.float64, count=len(records))
+        # 'YYYY-MM' of the report time
+        period = np.array([int(r['time'][:4]) * 12 + int(r['time'][5:7]) - 1 for r in records], dtype=np.int64)
+        category = np.array([REPORT_CATEGORIES.index(r['category']) for r in records], dtype=np.int64)
+        keys = np.stack([cell_keys(lat, lng, BASE_LEVEL), period, category], axis=1)
+        unique, counts = np.unique(keys, axis=0, return_counts=True)
+        for (cell, p, c), n in zip(unique.tolist(), counts.tolist()):
+            self.counts[(cell, p, c)] += n
+
+    def arrays(self):
+        # (cell keys, periods, category codes, counts) as int64 arrays
+        if not self.counts:
+            return tuple(np.zeros(0, dtype=np.int64) for _ in range(4))
+        keys = np.array(list(self.counts.keys()), dtype=np.int64)
+        return keys[:, 0], keys[:, 1], keys[:, 2], np.fromiter(self.counts.values(), dtype=np.int64)
+
+    def save(self, path):
+        cells, periods, categories, counts = self.arrays()
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, cells=cells, periods=periods, categories=categories, counts=counts,
+                 position=np.array(self.position, dtype=np.int64))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, root=REPORTS_DIR):
+        # Snapshot plus the WAL written after it
+        path = os.path.join(root, SNAPSHOT_FILE)
+        rollup = cls()
+        if os.path.exists(path):
+            with np.load(path) as data:
+                rollup = cls(collections.Counter(dict(zip(
+                    zip(data['cells'].tolist(), data['periods'].tolist(), data['categories'].tolist()),
+                    data['counts'].tolist()))), data['position'].tolist())
+        rollup.add(list(replay_wal(os.path.join(root, WAL_DIR), rollup.position)))
+        return rollup
+
+    def frame(self, level=BASE_LEVEL):
+        # Counts per (cell, year, month, category) at `level`, with cell centres, for dashboards
+        import pandas as pd
+        cells, periods, categories, counts = self.arrays()
+        cells = coarsen(cells, BASE_LEVEL, level)
+        df = pd.DataFrame({'cell': cells, 'period': periods, 'category': categories, 'count': counts})
+        df = df.groupby(['cell', 'period', 'category'], as_index=False)['count'].sum()
+        south, west, north, east = cell_bounds(df['cell'].to_numpy(), level)
+        df['lat'], df['lng'] = (south + north) / 2, (west + east) / 2
+        df['year'], df['month'] = df['period'] // 12, df['period'] % 12 + 1
+        df['category'] = pd.Categorical.from_codes(df['category'], categories=REPORT_CATEGORIES)
+        return df.drop(columns='period')
+
+    def counts_for(self, lat, lng, year, month, level=BASE_LEVEL):
+        # Reports in each point's cell and month (all categories), e.g. as a model feature
+        import pandas as pd
+        cells, periods, _, counts = self.arrays()
+        totals = pd.Series(counts, index=pd.MultiIndex.from_arrays([coarsen(cells, BASE_LEVEL, level), periods]))
+        totals = totals.groupby(level=[0, 1]).sum()
+        query = pd.MultiIndex.from_arrays([cell_keys(lat, lng, level),
+                                           np.asarray(year, dtype=np.int64) * 12 + np.asarray(month, dtype=np.int64) - 1])
+        if not len(totals):
+            return np.zeros(len(query), dtype=np.int32)
+        position = totals.index.get_indexer(query)
+        return np.where(position >= 0, totals.to_numpy()[np.maximum(position, 0)], 0).astype(np.int32)
+
+
+class Overloaded(Exception):
+    pass
+
+
+class ReportIngestor:
+    def __init__(self, root=REPORTS_DIR, max_pending=MAX_PENDING_REQUESTS, batch_reports=MAX_BATCH_REPORTS,
+                 flush_interval=FLUSH_INTERVAL_S, snapshot_every=SNAPSHOT_EVERY_S, segment_bytes=SEGMENT_BYTES):
+        self.root = root
+        self.rollup = ReportRollup.load(root)
+        self.wal = WriteAheadLog(os.path.join(root, WAL_DIR), segment_bytes)
+        # The replayed records are in the counts now; the next snapshot must not replay them again
+        self.rollup.position = self.wal.position
+        self.max_pending = max_pending
+        self.batch_reports = batch_reports
+        self.flush_interval = flush_interval
+        self.snapshot_every = snapshot_every
+        self.stats = collections.Counter()
+        self._queue = None
+        self._snapshot_at = time.monotonic()
+
+    async def submit(self, records):
+        # Resolves once the records are in the WAL; raises Overloaded when the queue is full
+        if self._queue.full():
+            self.stats['overloaded'] += 1
+            raise Overloaded()
+        done = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((records, done))
+        await done
+
+    async def _writer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            size = len(batch[0][0])
+            deadline = loop.time() + self.flush_interval
+            # Group commit: everything that arrives within flush_interval, up to batch_reports
+            while size < self.batch_reports:
+                try:
+                    item = self._queue.get_nowait() if not self._queue.empty() else \
+                        await asyncio.wait_for(self._queue.get(), max(deadline - loop.time(), 0))
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                size += len(item[0])
+            records = [record for item in batch for record in item[0]]
+            data = ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records).encode()
+            try:
+                position = await loop.run_in_executor(None, self.wal.append, data)
+            except OSError as exc:
+                for _, done in batch:
+                    if not done.done():
+                        done.set_exception(exc)
+                continue
+            self.rollup.add(records)
+            self.rollup.position = position
+            self.stats['reports'] += len(records)
+            self.stats['batches'] += 1
+            for _, done in batch:
+                if not done.done():
+                    done.set_result(None)
+            if time.monotonic() - self._snapshot_at >= self.snapshot_every:
+                await loop.run_in_executor(None, self.snapshot)
+
+    def snapshot(self):
+        # Rollup + WAL position; segments before the position's segment are no longer needed
+        self.rollup.save(os.path.join(self.root, SNAPSHOT_FILE))
+        self.wal.drop_before(self.rollup.position[0])
+        self._snapshot_at = time.monotonic()
+
+    async def handle_reports(self, body):
+        # (status, payload) for POST /reports
+        try:
+            reports = parse_reports(body)
+        except (ValueError, UnicodeDecodeError):
+            return 400, {'error': 'body must be JSON or newline-delimited JSON'}
+        if not isinstance(reports, list) or len(reports) > MAX_REPORTS_PER_REQUEST:
+            return 400, {'error': f'at most {MAX_REPORTS_PER_REQUEST} reports per request'}
+        now = datetime.datetime.now(datetime.timezone.utc)
+        accepted, rejected = [], []
+        for i, report in enumerate(reports):
+            record, error = validate_report(report, now)
+            if error:
+                rejected.append({'index': i, 'error': error})
+            else:
+                accepted.append(record)
+        self.stats['rejected'] += len(rejected)
+        if accepted:
+            try:
+                await self.submit(accepted)
+            except Overloaded:
+                return 503, {'error': 'overloaded, retry later'}
+        return (202 if accepted else 400), {'accepted': len(accepted), 'ids': [r['id'] for r in accepted],
+                                            'rejected': rejected}
+
+    def handle_rollup(self, params):
+        # GET /rollup?level=15&year=2025&month=7 -> counts per cell/month/category for dashboards
+        try:
+            level = int(params.get('level', BASE_LEVEL))
+            values = {key: int(params[key]) for key in ('year', 'month') if key in params}
+        except ValueError:
+            return 400, {'error': 'level, year and month must be integers'}
+        if not 0 <= level <= BASE_LEVEL:
+            return 400, {'error': f'level must be between 0 and {BASE_LEVEL}'}
+        df = self.rollup.frame(level)
+        for key, value in values.items():
+            df = df[df[key] == value]
+        df = df.assign(category=df['category'].astype(str), cell=df['cell'].astype(str))
+        return 200, {'cells': df.to_dict(orient='records')}
+
+    async def _route(self, method, target, body):
+        url = urlparse(target)
+        if url.path == '/reports' and method == 'POST':
+            return await self.handle_reports(body)
+        if url.path == '/rollup' and method == 'GET':
+            return self.handle_rollup(dict(parse_qsl(url.query)))
+        if url.path == '/health' and method == 'GET':
+            return 200, {'pending': self._queue.qsize(), **self.stats}
+        return 404, {'error': 'not found'}
+
+    async def _handle(self, reader, writer):
+        # Minimal HTTP/1.1 with keep-alive
+        try:
+            while True:
+                request_line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT_S)
+                if not request_line:
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY_BYTES:
+                    status, payload, keep_alive = 413, {'error': f'body over {MAX_BODY_BYTES} bytes'}, False
+                else:
+                    body = await reader.readexactly(length) if length else b''
+                    status, payload = await self._route(method, target, body)
+                    keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                data = json.dumps(payload).encode()
+                head = [f'HTTP/1.1 {status} {_REASONS.get(status, "")}', 'Content-Type: application/json',
+                        f'Content-Length: {len(data)}', 'Connection: ' + ('keep-alive' if keep_alive else 'close')]
+                if status == 503:
+                    head.append('Retry-After: 1')
+                writer.write(('\r\n'.join(head) + '\r\n\r\n').encode() + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='localhost', port=PORT, ready=None):
+        # Runs until cancelled; the rollup is snapshotted on the way out
+        self._queue = asyncio.Queue(self.max_pending)
+        writer_task = asyncio.create_task(self._writer())
+        server = await asyncio.start_server(self._handle, host, port, backlog=1024)
+        if ready is not None:
+            ready.set_result(server.sockets[0].getsockname()[:2])
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            writer_task.cancel()
+            self.snapshot()
+            self.wal.close()
+
+
+_REASONS = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large',
+            503: 'Service Unavailable'}
+
+
+def serve(root=REPORTS_DIR, host='localhost', port=PORT):
+    ingestor = ReportIngestor(root)
+    print(f'Receiving safety reports at http://{host}:{port}/reports')
+    try:
+        asyncio.run(ingestor.serve(host, port))
+    except KeyboardInterrupt:
+        pass
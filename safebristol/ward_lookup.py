@@ -0,0 +1,191 @@
+# SafeBristol: fast point-in-ward and nearest-street lookup for crime points.
+# Ward polygons are read from a local GeoJSON file (e.g. the Bristol Open Data
+# ward boundaries, not shipped with the repo: see README) and rasterised once onto a regular lat/lng grid. Cells that
+# lie wholly inside one ward resolve a point with a single array index; only
+# points in cells crossed by a ward boundary get an exact even-odd polygon
+# test, and only against the wards that touch that cell. Streets are matched
+# with a KD-tree over locally projected coordinates.
+
+import json
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+WARDS_PATH = 'Data/bristol_wards.geojson'
+WARDS_MISSING = f'{WARDS_PATH} not found; ward features are skipped (see README: Ward boundaries).'
+DEFAULT_CELL_SIZE = 0.001
+CODE_PROPERTIES = ['WARD_CODE', 'ward_code', 'WD23CD', 'WD22CD', 'WD21CD', 'code']
+NAME_PROPERTIES = ['WARD_NAME', 'ward_name', 'WD23NM', 'WD22NM', 'WD21NM', 'name']
+EARTH_RADIUS_M = 6371000.0
+
+
+def _pick(properties, candidates):
+    for key in candidates:
+        if properties.get(key) is not None:
+            return properties[key]
+    return None
+
+
+def points_in_rings(lng, lat, rings, chunk_cells=4000000):
+    # Even-odd rule over every ring of a (multi)polygon, so holes are handled too.
+    # lng/lat: arrays of points; rings: list of (N, 2) lng/lat vertex arrays.
+    # Points are tested against all edges of a ring at once, in chunks that keep
+    # the (points x edges) intermediate arrays bounded.
+    lng = np.asarray(lng, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    inside = np.zeros(len(lng), dtype=bool)
+    for ring in rings:
+        ax, ay = ring[:, 0], ring[:, 1]
+        bx, by = np.roll(ax, -1), np.roll(ay, -1)
+        keep = ay != by
+        ax, ay, bx, by = ax[keep], ay[keep], bx[keep], by[keep]
+        slope = (bx - ax) / (by - ay)
+        step = max(1, chunk_cells // max(len(ax), 1))
+        for start in range(0, len(lng), step):
+            px = lng[start:start + step, None]
+            py = lat[start:start + step, None]
+            crosses = (ay > py) != (by > py)
+            x_cross = ax + (py - ay) * slope
+            inside[start:start + step] ^= (np.count_nonzero(crosses & (px < x_cross), axis=1) % 2).astype(bool)
+    return inside
+
+
+def _segment_samples(ring, spacing):
+    # Points along every edge of a closed ring, consecutive samples < spacing apart
+    a = ring
+    b = np.roll(ring, -1, axis=0)
+    lengths = np.abs(b - a).max(axis=1)
+    steps = np.maximum(1, np.ceil(lengths / spacing).astype(np.int64))
+    edge = np.repeat(np.arange(len(a)), steps + 1)
+    offsets = np.arange(len(edge)) - np.repeat(np.cumsum(steps + 1) - (steps + 1), steps + 1)
+    t = offsets / np.repeat(steps, steps + 1)
+    points = a[edge] + t[:, None] * (b[edge] - a[edge])
+    return points, edge
+
+
+class WardIndex:
+    def __init__(self, codes, names, polygons, cell_size=DEFAULT_CELL_SIZE):
+        # polygons: one list of (N, 2) lng/lat rings per ward
+        self.codes = list(codes)
+        self.names = list(names)
+        self.polygons = polygons
+        self.cell_size = cell_size
+        vertices = np.concatenate([ring for rings in polygons for ring in rings])
+        self.west, self.south = vertices.min(axis=0) - cell_size
+        east, north = vertices.max(axis=0) + cell_size
+        self.n_cols = int(np.ceil((east - self.west) / cell_size))
+        self.n_rows = int(np.ceil((north - self.south) / cell_size))
+        n_cells = self.n_rows * self.n_cols
+
+        # Cells touched by a ward edge are "boundary" cells with candidate wards
+        self.candidates = np.zeros((n_cells, len(polygons)), dtype=bool)
+        for w, rings in enumerate(polygons):
+            for ring in rings:
+                points, edge = _segment_samples(ring, cell_size / 2)
+                rows, cols = self._cell_rc(points[:, 1], points[:, 0])
+                self.candidates[rows * self.n_cols + cols, w] = True
+                # Consecutive samples on one edge are < 1 cell apart; when both row and
+                # column change the segment also passes through one of the two corner
+                # cells, so mark both to cover every cell the edge touches.
+                same_edge = edge[1:] == edge[:-1]
+                diagonal = same_edge & (rows[1:] != rows[:-1]) & (cols[1:] != cols[:-1])
+                self.candidates[rows[:-1][diagonal] * self.n_cols + cols[1:][diagonal], w] = True
+                self.candidates[rows[1:][diagonal] * self.n_cols + cols[:-1][diagonal], w] = True
+        boundary = self.candidates.any(axis=1)
+
+        # Interior cells take the ward containing their centre
+        self.cell_ward = np.full(n_cells, -1, dtype=np.int32)
+        rows, cols = np.divmod(np.arange(n_cells), self.n_cols)
+        centre_lat = self.south + (rows + 0.5) * cell_size
+        centre_lng = self.west + (cols + 0.5) * cell_size
+        for w, rings in enumerate(polygons):
+            ring_vertices = np.concatenate(rings)
+            in_bbox = (~boundary
+                       & (centre_lng >= ring_vertices[:, 0].min()) & (centre_lng <= ring_vertices[:, 0].max())
+                       & (centre_lat >= ring_vertices[:, 1].min()) & (centre_lat <= ring_vertices[:, 1].max()))
+            cells = np.flatnonzero(in_bbox)
+            inside = points_in_rings(centre_lng[cells], centre_lat[cells], rings)
+            self.cell_ward[cells[inside]] = w
+        self.boundary = boundary
+
+    @classmethod
+    def from_geojson(cls, path=WARDS_PATH, code_property=None, name_property=None, cell_size=DEFAULT_CELL_SIZE):
+        with open(path) as f:
+            collection = json.load(f)
+        codes, names, polygons = [], [], []
+        for feature in collection['features']:
+            geometry = feature.get('geometry') or {}
+            properties = feature.get('properties') or {}
+            if geometry.get('type') == 'Polygon':
+                parts = [geometry['coordinates']]
+            elif geometry.get('type') == 'MultiPolygon':
+                parts = geometry['coordinates']
+            else:
+                continue
+            rings = [np.asarray(ring, dtype=np.float64)[:, :2] for part in parts for ring in part]
+            codes.append(properties.get(code_property) if code_property else _pick(properties, CODE_PROPERTIES))
+            names.append(properties.get(name_property) if name_property else _pick(properties, NAME_PROPERTIES))
+            polygons.append(rings)
+        return cls(codes, names, polygons, cell_size)
+
+    def _cell_rc(self, lat, lng):
+        rows = np.floor((np.asarray(lat, dtype=np.float64) - self.south) / self.cell_size).astype(np.int64)
+        cols = np.floor((np.asarray(lng, dtype=np.float64) - self.west) / self.cell_size).astype(np.int64)
+        return rows, cols
+
+    def lookup(self, lat, lng):
+        # Ward index (into self.codes/self.names) for every point, -1 outside all wards
+        lat = np.asarray(lat, dtype=np.float64)
+        lng = np.asarray(lng, dtype=np.float64)
+        rows, cols = self._cell_rc(lat, lng)
+        in_grid = (rows >= 0) & (rows < self.n_rows) & (cols >= 0) & (cols < self.n_cols) & ~np.isnan(lat) & ~np.isnan(lng)
+        cells = np.where(in_grid, rows * self.n_cols + cols, 0)
+        result = np.where(in_grid, self.cell_ward[cells], -1).astype(np.int32)
+
+        edge_points = np.flatnonzero(in_grid & self.boundary[cells])
+        for w, rings in enumerate(self.polygons):
+            points = edge_points[self.candidates[cells[edge_points], w]]
+            points = points[result[points] < 0]
+            if len(points):
+                inside = points_in_rings(lng[points], lat[points], rings)
+                result[points[inside]] = w
+        return result
+
+    def assign(self, df, lat_col='lat', lng_col='lng'):
+        # Adds categorical WARD_CODE / WARD_NAME columns for joining to the ward statistics
+        ward = self.lookup(df[lat_col], df[lng_col])
+        df = df.copy()
+        df['WARD_CODE'] = pd.Categorical.from_codes(ward, categories=pd.Index(self.codes, dtype=object))
+        df['WARD_NAME'] = pd.Categorical.from_codes(ward, categories=pd.Index(self.names, dtype=object))
+        return df
+
+
+def _project(lat, lng, ref_lat):
+    # Equirectangular metres around ref_lat; accurate to well under 1% across a city
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lng = np.radians(np.asarray(lng, dtype=np.float64))
+    return np.column_stack([lng * np.cos(np.radians(ref_lat)) * EARTH_RADIUS_M, lat * EARTH_RADIUS_M])
+
+
+class StreetIndex:
+    def __init__(self, names, lat, lng):
+        # One entry per street point; duplicate (name, point) pairs are dropped
+        points = pd.DataFrame({'name': names, 'lat': lat, 'lng': lng}).dropna().drop_duplicates()
+        self.names = points['name'].to_numpy(dtype=object)
+        self.ref_lat = float(points['lat'].mean())
+        self.tree = cKDTree(_project(points['lat'], points['lng'], self.ref_lat))
+
+    @classmethod
+    def from_crimes(cls, df):
+        # police.uk snaps every crime to an anonymised street point, which doubles as a street gazetteer
+        return cls(df['street_name'].astype(object), df['lat'], df['lng'])
+
+    def nearest(self, lat, lng, max_distance=None):
+        # Returns (street names, distances in metres); None where nothing is within max_distance
+        distances, index = self.tree.query(_project(lat, lng, self.ref_lat),
+                                           distance_upper_bound=max_distance if max_distance else np.inf)
+        found = np.isfinite(distances)
+        names = np.full(len(index), None, dtype=object)
+        names[found] = self.names[index[found]]
+        return names, distances
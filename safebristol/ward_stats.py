@@ -0,0 +1,116 @@
+# SafeBristol: indexed ward crime statistics from Data/Crime_in_Bristol_by_Ward.csv.
+# The CSV (one row per ward, crime type and financial-year period) is loaded once
+# into dense float32 cubes indexed [ward, crime type, period]. Rankings and
+# year-over-year deltas are precomputed for every (crime type, period), so a
+# rate, trend, top-N or delta query is an array index. The same arrays feed model
+# features (by WARD_CODE and crime date) and the dashboard ward panel.
+
+import numpy as np
+import pandas as pd
+
+WARD_STATS_PATH = 'Data/Crime_in_Bristol_by_Ward.csv'
+ALL_CRIMES = 'All Crimes'
+
+
+def financial_period(years, months):
+    # Police/council statistics run April-March: 2016-04..2017-03 -> '2016/17'
+    years = np.asarray(years, dtype=np.int64)
+    months = np.asarray(months, dtype=np.int64)
+    start = np.where(months >= 4, years, years - 1)
+    return np.char.add(np.char.add(start.astype(str), '/'), np.char.zfill(((start + 1) % 100).astype(str), 2))
+
+
+class WardStats:
+    def __init__(self, df):
+        ward_codes, self.wards = pd.factorize(df['WARD_CODE'], sort=True)
+        type_codes, self.crime_types = pd.factorize(df['CRIME_TYPE'], sort=True)
+        period_codes, self.periods = pd.factorize(df['PERIOD'], sort=True)
+        names = df.drop_duplicates('WARD_CODE').set_index('WARD_CODE')['WARD_NAME']
+        self.ward_names = names.reindex(self.wards).to_numpy(dtype=object)
+        self._ward_index = {code: i for i, code in enumerate(self.wards)}
+        self._name_index = {name: i for i, name in enumerate(self.ward_names)}
+        self._type_index = {name: i for i, name in enumerate(self.crime_types)}
+        self._period_index = {name: i for i, name in enumerate(self.periods)}
+
+        shape = (len(self.wards), len(self.crime_types), len(self.periods))
+        self.rate = np.full(shape, np.nan, dtype=np.float32)
+        self.count = np.full(shape, np.nan, dtype=np.float32)
+        self.population = np.full(shape, np.nan, dtype=np.float32)
+        self.rate[ward_codes, type_codes, period_codes] = df['WARD_STATISTIC'].to_numpy(dtype=np.float32)
+        self.count[ward_codes, type_codes, period_codes] = df['WARD_NUMBER'].to_numpy(dtype=np.float32)
+        self.population[ward_codes, type_codes, period_codes] = df['WARD_POP_MID_YEAR'].to_numpy(dtype=np.float32)
+
+        # Wards ordered by rate (highest first, missing last) for every crime type and period
+        self.order = np.argsort(np.where(np.isnan(self.rate), -np.inf, -self.rate), axis=0, kind='stable')
+        # Rank 1 = highest rate
+        self.rank = np.empty_like(self.order)
+        np.put_along_axis(self.rank, self.order, np.arange(1, shape[0] + 1)[:, None, None], axis=0)
+        # Change against the previous period; NaN for the first period
+        self.delta = np.full(shape, np.nan, dtype=np.float32)
+        self.delta[:, :, 1:] = self.rate[:, :, 1:] - self.rate[:, :, :-1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.delta_pct = np.where(self.rate[:, :, :-1] > 0, self.delta[:, :, 1:] / self.rate[:, :, :-1] * 100, np.nan)
+        self.delta_pct = np.concatenate([np.full(shape[:2] + (1,), np.nan, dtype=np.float32),
+                                         self.delta_pct.astype(np.float32)], axis=2)
+
+    @classmethod
+    def load(cls, path=WARD_STATS_PATH):
+        return cls(pd.read_csv(path))
+
+    def _ward(self, ward):
+        # Accepts a WARD_CODE or a WARD_NAME
+        return self._ward_index[ward] if ward in self._ward_index else self._name_index[ward]
+
+    def rate_for(self, ward, crime_type=ALL_CRIMES, period=None):
+        period = self.periods[-1] if period is None else period
+        return float(self.rate[self._ward(ward), self._type_index[crime_type], self._period_index[period]])
+
+    def trend(self, ward, crime_type=ALL_CRIMES):
+        # Rate per period for one ward
+        return pd.Series(self.rate[self._ward(ward), self._type_index[crime_type]], index=self.periods)
+
+    def top_wards(self, crime_type=ALL_CRIMES, period=None, n=10):
+        period = self.periods[-1] if period is None else period
+        t, p = self._type_index[crime_type], self._period_index[period]
+        top = self.order[:n, t, p]
+        top = top[~np.isnan(self.rate[top, t, p])]
+        return pd.DataFrame({
+            'WARD_CODE': self.wards[top],
+            'WARD_NAME': self.ward_names[top],
+            'rate': self.rate[top, t, p],
+            'change': self.delta[top, t, p],
+            'change_pct': self.delta_pct[top, t, p],
+        }, index=pd.RangeIndex(1, len(top) + 1, name='rank'))
+
+    def biggest_changes(self, crime_type=ALL_CRIMES, period=None, n=10, increases=True):
+        # Wards with the largest year-over-year rise (or fall) in rate
+        period = self.periods[-1] if period is None else period
+        t, p = self._type_index[crime_type], self._period_index[period]
+        delta = self.delta[:, t, p]
+        valid = np.flatnonzero(~np.isnan(delta))
+        order = valid[np.argsort(-delta[valid] if increases else delta[valid], kind='stable')][:n]
+        return pd.DataFrame({
+            'WARD_CODE': self.wards[order],
+            'WARD_NAME': self.ward_names[order],
+            'rate': self.rate[order, t, p],
+            'change': delta[order],
+        })
+
+    def features(self, ward_codes, years, months, crime_type=ALL_CRIMES):
+        # Vectorised model features for crimes with a WARD_CODE and year/month:
+        # the ward's rate, rank and year-over-year change in the matching period.
+        # Each crime uses the latest covered period up to its own (the first for earlier crimes).
+        ward = pd.Series(ward_codes, dtype=object).map(self._ward_index).fillna(-1).to_numpy(dtype=np.int64)
+        periods = financial_period(years, months)
+        known = np.array(self.periods, dtype=str)
+        period = np.maximum(np.searchsorted(known, periods, side='right') - 1, 0)
+        t = self._type_index[crime_type]
+        valid = ward >= 0
+        w = np.maximum(ward, 0)
+        out = pd.DataFrame({
+            'ward_rate': self.rate[w, t, period],
+            'ward_rank': self.rank[w, t, period].astype(np.float32),
+            'ward_rate_change': self.delta[w, t, period],
+        })
+        out.loc[~valid, :] = np.nan
+        return out
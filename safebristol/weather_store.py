@@ -0,0 +1,127 @@
+# SafeBristol: daily Bristol weather as an indexed feature source.
+# Data/bristol_weather_cleaned.xlsx is loaded once into dense NumPy arrays with
+# one slot per calendar day (gaps carried forward from the last observation), so
+# looking up any batch of dates is a single array index. Monthly aggregates and
+# 7/30-day rolling aggregates are precomputed at load time. Crimes are reported
+# per month, so the model and dashboards join on the monthly table, which has
+# exactly one row per (year, month) and never fans crimes out.
+
+import numpy as np
+import pandas as pd
+
+from .crime_store import read_table_cached
+
+WEATHER_PATH = 'Data/bristol_weather_cleaned.xlsx'
+DAILY_COLUMNS = ['temperature_max', 'temperature_min', 'precipitation_sum', 'windspeed_max']
+ROLLING_WINDOWS = [7, 30]
+
+
+def weather_condition(codes):
+    # WMO weather interpretation codes -> the coarse labels the model uses
+    codes = np.asarray(codes)
+    labels = np.full(codes.shape, 'Clear', dtype=object)
+    labels[(codes >= 1) & (codes <= 3)] = 'Cloudy'
+    labels[(codes == 45) | (codes == 48)] = 'Fog'
+    labels[((codes >= 51) & (codes <= 67)) | ((codes >= 80) & (codes <= 82))] = 'Rain'
+    labels[((codes >= 71) & (codes <= 77)) | (codes == 85) | (codes == 86)] = 'Snow'
+    labels[codes >= 95] = 'Thunderstorm'
+    return labels
+
+
+class WeatherStore:
+    def __init__(self, daily):
+        # daily: DataFrame with a 'date' column plus DAILY_COLUMNS and 'weather_code'
+        daily = daily.dropna(subset=['date']).sort_values('date').drop_duplicates('date', keep='last')
+        days = daily['date'].to_numpy(dtype='datetime64[D]')
+        self.first_day = days[0]
+        self.last_day = days[-1]
+        full = pd.DataFrame(index=pd.date_range(days[0], days[-1], freq='D'))
+        daily = daily.set_index(pd.DatetimeIndex(days)).reindex(full.index).ffill()
+
+        self.daily = {col: daily[col].to_numpy(dtype=np.float32) for col in DAILY_COLUMNS}
+        self.daily['weather_code'] = daily['weather_code'].to_numpy(dtype=np.int16)
+        self.daily['temperature'] = (self.daily['temperature_max'] + self.daily['temperature_min']) / 2
+        for window in ROLLING_WINDOWS:
+            rolling = daily[['temperature_max', 'precipitation_sum']].rolling(window, min_periods=1)
+            self.daily[f'temperature_max_{window}d'] = rolling['temperature_max'].mean().to_numpy(dtype=np.float32)
+            self.daily[f'precipitation_{window}d'] = rolling['precipitation_sum'].sum().to_numpy(dtype=np.float32)
+
+        months = daily.index.year * 12 + daily.index.month - 1
+        self.first_period = int(months[0])
+        grouped = daily.groupby(months)
+        monthly = pd.DataFrame({
+            'temperature_max': grouped['temperature_max'].mean(),
+            'temperature_min': grouped['temperature_min'].mean(),
+            'precipitation_sum': grouped['precipitation_sum'].sum(),
+            'windspeed_max': grouped['windspeed_max'].mean(),
+            'rainy_days': grouped['precipitation_sum'].apply(lambda p: int((p >= 1.0).sum())),
+            # Most frequent condition of the month
+            'weather_code': grouped['weather_code'].agg(lambda c: c.mode().iloc[0]),
+        })
+        monthly['temperature'] = (monthly['temperature_max'] + monthly['temperature_min']) / 2
+        monthly = monthly.reindex(range(self.first_period, int(months[-1]) + 1))
+        self.monthly = {col: monthly[col].to_numpy(dtype=np.float32) for col in monthly.columns}
+        self.monthly_condition = np.where(
+            np.isnan(self.monthly['weather_code']), None,
+            weather_condition(np.nan_to_num(self.monthly['weather_code']).astype(int)),
+        )
+
+    @classmethod
+    def load(cls, path=WEATHER_PATH):
+        daily = read_table_cached(path)
+        daily['date'] = pd.to_datetime(daily['date'])
+        return cls(daily)
+
+    def _day_index(self, dates):
+        # As-of position of each date in the daily arrays; -1 if outside the series
+        days = pd.to_datetime(pd.Series(dates)).to_numpy(dtype='datetime64[D]')
+        index = (days - self.first_day).astype(np.int64)
+        valid = ~np.isnat(days) & (index >= 0) & (days <= self.last_day)
+        return np.where(valid, index, -1)
+
+    def daily_features(self, dates, columns=None):
+        index = self._day_index(dates)
+        valid = index >= 0
+        out = {}
+        for col in columns or list(self.daily):
+            values = self.daily[col][np.maximum(index, 0)].astype(np.float32)
+            values[~valid] = np.nan
+            out[col] = values
+        return pd.DataFrame(out)
+
+    def _month_index(self, years, months):
+        years = pd.to_numeric(pd.Series(years), errors='coerce').to_numpy(dtype=np.float64)
+        months = pd.to_numeric(pd.Series(months), errors='coerce').to_numpy(dtype=np.float64)
+        index = years * 12 + months - 1 - self.first_period
+        valid = ~np.isnan(index) & (index >= 0) & (index < len(self.monthly_condition))
+        return np.where(valid, np.nan_to_num(index), -1).astype(np.int64)
+
+    def monthly_features(self, years, months, columns=None):
+        # One row per input (year, month) pair, NaN where the series has no data
+        index = self._month_index(years, months)
+        valid = index >= 0
+        out = {}
+        for col in columns or list(self.monthly):
+            values = self.monthly[col][np.maximum(index, 0)]
+            values[~valid] = np.nan
+            out[col] = values
+        condition = self.monthly_condition[np.maximum(index, 0)]
+        condition[~valid] = None
+        out['weather_condition'] = pd.Categorical(condition)
+        return pd.DataFrame(out)
+
+    def add_monthly_features(self, df, columns=None):
+        # Returns a copy of df with the monthly weather of each row's year/month
+        features = self.monthly_features(df['year'], df['month'], columns)
+        features.index = df.index
+        df = df.drop(columns=[c for c in features.columns if c in df.columns])
+        return pd.concat([df, features], axis=1)
+
+    def monthly_table(self):
+        # One row per (year, month) for dashboards and correlation views
+        periods = np.arange(self.first_period, self.first_period + len(self.monthly_condition))
+        table = pd.DataFrame({'year': periods // 12, 'month': periods % 12 + 1})
+        for col, values in self.monthly.items():
+            table[col] = values
+        table['weather_condition'] = self.monthly_condition
+        return table
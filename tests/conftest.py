@@ -0,0 +1,30 @@
+# Shared fixtures for the SafeBristol tests. The local police.uk stand-in and the
+# synthetic crime generator live with the benchmarks and are reused here.
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import mock_police_api
+from synthetic import synthetic_frame, to_records
+
+
+@pytest.fixture
+def crimes_frame():
+    # 3 months of synthetic crimes (2022-01 .. 2022-03)
+    return synthetic_frame(3000, n_months=3, seed=1)
+
+
+@pytest.fixture
+def police_api(crimes_frame):
+    # (api, api_url): the mock police.uk endpoint serving crimes_frame
+    api = mock_police_api.MockPoliceAPI(to_records(crimes_frame))
+    httpd, api_url = mock_police_api.serve_in_background(api)
+    yield api, api_url
+    httpd.shutdown()
+    httpd.server_close()
@@ -0,0 +1,119 @@
+import json
+import asyncio
+
+import pandas as pd
+
+from safebristol.alerts import AlertEngine, GeofenceIndex, alert_on, deliver, publish
+from safebristol.cli import main
+from safebristol.crime_store import write_crimes
+from synthetic import synthetic_frame
+
+LAT, LNG = 51.4545, -2.5879
+M_PER_DEG_LAT = 111_195.0
+
+
+def _crimes(north_m, categories=None, wards=None, ids=None):
+    # One crime per offset, north of (LAT, LNG) by that many metres
+    n = len(north_m)
+    return pd.DataFrame({'id': ids if ids is not None else range(n),
+                         'lat': [LAT + m / M_PER_DEG_LAT for m in north_m], 'lng': [LNG] * n,
+                         'category': categories or ['burglary'] * n, 'ward': wards or [None] * n,
+                         'year': 2025, 'month': 7})
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_circle_and_ward_fences_match():
+    index = GeofenceIndex()
+    index.add_circle('near', 'ann', LAT, LNG, 300)
+    index.add_circle('wide', 'bob', LAT, LNG, 5000)
+    index.add_ward('ward', 'cat', 'E05010885')
+    index.add_ward('ward-name', 'dan', 'ashley')
+    alerts = AlertEngine(index).process('crime', _crimes([100, 1000], wards=['Ashley', None]).assign(
+        WARD_CODE=['E05010885', None]))
+    matched = {(a['subscription'], a['event']) for a in alerts}
+    assert matched == {('near', 'crime:0'), ('wide', 'crime:0'), ('wide', 'crime:1'),
+                       ('ward', 'crime:0'), ('ward-name', 'crime:0')}
+    near = next(a for a in alerts if a['subscription'] == 'near')
+    assert abs(near['distance_m'] - 100) < 1
+    assert next(a for a in alerts if a['subscription'] == 'ward')['distance_m'] is None
+    # A removed fence stops matching at once
+    index.remove('wide')
+    assert {a['subscription'] for a in AlertEngine(index).process('crime', _crimes([1000], ids=[5]))} == set()
+
+
+def test_category_filter():
+    index = GeofenceIndex()
+    index.add_circle('burglary', 'ann', LAT, LNG, 300, categories=['burglary'])
+    index.add_circle('any', 'bob', LAT, LNG, 300)
+    alerts = AlertEngine(index).process('crime', _crimes([0, 0], categories=['burglary', 'drugs']))
+    assert sorted((a['user'], a['category']) for a in alerts) == [('ann', 'burglary'), ('bob', 'burglary'),
+                                                                  ('bob', 'drugs')]
+
+
+def test_one_alert_per_user_and_event():
+    index = GeofenceIndex()
+    index.add_circle('home', 'ann', LAT, LNG, 300)
+    index.add_circle('work', 'ann', LAT, LNG, 1000)
+    engine = AlertEngine(index)
+    assert len(engine.process('crime', _crimes([50]))) == 1
+    # The same crime again (e.g. a re-fetched month) is not alerted twice
+    assert engine.process('crime', _crimes([50])) == []
+    # Per batch, the second fence's match; then the crime already alerted
+    assert engine.stats['duplicates'] == 3
+
+
+def test_rate_limit_counts_suppressed_alerts():
+    clock = Clock()
+    index = GeofenceIndex()
+    index.add_circle('home', 'ann', LAT, LNG, 300)
+    engine = AlertEngine(index, alerts_per_hour=3600, burst=2, clock=clock)
+    assert len(engine.process('crime', _crimes([0] * 5))) == 2
+    assert engine.stats['rate_limited'] == 3
+    clock.now += 1.0
+    alerts = engine.process('crime', _crimes([0], ids=[10]))
+    assert len(alerts) == 1 and alerts[0]['suppressed'] == 3
+
+
+def test_run_merges_queued_batches_and_filters_risk():
+    index = GeofenceIndex()
+    index.add_circle('home', 'ann', LAT, LNG, 300, min_risk=0.5)
+    engine = AlertEngine(index, burst=10)
+    risk = pd.DataFrame({'unit': [1, 2], 'lat': [LAT, LAT], 'lng': [LNG, LNG], 'risk': [0.9, 0.2],
+                         'month': '2025-08'})
+    sent = []
+    assert alert_on(engine, [('crime', _crimes([0, 10, 20])), ('risk', risk)], sent.append, batch_rows=2) == 4
+    assert [a['kind'] for a in sent] == ['crime'] * 3 + ['risk']
+    assert sent[-1]['event'] == 'risk:1:2025-08'
+
+    async def run():
+        # Everything already queued is matched together, then the sentinel ends both sides
+        source, sink = asyncio.Queue(), asyncio.Queue(1)
+        await publish(source, 'crime', _crimes([0, 10, 20], ids=[7, 8, 9]), batch_rows=1)
+        await source.put(None)
+        received = []
+        await asyncio.gather(engine.run(source, sink), deliver(sink, received.append))
+        return received
+
+    assert [a['event'] for a in asyncio.run(run())] == ['crime:7', 'crime:8', 'crime:9']
+    assert engine.stats['crime_events'] == 6
+
+
+def test_cli_alerts_on_the_newest_month(tmp_path, capsys):
+    store = str(tmp_path / 'store')
+    df = synthetic_frame(3000, n_months=3, seed=1)
+    write_crimes(df, store)
+    newest = df[df['month'] == df['month'].max()]
+    path = tmp_path / 'subscriptions.json'
+    path.write_text(json.dumps([{'id': 'centre', 'user': 'ann', 'lat': float(newest['lat'].median()),
+                                 'lng': float(newest['lng'].median()), 'radius_m': 20000}]))
+    assert main(['--store', store, 'alerts', str(path)]) == 0
+    alerts = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert len(alerts) == 4        # the default burst; the rest are rate limited
+    assert {a['month'] for a in alerts} == {f"{newest['year'].iloc[0]}-{newest['month'].iloc[0]:02d}"}
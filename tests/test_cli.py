@@ -0,0 +1,39 @@
+import json
+import os
+
+import numpy as np
+
+from safebristol import crime_training
+from safebristol.cli import main
+from safebristol.crime_features import normalise_crimes
+from safebristol.crime_model import LATEST_FILE, METADATA_FILE
+from safebristol.crime_store import write_crimes
+from synthetic import synthetic_frame, to_records
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def test_train_labels_codes_across_months(tmp_path, monkeypatch):
+    # A store written month by month, as ingest does; the first month has no
+    # anti-social behaviour, so each month's own codes would disagree
+    store, models = str(tmp_path / 'store'), str(tmp_path / 'models')
+    records = to_records(synthetic_frame(3000, n_months=5, seed=1))
+    for i, month in enumerate(sorted({r['month'] for r in records})):
+        write_crimes(normalise_crimes([r for r in records if r['month'] == month
+                                       and (i or r['category'] != 'anti-social-behaviour')]), store)
+    trained = []
+
+    def train_model(df, *args, **kwargs):
+        trained.append(df)
+        return real_train_model(df, *args, **kwargs)
+
+    real_train_model = crime_training.train_model
+    monkeypatch.setattr(crime_training, 'train_model', train_model)
+    monkeypatch.chdir(ROOT)      # weather data is read from Data/
+    assert main(['--store', store, '--models', models, 'train', '--full']) == 0
+    with open(os.path.join(models, 'random_forest', LATEST_FILE)) as f:
+        version = f.read().strip()
+    with open(os.path.join(models, 'random_forest', version, METADATA_FILE)) as f:
+        labels = np.asarray(json.load(f)['category_labels'])
+    df = trained[0]
+    assert (labels[df['category_code'].to_numpy()] == df['category'].astype(str).to_numpy()).all()
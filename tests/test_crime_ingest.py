@@ -0,0 +1,102 @@
+import os
+import json
+import types
+
+from safebristol.crime_ingest import (BRISTOL_POLY, MANIFEST_FILE, MAX_RETRY_DELAY_S, _retry_delay, checkpoint_path,
+                                      content_hash, fetch_months, load_checkpoint)
+
+MONTHS = ['2022-01', '2022-02', '2022-03']
+FAST = {'rate': 1e6, 'burst': 1e6, 'backoff': 0.01, 'max_workers': 2}
+
+
+def _fetch(api_url, checkpoint_dir, months=MONTHS, **params):
+    return fetch_months(months, BRISTOL_POLY, api_url=api_url, checkpoint_dir=checkpoint_dir, **{**FAST, **params})
+
+
+def test_retries_429_and_5xx_then_succeeds(police_api, tmp_path):
+    api, api_url = police_api
+    api.fail('2022-02', 429, 500, 503)
+    crimes, failed = _fetch(api_url, str(tmp_path), max_retries=3)
+    assert failed == {}
+    assert len(crimes['2022-02']) == len(api.answer(BRISTOL_POLY, '2022-02')[1]) > 0
+    assert api.requests == len(MONTHS) + 3
+
+
+def test_exhausted_retries_record_failed_month(police_api, tmp_path):
+    api, api_url = police_api
+    api.fail('2022-02', 500, 500, 500)
+    crimes, failed = _fetch(api_url, str(tmp_path), max_retries=2)
+    assert set(failed) == {'2022-02'}
+    assert '2022-02' not in crimes
+    assert not os.path.exists(checkpoint_path(str(tmp_path), '2022-02'))
+
+
+def test_malformed_body_is_retried_not_raised(police_api, tmp_path):
+    api, api_url = police_api
+    api.fail('2022-01', b'[{"id": 1', b'{"not": "a list"}')
+    crimes, failed = _fetch(api_url, str(tmp_path), max_retries=2)
+    assert failed == {} and len(crimes['2022-01']) > 0
+    api.fail('2022-03', b'<html>', b'<html>')
+    crimes, failed = _fetch(api_url, str(tmp_path / 'again'), max_retries=1)
+    assert set(failed) == {'2022-03'}
+
+
+def test_unpublished_month_is_empty_and_not_checkpointed(police_api, tmp_path):
+    _, api_url = police_api
+    crimes, failed = _fetch(api_url, str(tmp_path), months=MONTHS + ['2022-04'])
+    assert failed == {} and crimes['2022-04'] == []
+    assert not os.path.exists(checkpoint_path(str(tmp_path), '2022-04'))
+    assert '2022-04' not in json.loads((tmp_path / MANIFEST_FILE).read_text())
+
+
+def test_resume_reads_checkpoints_without_requests(police_api, tmp_path):
+    api, api_url = police_api
+    first, _ = _fetch(api_url, str(tmp_path))
+    requests_made = api.requests
+    second, failed = _fetch(api_url, str(tmp_path))
+    assert failed == {} and api.requests == requests_made
+    assert second == first
+    # Only the trailing refresh window is fetched again
+    _fetch(api_url, str(tmp_path), refresh_window=1)
+    assert api.requests == requests_made + 1
+
+
+def test_manifest_records_content_hash(police_api, tmp_path):
+    api, api_url = police_api
+    _fetch(api_url, str(tmp_path))
+    manifest = json.loads((tmp_path / MANIFEST_FILE).read_text())
+    assert sorted(manifest) == MONTHS
+    for month in MONTHS:
+        crimes = load_checkpoint(str(tmp_path), month)
+        assert manifest[month]['records'] == len(crimes)
+        assert manifest[month]['sha256'] == content_hash(crimes) == content_hash(crimes[::-1])
+    # A revised month is detected on refresh
+    api.answer(BRISTOL_POLY, '2022-03')[1][0]['category'] = 'revised'
+    _fetch(api_url, str(tmp_path), refresh_window=1)
+    revised = json.loads((tmp_path / MANIFEST_FILE).read_text())
+    assert revised['2022-03']['sha256'] != manifest['2022-03']['sha256']
+    assert revised['2022-01'] == manifest['2022-01']
+
+
+def test_published_empty_month_is_checkpointed(police_api, tmp_path):
+    api, api_url = police_api
+    empty_poly = '50.1,-5.1:50.1,-5.0:50.0,-5.0:50.0,-5.1'
+    crimes, failed = fetch_months(MONTHS, empty_poly, api_url=api_url, checkpoint_dir=str(tmp_path), **FAST)
+    assert failed == {} and all(crimes[month] == [] for month in MONTHS)
+    assert load_checkpoint(str(tmp_path), '2022-01') == []
+    requests_made = api.requests
+    fetch_months(MONTHS, empty_poly, api_url=api_url, checkpoint_dir=str(tmp_path), **FAST)
+    assert api.requests == requests_made
+
+
+def test_retry_after_is_capped():
+    def response(value):
+        return types.SimpleNamespace(headers={'Retry-After': value})
+
+    assert _retry_delay(response('2'), 0, 0.01) == 2.0
+    for value in ('86400', 'inf', '1e308'):
+        assert _retry_delay(response(value), 0, 0.01) == MAX_RETRY_DELAY_S
+    # Negative values are not waited out; NaN or date-form values fall back to the backoff
+    for value in ('-5', 'nan', 'Wed, 21 Oct 2026 07:28:00 GMT'):
+        assert 0 <= _retry_delay(response(value), 0, 0.01) <= 0.02
+    assert _retry_delay(None, 20, 1.0) == MAX_RETRY_DELAY_S
@@ -0,0 +1,73 @@
+import json
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+
+from safebristol.crime_model import FOREST_DIR, CrimeModel, ForestArrays, save_model, serve_in_background
+
+FEATURES = ['lat', 'lng', 'month', 'year']
+
+
+def _fit(crimes_frame, cls=RandomForestClassifier, **params):
+    X = crimes_frame[FEATURES].to_numpy(dtype=np.float32)
+    return cls(n_estimators=10, random_state=0, **params).fit(X, crimes_frame['category_code']), X
+
+
+@pytest.mark.parametrize('cls, params', [(RandomForestClassifier, {'max_depth': 8}),
+                                         (RandomForestClassifier, {'min_samples_leaf': 3}),
+                                         (ExtraTreesClassifier, {})])
+def test_forest_arrays_match_sklearn(crimes_frame, cls, params):
+    forest, X = _fit(crimes_frame, cls, **params)
+    arrays = ForestArrays.from_forest(forest)
+    np.testing.assert_allclose(arrays.predict_proba(X), forest.predict_proba(X), atol=1e-6)
+    np.testing.assert_array_equal(arrays.classes_, forest.classes_)
+
+
+def test_forest_arrays_handle_missing_values(crimes_frame):
+    forest, X = _fit(crimes_frame)
+    X = X.copy()
+    X[::7, 0] = np.nan
+    np.testing.assert_allclose(ForestArrays.from_forest(forest).predict_proba(X), forest.predict_proba(X), atol=1e-6)
+
+
+def test_saved_forest_is_memory_mapped(crimes_frame, tmp_path):
+    forest, X = _fit(crimes_frame)
+    version_dir = save_model(forest, FEATURES, crimes_frame['category'].cat.categories, root=str(tmp_path))
+    model = CrimeModel.load(root=str(tmp_path))
+    assert isinstance(model.estimator, ForestArrays)
+    assert isinstance(model.estimator.value, np.memmap)
+    assert (tmp_path / 'random_forest' / version_dir.rsplit('/', 1)[-1] / FOREST_DIR / 'value.npy').exists()
+    np.testing.assert_allclose(model.predict_proba(crimes_frame), forest.predict_proba(X), atol=1e-6)
+    expected = np.asarray(crimes_frame['category'].cat.categories)[forest.predict(X)]
+    assert (model.predict(crimes_frame) == expected).mean() > 0.99
+
+
+def _post(url, body):
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as exc:
+        return exc.code, json.load(exc)
+
+
+def test_predict_endpoint_rejects_non_record_bodies(crimes_frame, tmp_path):
+    forest, _ = _fit(crimes_frame)
+    save_model(forest, FEATURES, crimes_frame['category'].cat.categories, root=str(tmp_path))
+    httpd = serve_in_background(CrimeModel.load(root=str(tmp_path)))
+    url = f'http://localhost:{httpd.server_address[1]}/predict'
+    try:
+        for body in (b'5', b'"text"', b'[1, 2]', b'{"lat": '):
+            status, payload = _post(url, body)
+            assert status == 400 and 'error' in payload
+        record = {'lat': 51.45, 'lng': -2.59, 'month': 3, 'year': 2022}
+        status, payload = _post(url, json.dumps([record, record]).encode())
+        assert status == 200 and len(payload['predictions']) == 2
+        status, payload = _post(url, json.dumps(record).encode())
+        assert status == 200 and len(payload['predictions']) == 1
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
@@ -0,0 +1,60 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from safebristol.crime_rollups import ROLLUP_DIMS, ROLLUP_FILE, CrimeRollups
+from safebristol.crime_store import read_crimes, write_crimes
+from synthetic import synthetic_frame
+
+
+def _with_wards(df, seed):
+    rng = np.random.default_rng(seed)
+    wards = pd.Categorical.from_codes(rng.integers(0, 5, len(df)), [f'Ward {i}' for i in range(5)])
+    return df.assign(ward=wards)
+
+
+def _assert_matches_rescan(root):
+    rollups = CrimeRollups.load(root)
+    df = read_crimes(root)
+    assert rollups.total() == len(df)
+    for dim in ROLLUP_DIMS:
+        expected = df[dim].astype(object).value_counts()
+        counts = rollups.counts(dim)
+        assert counts.to_dict() == expected.to_dict(), dim
+    by_month = df.groupby(['year', 'month']).size()
+    trend = rollups.trend().set_index(['year', 'month'])['count']
+    trend = trend[trend > 0]
+    assert trend.to_dict() == {key: int(value) for key, value in by_month.items()}
+    category = df['category'].astype(object).iloc[0]
+    trend = rollups.trend(category).set_index(['year', 'month'])['count']
+    expected = df[df['category'].astype(object) == category].groupby(['year', 'month']).size()
+    assert trend[trend > 0].to_dict() == {key: int(value) for key, value in expected.items()}
+
+
+def _replacement(seed):
+    # New crimes for 2022-02 and 2023-01; the year and month filters also select
+    # 2022-01, which is not replaced and must stay counted
+    df = _with_wards(synthetic_frame(800, n_months=2, seed=seed), seed)
+    df['year'] = np.where(df['month'] == 1, 2023, 2022).astype(np.int16)
+    df['month'] = np.where(df['month'] == 1, 1, 2).astype(np.int16)
+    return df
+
+
+def test_rollups_match_a_rescan_after_overwriting_a_month(crimes_frame, tmp_path):
+    root = str(tmp_path / 'store')
+    write_crimes(_with_wards(crimes_frame, 0), root)
+    _assert_matches_rescan(root)
+    write_crimes(_replacement(2), root)
+    _assert_matches_rescan(root)
+    write_crimes(_replacement(3), root)
+    _assert_matches_rescan(root)
+
+
+def test_store_without_rollups_is_counted_before_the_overwrite(crimes_frame, tmp_path):
+    root = str(tmp_path / 'store')
+    write_crimes(_with_wards(crimes_frame, 0), root)
+    # A store written before rollups existed
+    os.remove(os.path.join(root, ROLLUP_FILE))
+    write_crimes(_replacement(2), root)
+    _assert_matches_rescan(root)
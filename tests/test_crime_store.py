@@ -0,0 +1,27 @@
+import numpy as np
+import pyarrow.dataset as ds
+
+from safebristol.crime_features import normalise_crimes
+from safebristol.crime_store import PARTITIONING, read_crimes, write_crimes
+from synthetic import to_records
+
+
+def test_category_codes_are_shared_across_months(crimes_frame, tmp_path):
+    # Written one month at a time, as ingest does. January has no anti-social
+    # behaviour, so normalise_crimes numbers its categories differently from February's.
+    root = str(tmp_path / 'store')
+    records = to_records(crimes_frame)
+    january = normalise_crimes([r for r in records if r['month'] == '2022-01'
+                                and r['category'] != 'anti-social-behaviour'])
+    february = normalise_crimes([r for r in records if r['month'] == '2022-02'])
+    assert january['category'].cat.categories.tolist() != february['category'].cat.categories.tolist()
+    write_crimes(january, root)
+    write_crimes(february, root)
+    assert 'category_code' not in ds.dataset(root, format='parquet', partitioning=PARTITIONING).schema.names
+    df = read_crimes(root)
+    categories = df['category'].cat.categories.tolist()
+    assert categories == sorted(categories)
+    assert (np.asarray(categories)[df['category_code'].to_numpy()] == df['category'].astype(str).to_numpy()).all()
+    codes = read_crimes(root, columns=['lat', 'category_code'])
+    assert codes.columns.tolist() == ['lat', 'category_code']
+    assert (codes['category_code'].to_numpy() == df['category_code'].to_numpy()).all()
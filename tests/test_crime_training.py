@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+from safebristol.crime_model import CrimeModel, save_model
+from safebristol.crime_training import train_model, update_model
+
+FEATURES = ['lat', 'lng', 'month', 'year']
+CATEGORIES = ['bicycle-theft', 'burglary', 'drugs', 'robbery', 'shoplifting']
+
+
+def _frame(n_months=30, rows_per_month=400, categories=CATEGORIES, seed=0):
+    # Category is a function of location, so any model that learns the right labels scores ~1
+    rng = np.random.default_rng(seed)
+    n = n_months * rows_per_month
+    period = 2020 * 12 + np.repeat(np.arange(n_months), rows_per_month)
+    lat = rng.uniform(0, len(categories), n)
+    df = pd.DataFrame({'lat': lat, 'lng': rng.uniform(0, 1, n), 'year': period // 12, 'month': period % 12 + 1,
+                       'category': pd.Categorical(np.asarray(categories)[lat.astype(int)])})
+    return df
+
+
+def _with_codes(df, categories):
+    # category_code as a frame built from `categories` would have it
+    df = df.copy()
+    df['category'] = pd.Categorical(df['category'].astype(object), categories=categories)
+    df['category_code'] = df['category'].cat.codes.astype(np.int16)
+    return df
+
+
+def _train_and_save(df, root):
+    estimator, report = train_model(df, FEATURES, n_folds=1, n_jobs=1, n_estimators=20)
+    save_model(estimator, FEATURES, df['category'].cat.categories, root=root,
+               extra={'classes': report['classes'], 'training': report})
+
+
+def test_update_recodes_rows_by_category_name(tmp_path):
+    history = _frame()
+    _train_and_save(_with_codes(history, CATEGORIES), str(tmp_path))
+    # The newer frame's codes follow a different category order than the saved model's
+    update = update_model(_with_codes(_frame(36), CATEGORIES[::-1]), root=str(tmp_path), extra_trees=20,
+                          random_state=0)
+    assert update['unknown_labels'] == []
+    assert update['candidate']['f1_weighted'] > 0.9
+    assert update['promoted']
+    model = CrimeModel.load(root=str(tmp_path))
+    assert model.version != update['from_version']
+    newest = _frame(36).iloc[-400:]
+    assert (model.predict(newest) == newest['category'].astype(object).to_numpy()).mean() > 0.9
+
+
+def test_update_with_unknown_categories_is_not_promoted(tmp_path):
+    known = CATEGORIES[1:]
+    history = _frame(categories=known)
+    _train_and_save(_with_codes(history, known), str(tmp_path))
+    before = CrimeModel.load(root=str(tmp_path)).version
+    update = update_model(_with_codes(_frame(36), CATEGORIES), root=str(tmp_path), extra_trees=20, random_state=0)
+    assert update['unknown_labels'] == ['bicycle-theft']
+    assert not update['promoted']
+    assert CrimeModel.load(root=str(tmp_path)).version == before
+
+
+def test_update_with_nothing_to_learn_keeps_the_model(tmp_path):
+    _train_and_save(_with_codes(_frame(), CATEGORIES), str(tmp_path))
+    before = CrimeModel.load(root=str(tmp_path)).version
+    # Only categories the model has never seen, then only a holdout month after a failed one
+    unseen = _frame(36, categories=['arson', 'fraud'], seed=1)
+    after_gap = _frame(36)
+    after_gap = after_gap[after_gap['year'] * 12 + after_gap['month'] - 1 == 2020 * 12 + 35]
+    for df in (unseen, after_gap):
+        update = update_model(_with_codes(df, sorted(df['category'].unique())), root=str(tmp_path))
+        assert update['train_rows'] == 0 and not update['promoted']
+        assert CrimeModel.load(root=str(tmp_path)).version == before
+
+
+def test_update_without_a_trained_feature_says_which(tmp_path):
+    _train_and_save(_with_codes(_frame(), CATEGORIES), str(tmp_path))
+    try:
+        update_model(_with_codes(_frame(36), CATEGORIES).drop(columns='lng'), root=str(tmp_path))
+    except ValueError as exc:
+        assert 'lng' in str(exc)
+    else:
+        raise AssertionError('expected a ValueError')
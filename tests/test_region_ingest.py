@@ -0,0 +1,72 @@
+import copy
+
+from safebristol.crime_ingest import GREATER_BRISTOL_POLY, dedupe_crimes, fetch_region_months, parse_poly, \
+    points_in_poly
+import mock_police_api
+from synthetic import to_records
+
+MONTHS = ['2022-01', '2022-02', '2022-03']
+FAST = {'rate': 1e6, 'burst': 1e6, 'backoff': 0.01, 'max_workers': 4, 'max_retries': 1}
+
+
+def _region_ids(records, month):
+    vertices = parse_poly(GREATER_BRISTOL_POLY)
+    inside = points_in_poly([float(r['location']['latitude']) for r in records],
+                            [float(r['location']['longitude']) for r in records], vertices)
+    return {r['id'] for r, keep in zip(records, inside) if keep and r['month'] == month}
+
+
+def _serve(records, max_crimes):
+    api = mock_police_api.MockPoliceAPI(records, max_crimes=max_crimes)
+    httpd, api_url = mock_police_api.serve_in_background(api)
+    return api, httpd, api_url
+
+
+def test_region_splits_tiles_on_503_and_dedupes(crimes_frame, tmp_path):
+    records = to_records(crimes_frame)
+    # The same crime reported at two places (as happens across tile edges) is kept once
+    moved = copy.deepcopy(next(r for r in records if r['month'] == '2022-01'))
+    moved['location']['latitude'] = str(float(moved['location']['latitude']) + 0.03)
+    api, httpd, api_url = _serve(records + [moved], max_crimes=200)
+    try:
+        crimes, failed = fetch_region_months(MONTHS, GREATER_BRISTOL_POLY, api_url=api_url,
+                                             checkpoint_dir=str(tmp_path), **FAST)
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+    assert failed == {}
+    assert api.requests > len(MONTHS) * 4
+    for month in MONTHS:
+        ids = [crime['id'] for crime in crimes[month]]
+        assert len(ids) == len(set(ids))
+        assert set(ids) == _region_ids(records, month)
+    assert (tmp_path / 'tiles').exists()
+
+
+def test_region_resume_reuses_tiles_including_empty_ones(crimes_frame, tmp_path):
+    # The region is far larger than the synthetic city, so many tiles are empty
+    api, httpd, api_url = _serve(to_records(crimes_frame), max_crimes=300)
+    try:
+        first, _ = fetch_region_months(MONTHS, GREATER_BRISTOL_POLY, api_url=api_url,
+                                       checkpoint_dir=str(tmp_path), **FAST)
+        requests_made = api.requests
+        second, failed = fetch_region_months(MONTHS, GREATER_BRISTOL_POLY, api_url=api_url,
+                                             checkpoint_dir=str(tmp_path), **FAST)
+        # Unpublished months are not cached and are asked for again
+        fetch_region_months(['2022-04'], GREATER_BRISTOL_POLY, api_url=api_url, checkpoint_dir=str(tmp_path), **FAST)
+        unpublished = api.requests - requests_made
+        fetch_region_months(['2022-04'], GREATER_BRISTOL_POLY, api_url=api_url, checkpoint_dir=str(tmp_path), **FAST)
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+    assert failed == {}
+    assert {m: sorted(c['id'] for c in crimes) for m, crimes in second.items()} == \
+        {m: sorted(c['id'] for c in crimes) for m, crimes in first.items()}
+    assert unpublished >= 1 and api.requests == requests_made + 2 * unpublished
+
+
+def test_dedupe_prefers_first_copy():
+    a = {'id': 1, 'category': 'burglary'}
+    b = {'id': 1, 'category': 'drugs'}
+    c = {'id': None, 'persistent_id': 'p', 'category': 'robbery'}
+    assert dedupe_crimes([a, b, c, dict(c)]) == [a, c]
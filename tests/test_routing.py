@@ -0,0 +1,83 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from safebristol.routing import RISK_FILE, Router, RiskWeights, StreetGraph, update_risk
+
+# A 700 m High Street and a 1.1 km Back Lane around it between A (1) and B (3);
+# the motorway, the private drive, the detached footpath and the way into a node
+# missing from the extract must not be walkable.
+OSM = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+ <node id="1" lat="51.4500" lon="-2.6000"/>
+ <node id="2" lat="51.4500" lon="-2.5950"/>
+ <node id="3" lat="51.4500" lon="-2.5900"/>
+ <node id="4" lat="51.4520" lon="-2.6000"/>
+ <node id="5" lat="51.4520" lon="-2.5900"/>
+ <node id="6" lat="51.4490" lon="-2.5950"/>
+ <node id="7" lat="51.4600" lon="-2.5800"/>
+ <node id="8" lat="51.4610" lon="-2.5800"/>
+ <way id="10"><nd ref="1"/><nd ref="2"/><nd ref="3"/><tag k="highway" v="residential"/><tag k="name" v="High Street"/></way>
+ <way id="11"><nd ref="1"/><nd ref="4"/><nd ref="5"/><nd ref="3"/><tag k="highway" v="footway"/><tag k="name" v="Back Lane"/></way>
+ <way id="12"><nd ref="1"/><nd ref="6"/><nd ref="3"/><tag k="highway" v="motorway"/></way>
+ <way id="13"><nd ref="4"/><nd ref="2"/><tag k="highway" v="service"/><tag k="access" v="private"/></way>
+ <way id="14"><nd ref="7"/><nd ref="8"/><tag k="highway" v="footway"/></way>
+ <way id="15"><nd ref="3"/><nd ref="999"/><tag k="highway" v="residential"/></way>
+</osm>
+"""
+A, B = (51.4500, -2.6000), (51.4500, -2.5900)
+
+
+def _osm(tmp_path):
+    path = tmp_path / 'streets.osm'
+    path.write_text(OSM)
+    return str(path)
+
+
+def _crimes(n, year=2024, month=1):
+    # n crimes at each High Street segment's midpoint
+    lat = np.full(2 * n, 51.4500)
+    lng = np.repeat([-2.5975, -2.5925], n)
+    return pd.DataFrame({'lat': lat, 'lng': lng, 'year': year, 'month': month,
+                         'street_name': 'On or near High Street'})
+
+
+def test_from_osm_keeps_walkable_connected_streets(tmp_path):
+    graph = StreetGraph.from_osm(_osm(tmp_path))
+    assert len(graph) == 5
+    assert len(graph.seg_u) == 5
+    assert sorted(graph.names[graph.seg_name]) == ['Back Lane'] * 3 + ['High Street'] * 2
+    assert abs(graph.seg_length[graph.names[graph.seg_name] == 'High Street'].sum() - 695) < 10
+
+
+def test_safest_route_avoids_risky_street(tmp_path):
+    graph = StreetGraph.from_osm(_osm(tmp_path))
+    router = Router(graph, RiskWeights.build(graph, _crimes(5)))
+    shortest, safest = router.compare(*A, *B, aversion=1.0)
+    assert shortest['streets'] == ['High Street']
+    assert safest['streets'] == ['Back Lane']
+    assert safest['length_m'] > shortest['length_m']
+    assert safest['crimes_per_month'] == 0 and shortest['crimes_per_month'] == 10
+    # Without any crimes the safest route is the shortest one
+    assert Router(graph, RiskWeights(graph)).route(*A, *B)['streets'] == ['High Street']
+
+
+def test_rewriting_a_month_replaces_its_counts(tmp_path):
+    osm_path, root = _osm(tmp_path), str(tmp_path / 'routing')
+    store_dir = str(tmp_path / 'no_store')
+    weights, updated = update_risk(_crimes(5), root, osm_path, store_dir)
+    first = weights.counts.copy()
+    weights, _ = update_risk(_crimes(5), root, osm_path, store_dir)
+    assert np.allclose(weights.counts, first)
+    assert weights.months_in('all') == 1
+    # A re-fetched month with fewer crimes replaces the old month; another month adds to it
+    weights, _ = update_risk(pd.concat([_crimes(1), _crimes(3, month=2)]), root, osm_path, store_dir)
+    assert weights.counts[0].sum() == 2 * (1 + 3)
+    assert weights.months_in('all') == 2
+    assert np.isclose(weights.rate('all').sum(), 4)
+    os.remove(osm_path)
+    # The saved graph and counts load without the extract
+    router = Router.load(root, osm_path)
+    assert np.allclose(router.weights.counts, weights.counts)
+    assert os.path.exists(os.path.join(root, RISK_FILE))
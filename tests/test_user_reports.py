@@ -0,0 +1,117 @@
+import os
+import json
+import time
+import asyncio
+
+from safebristol.user_reports import WAL_DIR, ReportIngestor, ReportRollup, WriteAheadLog, replay_wal, \
+    wal_segments
+
+REPORT = {'lat': 51.4545, 'lng': -2.5879, 'category': 'poor-lighting'}
+
+
+def _line(i):
+    return (json.dumps({**REPORT, 'id': str(i), 'time': '2025-07-01T12:00:00+00:00'}) + '\n').encode()
+
+
+def test_wal_recovers_from_a_torn_write(tmp_path):
+    wal_dir = str(tmp_path / WAL_DIR)
+    wal = WriteAheadLog(wal_dir)
+    wal.append(_line(1) + _line(2))
+    wal.close()
+    # A crash mid-write leaves half a record at the end of the segment
+    path = os.path.join(wal_dir, f'{wal_segments(wal_dir)[-1]:08d}.jsonl')
+    with open(path, 'ab') as f:
+        f.write(_line(3)[:20])
+    wal = WriteAheadLog(wal_dir)
+    wal.append(_line(4))
+    wal.close()
+    assert [r['id'] for r in replay_wal(wal_dir)] == ['1', '2', '4']
+    assert sum(ReportRollup.load(str(tmp_path)).counts.values()) == 3
+
+
+def test_replay_skips_undecodable_lines(tmp_path):
+    wal_dir = str(tmp_path / WAL_DIR)
+    os.makedirs(wal_dir)
+    with open(os.path.join(wal_dir, f'{0:08d}.jsonl'), 'wb') as f:
+        f.write(_line(1) + b'{"lat": 51.4\n' + _line(2))
+    assert [r['id'] for r in replay_wal(wal_dir)] == ['1', '2']
+
+
+async def _post(port, body):
+    reader, writer = await asyncio.open_connection('localhost', port)
+    writer.write(f'POST /reports HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n'
+                 f'Connection: close\r\n\r\n'.encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, _ = response.partition(b'\r\n\r\n')
+    return head.decode('latin-1').split('\r\n')
+
+
+def test_full_queue_answers_503_with_retry_after(tmp_path):
+    ingestor = ReportIngestor(str(tmp_path), max_pending=1, flush_interval=0)
+    append = ingestor.wal.append
+
+    def slow_append(data):
+        time.sleep(0.2)
+        return append(data)
+
+    ingestor.wal.append = slow_append
+
+    async def run():
+        ready = asyncio.get_running_loop().create_future()
+        server = asyncio.create_task(ingestor.serve('localhost', 0, ready))
+        _, port = await ready
+        heads = await asyncio.gather(*[_post(port, json.dumps(REPORT).encode()) for _ in range(6)])
+        server.cancel()
+        try:
+            await server
+        except asyncio.CancelledError:
+            pass
+        return heads
+
+    heads = asyncio.run(run())
+    statuses = [head[0].split()[1] for head in heads]
+    assert '202' in statuses and '503' in statuses
+    assert all('Retry-After: 1' in head for head in heads if head[0].split()[1] == '503')
+    # Accepted reports are in the rollup saved on shutdown; rejected ones are not
+    assert sum(ReportRollup.load(str(tmp_path)).counts.values()) == statuses.count('202')
+
+
+def _clean_restart(root):
+    # Start the ingestor and shut it down again, as serve() does on Ctrl-C
+    ingestor = ReportIngestor(root)
+
+    async def run():
+        ready = asyncio.get_running_loop().create_future()
+        server = asyncio.create_task(ingestor.serve('localhost', 0, ready))
+        await ready
+        server.cancel()
+        try:
+            await server
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run())
+
+
+def test_restarts_do_not_count_replayed_reports_again(tmp_path):
+    root = str(tmp_path)
+    _clean_restart(root)
+    # A batch committed to the WAL, then a crash before the next snapshot
+    wal = WriteAheadLog(os.path.join(root, WAL_DIR))
+    wal.append(_line(1))
+    wal.close()
+    for _ in range(2):
+        _clean_restart(root)
+        assert sum(ReportRollup.load(root).counts.values()) == 1
+
+
+def test_rollup_rejects_bad_parameters(tmp_path):
+    ingestor = ReportIngestor(str(tmp_path))
+    assert ingestor.handle_rollup({'level': 'x'})[0] == 400
+    assert ingestor.handle_rollup({'month': '7.5'})[0] == 400
+    assert ingestor.handle_rollup({'level': '30'})[0] == 400
+    status, payload = ingestor.handle_rollup({'level': '15', 'year': '2025'})
+    assert status == 200 and payload == {'cells': []}
+    ingestor.wal.close()